@@ -5,10 +5,11 @@ from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from app.core.auth import get_current_user
+from app.core.executor import blocking_endpoint
 from app.models.user import CurrentUser
 from app.models.response import StandardResponse
 from app.db.supabase_client import get_supabase
-from app.services.classification.classifier import classify_project, ClassificationResult
+from app.services.classification.classifier import classify_project, items_to_dicts
 from app.services.classification.review_service import populate_review_queue, get_review_summary
 from app.services.classification.review_applier import apply_review_decisions
 
@@ -22,7 +23,8 @@ class ClassifyRequest(BaseModel):
 
 
 @router.post("/{project_id}/apply-reviews", response_model=StandardResponse[dict])
-async def apply_project_reviews(
+@blocking_endpoint
+def apply_project_reviews(
     project_id: str,
     current_user: CurrentUser = Depends(get_current_user),
 ):
@@ -36,7 +38,8 @@ async def apply_project_reviews(
 
 
 @router.post("/{project_id}/classify", response_model=StandardResponse[dict])
-async def classify_cma_project(
+@blocking_endpoint
+def classify_cma_project(
     project_id: str,
     payload: Optional[ClassifyRequest] = None,
     current_user: CurrentUser = Depends(get_current_user),
@@ -100,12 +103,16 @@ async def classify_cma_project(
     classification_data = {
         "classified_at": datetime.now().isoformat() + "Z",
         "total_items": class_res.total_items,
-        "items": [item.model_dump() for item in class_res.items],
+        "items": items_to_dicts(class_res.items),
         "summary": {
             "by_precedent": class_res.classified_by_precedent,
             "by_rule": class_res.classified_by_rule,
             "by_ai": class_res.classified_by_ai,
+            "by_vector": class_res.classified_by_vector,
+            "by_memo": class_res.classified_by_memo,
             "uncertain": class_res.unclassified,
+            "unique_items": class_res.unique_items,
+            "dedupe_ratio": class_res.dedupe_ratio,
         },
     }
 
@@ -137,23 +144,30 @@ async def classify_cma_project(
         "auto_classified": class_res.auto_classified,
         "needs_review": class_res.needs_review,
         "unclassified": class_res.unclassified,
+        "unique_items": class_res.unique_items,
+        "dedupe_ratio": class_res.dedupe_ratio,
         "accuracy_estimate": acc_est,
         "classification_breakdown": {
             "by_precedent": class_res.classified_by_precedent,
             "by_rule": class_res.classified_by_rule,
             "by_ai": class_res.classified_by_ai,
+            "by_vector": class_res.classified_by_vector,
+            "by_memo": class_res.classified_by_memo,
             "uncertain": class_res.unclassified,
         },
         "review_queue_items": items_to_review,
         "llm_cost_usd": class_res.llm_cost_usd,
         "llm_tokens_used": class_res.llm_tokens_used,
+        "escalated_items": class_res.escalated_items,
+        "escalation_cost_usd": class_res.escalation_cost_usd,
         "duration_ms": duration_ms,
         "project_status": final_status,
     })
 
 
 @router.get("/{project_id}/classification", response_model=StandardResponse[dict])
-async def get_project_classification(
+@blocking_endpoint
+def get_project_classification(
     project_id: str,
     current_user: CurrentUser = Depends(get_current_user),
 ):
@@ -3,13 +3,11 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
 from app.core.auth import get_current_user
+from app.core.executor import blocking_endpoint
 from app.models.user import CurrentUser
 from app.models.response import StandardResponse
 from app.db.supabase_client import get_supabase
-from app.services.extraction.excel_parser import parse_excel
-from app.services.extraction.pdf_parser import parse_pdf, is_digital_pdf
-from app.services.extraction.vision_extractor import extract_with_vision
-from app.services.extraction.merger import merge_and_save_data
+from app.services.extraction.extractor import extract_files
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +20,8 @@ class ExtractRequest(BaseModel):
 
 
 @router.post("/{project_id}/extract", response_model=StandardResponse[dict])
-async def extract_project_files(
+@blocking_endpoint
+def extract_project_files(
     project_id: str,
     payload: Optional[ExtractRequest] = None,
     current_user: CurrentUser = Depends(get_current_user),
@@ -87,102 +86,25 @@ async def extract_project_files(
     except Exception:
         logger.warning("Failed to write audit log for extraction trigger")
 
-    files_succeeded = 0
-    files_failed = 0
-    total_items = 0
-    results: List[dict] = []
-
-    for f in files:
-        file_id = f["id"]
-        file_name = f.get("file_name", "unknown")
-
-        db.table("uploaded_files").update({"extraction_status": "processing"}).eq("id", file_id).execute()
-
-        try:
-            storage_path = f["storage_path"]
-            storage_res = db.storage.from_("cma-files").download(storage_path)
-            file_bytes = storage_res
-
-            ext = f["file_type"]
-            extracted_data = None
-
-            if ext in ["xlsx", "xls"]:
-                extracted_data = parse_excel(file_bytes, file_name)
-            elif ext == "csv":
-                extracted_data = parse_excel(file_bytes, file_name, is_csv=True)
-            elif ext == "pdf":
-                if is_digital_pdf(file_bytes):
-                    extracted_data = parse_pdf(file_bytes, file_name)
-                else:
-                    extracted_data = extract_with_vision(
-                        file_bytes, file_name, "application/pdf",
-                        str(current_user.firm_id), project_id,
-                        f.get("document_type", "auto-detect"),
-                    )
-            elif ext in ["jpg", "png"]:
-                mime = "image/jpeg" if ext == "jpg" else "image/png"
-                extracted_data = extract_with_vision(
-                    file_bytes, file_name, mime,
-                    str(current_user.firm_id), project_id,
-                    f.get("document_type", "auto-detect"),
-                )
-            else:
-                raise ValueError(f"Unsupported file type: {ext}")
-
-            # Store lightweight metadata on file row, not the full payload
-            items_count = len(extracted_data.get("line_items", []))
-            db.table("uploaded_files").update({
-                "extraction_status": "completed",
-                "extracted_data": extracted_data,
-            }).eq("id", file_id).execute()
-
-            total_items += items_count
-            files_succeeded += 1
-
-            results.append({
-                "file_id": file_id,
-                "file_name": file_name,
-                "status": "completed",
-                "line_items_count": items_count,
-                "document_type": extracted_data.get("document_type", "other"),
-            })
-
-        except Exception as e:
-            logger.error("Extraction failed for file %s: %s", file_name, e)
-            files_failed += 1
-            db.table("uploaded_files").update({
-                "extraction_status": "failed",
-                "extracted_data": {"error": str(e)},
-            }).eq("id", file_id).execute()
-
-            results.append({
-                "file_id": file_id,
-                "file_name": file_name,
-                "status": "failed",
-                "error": str(e),
-            })
-
-    # 4. Merge or mark error
-    if files_succeeded > 0:
-        try:
-            merge_and_save_data(project_id, str(current_user.firm_id))
-        except Exception as e:
-            logger.error("Merge failed for project %s: %s", project_id, e)
-            db.table("cma_projects").update({
-                "status": "error",
-                "error_message": f"Extraction succeeded but merge failed: {e}",
-            }).eq("id", project_id).execute()
-    else:
+    result = extract_files(project_id, str(current_user.firm_id), files)
+
+    # 4. Mark error if nothing usable came out
+    if result.files_succeeded == 0:
         db.table("cma_projects").update({
             "status": "error",
             "error_message": "All files failed to extract.",
         }).eq("id", project_id).execute()
+    elif result.merge_error:
+        db.table("cma_projects").update({
+            "status": "error",
+            "error_message": f"Extraction succeeded but merge failed: {result.merge_error}",
+        }).eq("id", project_id).execute()
 
     return StandardResponse(data={
         "project_id": project_id,
-        "files_processed": len(files),
-        "files_succeeded": files_succeeded,
-        "files_failed": files_failed,
-        "total_line_items_extracted": total_items,
-        "results": results,
+        "files_processed": result.files_processed,
+        "files_succeeded": result.files_succeeded,
+        "files_failed": result.files_failed,
+        "total_line_items_extracted": result.total_line_items,
+        "results": result.results,
     })
@@ -1,30 +1,72 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, Request, UploadFile, File, Form
-from typing import Optional
+import os
+from datetime import date
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from app.core.auth import get_current_user
+from app.core.executor import blocking_endpoint, run_blocking
 from app.core.security import limiter, sanitize_filename
 from app.models.user import CurrentUser
 from app.models.file import FileResponse, FileListResponse, GeneratedFileResponse, GeneratedFileListResponse
 from app.models.response import StandardResponse
 from app.db.supabase_client import get_supabase
-from app.services.storage import upload_file, get_signed_url
+from app.services import storage_cache
+from app.services.export import latest_generated_files, stream_zip
+from app.services.storage import (
+    MULTIPART_OVERHEAD, ReceivedUpload, UnsupportedFileType, UploadTooLarge,
+    file_extension, receive_upload, upload_file, get_signed_url,
+)
 
 router = APIRouter()
 
 ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'pdf', 'jpg', 'png', 'csv'}
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# Uploads are parsed off the request stream into one temp file and cut off once they pass the limit
+MAX_FILE_SIZE = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+# What the dedup check needs: FileResponse's fields plus the owning project
+DUPLICATE_COLUMNS = (
+    "id, cma_project_id, file_name, file_type, file_size, document_type, "
+    "extraction_status, storage_path, content_hash, uploaded_by, created_at"
+)
 
 @router.post("/projects/{project_id}/files", response_model=StandardResponse[FileResponse], status_code=201)
 @limiter.limit("20/hour")
 async def upload_project_file(
     request: Request,
     project_id: str,
-    file: UploadFile = File(...),
-    document_type: Optional[str] = Form(None),
     current_user: CurrentUser = Depends(get_current_user)
 ):
+    """Multipart upload: a `file` part plus an optional `document_type` field.
+
+    The body is parsed here rather than by FastAPI, so the size limit is
+    enforced while the file arrives and it is written to disk only once.
+    """
+    too_large = HTTPException(status_code=413, detail=f"File size exceeds {MAX_FILE_SIZE // (1024 * 1024)}MB limit")
+
+    # Refuse oversized uploads before reading any of the body
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_FILE_SIZE + MULTIPART_OVERHEAD:
+        raise too_large
+
+    await run_blocking(_check_project, project_id, current_user)
+
+    try:
+        upload = await receive_upload(request, MAX_FILE_SIZE, allowed_extensions=ALLOWED_EXTENSIONS)
+    except UploadTooLarge:
+        raise too_large
+    except UnsupportedFileType as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid upload: {e}")
+
+    try:
+        return await run_blocking(_store_upload, project_id, upload, current_user)
+    finally:
+        if os.path.exists(upload.path):
+            os.unlink(upload.path)
+
+
+def _check_project(project_id: str, current_user: CurrentUser) -> None:
     db = get_supabase()
-    
-    # Validate project
     proj_resp = db.table("cma_projects").select("id, status").eq("id", project_id).eq("firm_id", str(current_user.firm_id)).execute()
     if not proj_resp.data:
         raise HTTPException(status_code=404, detail="Project not found")
@@ -33,30 +75,55 @@ async def upload_project_file(
     if project["status"] not in ["draft", "extracting", "error"]:
         raise HTTPException(status_code=409, detail=f"Cannot upload files to project in '{project['status']}' status")
 
-    # Sanitize filename to prevent path traversal
-    safe_name = sanitize_filename(file.filename or "upload")
 
-    # Validate file extension
-    ext = safe_name.split(".")[-1].lower() if "." in safe_name else ""
-    if ext not in ALLOWED_EXTENSIONS:
-        raise HTTPException(status_code=422, detail=f"File type '.{ext}' not supported. Allowed: {', '.join(ALLOWED_EXTENSIONS)}")
-        
-    # Read file bytes and validate size
-    file_bytes = await file.read()
-    if len(file_bytes) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail="File size exceeds 10MB limit")
-        
-    # Upload to storage using the storage service
-    try:
-        storage_path = upload_file(
-            firm_id=str(current_user.firm_id),
-            project_id=project_id,
-            file_name=safe_name,
-            file_bytes=file_bytes,
-            content_type=file.content_type,
+def _store_upload(project_id: str, upload: ReceivedUpload, current_user: CurrentUser):
+    db = get_supabase()
+    document_type = upload.fields.get("document_type") or None
+
+    # Sanitize filename to prevent path traversal; the extension was checked by receive_upload
+    safe_name = sanitize_filename(upload.filename or "upload")
+    ext = file_extension(upload.filename)
+
+    content_hash = upload.content_hash
+
+    # Same bytes already uploaded by this firm? Reuse the stored object instead of storing another copy.
+    # Storage objects are never removed while any uploaded_files row references them.
+    def find_duplicate(in_project: bool) -> Optional[dict]:
+        query = (
+            db.table("uploaded_files")
+            .select(DUPLICATE_COLUMNS)
+            .eq("firm_id", str(current_user.firm_id))
+            .eq("content_hash", content_hash)
+            .neq("extraction_status", "deleted")
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to upload to storage: {str(e)}")
+        if in_project:
+            query = query.eq("cma_project_id", project_id)
+        rows = query.limit(1).execute().data
+        return rows[0] if rows else None
+
+    duplicate = find_duplicate(in_project=False)
+    # Re-uploading a file the project already has is a no-op
+    same_project = duplicate if duplicate and duplicate["cma_project_id"] == project_id else None
+    if duplicate and not same_project:
+        same_project = find_duplicate(in_project=True)
+    if same_project:
+        return StandardResponse(data=FileResponse(**same_project))
+
+    if duplicate:
+        storage_path = duplicate["storage_path"]
+    else:
+        try:
+            storage_path = upload_file(
+                firm_id=str(current_user.firm_id),
+                project_id=project_id,
+                file_name=safe_name,
+                content_type=upload.content_type,
+                file_path=upload.path,
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to upload to storage: {str(e)}")
+    # The received file becomes the extractor's local copy (a rename, not another copy)
+    storage_cache.adopt(storage_path, content_hash, upload.path)
 
     # Insert metadata
     file_record = {
@@ -64,7 +131,8 @@ async def upload_project_file(
         "cma_project_id": project_id,
         "file_name": safe_name,
         "file_type": ext,
-        "file_size": len(file_bytes),
+        "file_size": upload.size,
+        "content_hash": content_hash,
         "storage_path": storage_path,
         "document_type": document_type,
         "extraction_status": "pending",
@@ -84,7 +152,7 @@ async def upload_project_file(
         "action": "upload_file",
         "entity_type": "uploaded_file",
         "entity_id": inserted_file["id"],
-        "metadata": {"file_name": safe_name, "project_id": project_id}
+        "metadata": {"file_name": safe_name, "project_id": project_id, "deduplicated": duplicate is not None}
     }).execute()
     
     return StandardResponse(data=FileResponse(**inserted_file))
@@ -134,6 +202,33 @@ def list_generated_files(project_id: str, current_user: CurrentUser = Depends(ge
     files = res.data
     return StandardResponse(data=GeneratedFileListResponse(items=[GeneratedFileResponse(**f) for f in files]))
 
+@router.get("/generated/export")
+@blocking_endpoint
+def export_generated_files(
+    project_ids: Optional[List[str]] = Query(None),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """Stream a ZIP of the latest generated CMA of each project (all of the firm's, or *project_ids*)."""
+    files = latest_generated_files(str(current_user.firm_id), project_ids)
+    if not files:
+        raise HTTPException(status_code=404, detail="No generated files to export")
+
+    db = get_supabase()
+    db.table("audit_log").insert({
+        "firm_id": str(current_user.firm_id),
+        "user_id": str(current_user.id),
+        "action": "export_generated_files",
+        "entity_type": "generated_file",
+        "metadata": {"project_ids": [f["cma_project_id"] for f in files], "file_count": len(files)},
+    }).execute()
+
+    file_name = f"CMA_export_{date.today():%Y%m%d}.zip"
+    return StreamingResponse(
+        stream_zip(files),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
+
 @router.get("/generated/{file_id}/download", response_model=StandardResponse[dict])
 def download_generated_file(file_id: str, current_user: CurrentUser = Depends(get_current_user)):
     db = get_supabase()
@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 from app.core.auth import get_current_user
+from app.core.executor import blocking_endpoint
 from app.models.user import CurrentUser
 from app.models.response import StandardResponse
 from app.db.supabase_client import get_supabase
@@ -19,7 +20,8 @@ class GenerateRequest(BaseModel):
 
 
 @router.post("/{project_id}/validate", response_model=StandardResponse[dict])
-async def validate_cma_project(
+@blocking_endpoint
+def validate_cma_project(
     project_id: str,
     current_user: CurrentUser = Depends(get_current_user),
 ):
@@ -79,7 +81,8 @@ async def validate_cma_project(
 
 
 @router.post("/{project_id}/generate", response_model=StandardResponse[dict])
-async def generate_cma_file(
+@blocking_endpoint
+def generate_cma_file(
     project_id: str,
     req: Optional[GenerateRequest] = None,
     current_user: CurrentUser = Depends(get_current_user),
@@ -138,6 +141,7 @@ async def generate_cma_file(
             "metadata": {
                 "file_name": gen_res.file_name,
                 "version": gen_res.version,
+                "reused": gen_res.reused,
                 "generation_time_ms": gen_res.generation_time_ms,
             },
         }).execute()
@@ -150,6 +154,7 @@ async def generate_cma_file(
         "file_name": gen_res.file_name,
         "file_size": gen_res.file_size,
         "version": gen_res.version,
+        "reused": gen_res.reused,
         "download_url": download_url,
         "validation_passed": gen_res.validation.passed if gen_res.validation else True,
         "generation_time_ms": gen_res.generation_time_ms,
@@ -5,10 +5,23 @@ from app.core.auth import get_current_user
 from app.models.user import CurrentUser
 from app.models.response import StandardResponse
 from app.db.supabase_client import get_supabase
+from app.services.classification import memo, vector_matcher
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/precedents")
 
+
+def _invalidate_memo(firm_id: Optional[str], source_term: Optional[str], precedent_id: Optional[str] = None) -> None:
+    if not source_term and not precedent_id:
+        return
+    try:
+        memo.invalidate_term(firm_id, source_term or "", precedent_id)
+    except Exception as e:
+        logger.warning("Failed to invalidate classification memo for '%s': %s", source_term, e)
+
 class PrecedentUpdate(BaseModel):
     target_row: Optional[int] = None
     target_sheet: Optional[str] = None
@@ -71,7 +84,7 @@ def get_precedent(prec_id: str, current_user: CurrentUser = Depends(get_current_
 def update_precedent(prec_id: str, payload: PrecedentUpdate, current_user: CurrentUser = Depends(get_current_user)):
     db = get_supabase()
     
-    res = db.table("classification_precedents").select("id").eq("id", prec_id).eq("firm_id", str(current_user.firm_id)).eq("is_active", True).execute()
+    res = db.table("classification_precedents").select("id, source_term").eq("id", prec_id).eq("firm_id", str(current_user.firm_id)).eq("is_active", True).execute()
     if not res.data:
         raise HTTPException(status_code=404, detail="Precedent not found")
         
@@ -83,6 +96,8 @@ def update_precedent(prec_id: str, payload: PrecedentUpdate, current_user: Curre
         raise HTTPException(status_code=400, detail="Nothing to update")
         
     up_res = db.table("classification_precedents").update(update_data).eq("id", prec_id).execute()
+    vector_matcher.invalidate(str(current_user.firm_id))
+    _invalidate_memo(str(current_user.firm_id), res.data[0].get("source_term"), prec_id)
     
     # Audit log simulation
     # db.table("audit_log").insert({"action": "update_precedent", "user_id": ..., "details": ...}).execute()
@@ -94,7 +109,7 @@ def update_precedent(prec_id: str, payload: PrecedentUpdate, current_user: Curre
 def delete_precedent(prec_id: str, current_user: CurrentUser = Depends(get_current_user)):
     db = get_supabase()
     
-    res = db.table("classification_precedents").select("id").eq("id", prec_id).eq("firm_id", str(current_user.firm_id)).eq("is_active", True).execute()
+    res = db.table("classification_precedents").select("id, source_term").eq("id", prec_id).eq("firm_id", str(current_user.firm_id)).eq("is_active", True).execute()
     if not res.data:
         raise HTTPException(status_code=404, detail="Precedent not found")
         
@@ -105,6 +120,9 @@ def delete_precedent(prec_id: str, current_user: CurrentUser = Depends(get_curre
         # DB schema might not have is_active, hard delete
         db.table("classification_precedents").delete().eq("id", prec_id).execute()
     
+    vector_matcher.invalidate(str(current_user.firm_id))
+    _invalidate_memo(str(current_user.firm_id), res.data[0].get("source_term"), prec_id)
+
     return StandardResponse(data={"deleted": True, "id": prec_id})
 
 @router.post("/promote", response_model=StandardResponse[dict])
@@ -113,10 +131,14 @@ def promote_precedent(payload: PromotePrecedent, current_user: CurrentUser = Dep
         raise HTTPException(status_code=403, detail="Only owners can promote precedents to global scope")
         
     db = get_supabase()
-    res = db.table("classification_precedents").select("id").eq("id", payload.precedent_id).eq("firm_id", str(current_user.firm_id)).execute()
+    res = db.table("classification_precedents").select("id, source_term").eq("id", payload.precedent_id).eq("firm_id", str(current_user.firm_id)).execute()
     if not res.data:
         raise HTTPException(status_code=404, detail="Precedent not found")
         
     up_res = db.table("classification_precedents").update({"scope": "global", "firm_id": None}).eq("id", payload.precedent_id).execute()
+
+    # Global precedents feed every firm's index
+    vector_matcher.invalidate()
+    _invalidate_memo(None, res.data[0].get("source_term"), payload.precedent_id)
     
     return StandardResponse(data={"promoted": True, "id": payload.precedent_id})
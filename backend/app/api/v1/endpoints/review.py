@@ -1,14 +1,19 @@
+import base64
+import json
 import logging
+import uuid
 from datetime import datetime
 from typing import Optional, List
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from app.core.auth import get_current_user
+from app.core.executor import blocking_endpoint
 from app.models.user import CurrentUser
 from app.models.response import StandardResponse
 from app.db.supabase_client import get_supabase
 from app.services.classification.rules_loader import get_all_rules
 from app.services.classification.precedent_matcher import create_precedent
+from app.services.classification.memo import record_review
 
 logger = logging.getLogger(__name__)
 
@@ -35,21 +40,89 @@ class ApproveAllRequest(BaseModel):
     min_confidence: float = 0.50
 
 
+REVIEW_STATUSES = ("pending", "resolved", "skipped")
+
+
+def _encode_cursor(sort_value, item_id: str) -> str:
+    raw = json.dumps([sort_value, item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort_col: Optional[str] = None) -> tuple:
+    """(sort value, item id) from a cursor, or 422.
+
+    Both parts end up in a PostgREST filter string, so the id must be a UUID and
+    the sort value a number or NULL (confidence) or an ISO timestamp (created_at).
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, item_id = json.loads(base64.urlsafe_b64decode(padded))
+        item_id = str(uuid.UUID(str(item_id)))
+        if isinstance(sort_value, str):
+            datetime.fromisoformat(sort_value.replace("Z", "+00:00"))
+            expected = "created_at"
+        elif sort_value is None or (isinstance(sort_value, (int, float)) and not isinstance(sort_value, bool)):
+            expected = "confidence"
+        else:
+            raise ValueError("unsupported sort value")
+    except Exception:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    if sort_col is not None and sort_col != expected:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    return sort_value, item_id
+
+
+def _seek_filter(sort_col: str, sort_value, last_id: str) -> str:
+    """or_() filter for rows after (sort_value, last_id) in the listing order."""
+    if sort_col == "created_at":
+        return f'created_at.lt."{sort_value}",and(created_at.eq."{sort_value}",id.lt.{last_id})'
+    # confidence ASC sorts NULLs last: they follow every number, and among themselves go by id
+    if sort_value is None:
+        return f"and(confidence.is.null,id.gt.{last_id})"
+    return f"confidence.gt.{sort_value!r},and(confidence.eq.{sort_value!r},id.gt.{last_id}),confidence.is.null"
+
+
+def _status_counts(db, firm_id: str, project_id: Optional[str]) -> dict:
+    """Per-status counts from a grouped aggregate instead of scanning every row."""
+    summary = {s: 0 for s in REVIEW_STATUSES}
+    try:
+        res = db.rpc("review_queue_status_counts", {"p_firm_id": firm_id, "p_project_id": project_id}).execute()
+        for row in res.data or []:
+            if row.get("status") in summary:
+                summary[row["status"]] = int(row.get("count") or 0)
+        return summary
+    except Exception as e:
+        # Migration 012 not applied yet — fall back to one head count per status
+        logger.warning("review_queue_status_counts RPC unavailable, using per-status counts: %s", e)
+
+    for s in REVIEW_STATUSES:
+        q = db.table("review_queue").select("id", count="exact").eq("firm_id", firm_id).eq("status", s)
+        if project_id:
+            q = q.eq("cma_project_id", project_id)
+        res = q.limit(1).execute()
+        summary[s] = res.count or 0
+    return summary
+
+
 @router.get("", response_model=StandardResponse[dict])
-async def list_review_queue(
+@blocking_endpoint
+def list_review_queue(
     status: str = Query("pending", description="pending, resolved, skipped, or all"),
     project_id: Optional[str] = None,
     sort_by: str = Query("confidence", description="confidence or created_at"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
     current_user: CurrentUser = Depends(get_current_user),
 ):
     db = get_supabase()
+    firm_id = str(current_user.firm_id)
 
+    # Client names are embedded in the same request instead of a follow-up lookup
     query = (
         db.table("review_queue")
-        .select("*, cma_projects!inner(client_id)", count="exact")
-        .eq("firm_id", str(current_user.firm_id))
+        .select("*, cma_projects!inner(client_id, clients(name))")
+        .eq("firm_id", firm_id)
     )
 
     if status != "all":
@@ -57,61 +130,51 @@ async def list_review_queue(
     if project_id:
         query = query.eq("cma_project_id", project_id)
 
-    if sort_by == "confidence":
-        query = query.order("confidence", desc=False)
-    else:
-        query = query.order("created_at", desc=True)
+    # Keyset pagination: (confidence ASC, id ASC) or (created_at DESC, id DESC)
+    sort_col = "confidence" if sort_by == "confidence" else "created_at"
+    descending = sort_col == "created_at"
 
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page - 1
+    if cursor:
+        sort_value, last_id = _decode_cursor(cursor, sort_col)
+        query = query.or_(_seek_filter(sort_col, sort_value, last_id))
 
-    res = query.range(start_idx, end_idx).execute()
+    query = query.order(sort_col, desc=descending, nullsfirst=False).order("id", desc=descending)
 
-    items = res.data
-    total = res.count if res.count is not None else len(items)
+    if cursor or page == 1:
+        res = query.limit(per_page + 1).execute()
+    else:
+        # Legacy offset paging for clients that have not moved to cursors yet
+        start_idx = (page - 1) * per_page
+        res = query.range(start_idx, start_idx + per_page).execute()
 
-    # Compute summary
-    summary_query = (
-        db.table("review_queue")
-        .select("status", count="exact")
-        .eq("firm_id", str(current_user.firm_id))
-    )
-    if project_id:
-        summary_query = summary_query.eq("cma_project_id", project_id)
-
-    all_res = summary_query.execute()
-
-    summary = {"pending": 0, "resolved": 0, "skipped": 0}
-    for row in all_res.data:
-        s = row.get("status")
-        if s in summary:
-            summary[s] += 1
-
-    # Resolve project/client names
-    proj_ids = list(set([item["cma_project_id"] for item in items]))
-    projects_info = {}
-    if proj_ids:
-        p_res = db.table("cma_projects").select("id, client_id, clients(name)").in_("id", proj_ids).execute()
-        for p in p_res.data:
-            projects_info[p["id"]] = {
-                "client_name": p.get("clients", {}).get("name", "Unknown") if p.get("clients") else "Unknown",
-            }
+    rows = res.data or []
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page and items:
+        last = items[-1]
+        next_cursor = _encode_cursor(last.get(sort_col), last["id"])
+
+    summary = _status_counts(db, firm_id, project_id)
+    total = sum(summary.values()) if status == "all" else summary.get(status, 0)
 
     for item in items:
+        client = (item.get("cma_projects") or {}).get("clients") or {}
         item["project_name"] = "Project Data"
-        item["client_name"] = projects_info.get(item["cma_project_id"], {}).get("client_name", "Unknown")
+        item["client_name"] = client.get("name", "Unknown")
 
     return StandardResponse(data={
         "items": items,
         "total": total,
         "page": page,
         "per_page": per_page,
+        "next_cursor": next_cursor,
         "summary": summary,
     })
 
 
 @router.get("/{item_id}", response_model=StandardResponse[dict])
-async def get_review_item(
+@blocking_endpoint
+def get_review_item(
     item_id: str,
     current_user: CurrentUser = Depends(get_current_user),
 ):
@@ -141,11 +204,16 @@ async def get_review_item(
 
 
 @router.post("/{item_id}/resolve", response_model=StandardResponse[dict])
-async def resolve_review_item(
+@blocking_endpoint
+def resolve_review_item(
     item_id: str,
     payload: ResolveAction,
     current_user: CurrentUser = Depends(get_current_user),
 ):
+    return _resolve(item_id, payload, current_user)
+
+
+def _resolve(item_id: str, payload: ResolveAction, current_user: CurrentUser) -> StandardResponse:
     db = get_supabase()
     res = (
         db.table("review_queue")
@@ -201,6 +269,14 @@ async def resolve_review_item(
         except Exception as e:
             logger.error("Failed to create precedent for item %s: %s", item_id, e)
 
+        try:
+            record_review(
+                str(current_user.firm_id), entity_type, item["source_item_name"],
+                resolved_row, resolved_sheet, item.get("suggested_label") if payload.action == "approve" else None,
+            )
+        except Exception as e:
+            logger.warning("Failed to record classification memo for item %s: %s", item_id, e)
+
     status_val = "resolved" if payload.action in ["approve", "correct"] else "skipped"
 
     update_payload = {
@@ -236,10 +312,15 @@ async def resolve_review_item(
 
 
 @router.post("/bulk-resolve", response_model=StandardResponse[dict])
-async def bulk_resolve(
+@blocking_endpoint
+def bulk_resolve(
     payload: BulkResolveAction,
     current_user: CurrentUser = Depends(get_current_user),
 ):
+    return _bulk_resolve(payload, current_user)
+
+
+def _bulk_resolve(payload: BulkResolveAction, current_user: CurrentUser) -> StandardResponse:
     resolved = 0
     skipped = 0
     prec_created = 0
@@ -247,7 +328,7 @@ async def bulk_resolve(
 
     for r in payload.resolutions:
         try:
-            res = await resolve_review_item(
+            res = _resolve(
                 r.id,
                 ResolveAction(action=r.action, target_row=r.target_row, target_sheet=r.target_sheet, notes=r.notes),
                 current_user,
@@ -271,7 +352,8 @@ async def bulk_resolve(
 
 
 @router.post("/approve-all", response_model=StandardResponse[dict])
-async def approve_all(
+@blocking_endpoint
+def approve_all(
     payload: ApproveAllRequest,
     current_user: CurrentUser = Depends(get_current_user),
 ):
@@ -295,12 +377,13 @@ async def approve_all(
             target_sheet=row["suggested_sheet"],
         ))
 
-    bulk_res = await bulk_resolve(BulkResolveAction(resolutions=resolutions), current_user)
+    bulk_res = _bulk_resolve(BulkResolveAction(resolutions=resolutions), current_user)
     return bulk_res
 
 
 @router.get("/config/cma-rows", response_model=StandardResponse[dict])
-async def get_cma_rows(
+@blocking_endpoint
+def get_cma_rows(
     entity_type: Optional[str] = None,
     current_user: CurrentUser = Depends(get_current_user),
 ):
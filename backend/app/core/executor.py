@@ -0,0 +1,121 @@
+"""
+Bounded, instrumented executor for blocking work called from async code.
+
+supabase-py, Gemini, openpyxl and pdfplumber are all synchronous. Async
+endpoints hand such work to this pool via run_blocking (or declare the whole
+handler with @blocking_endpoint) so the event loop keeps serving other
+requests. The pool size caps how many blocking calls run at once per worker;
+queue wait and run time are tracked and slow waits are logged, so saturation
+shows up in /health and the logs rather than as unexplained latency.
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+logger = logging.getLogger(__name__)
+
+BLOCKING_EXECUTOR_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", "32"))
+
+# Calls that wait this long for a free worker are logged — the pool is saturated
+QUEUE_WAIT_WARN_MS = 250
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_WORKERS, thread_name_prefix="blocking")
+_stats_lock = threading.Lock()
+_stats: Dict[str, float] = {
+    "submitted": 0,
+    "in_flight": 0,
+    "running": 0,
+    "completed": 0,
+    "failed": 0,
+    "cancelled": 0,
+    "max_queue_wait_ms": 0.0,
+    "total_queue_wait_ms": 0.0,
+    "total_run_ms": 0.0,
+}
+
+
+def _bump(**deltas: float) -> None:
+    with _stats_lock:
+        for key, delta in deltas.items():
+            _stats[key] += delta
+
+
+def executor_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    done = stats["completed"] + stats["failed"]
+    return {
+        "workers": BLOCKING_EXECUTOR_WORKERS,
+        "in_flight": int(stats["in_flight"]),
+        "queued": int(stats["in_flight"] - stats["running"]),
+        "completed": int(stats["completed"]),
+        "failed": int(stats["failed"]),
+        "cancelled": int(stats["cancelled"]),
+        "avg_queue_wait_ms": round(stats["total_queue_wait_ms"] / done, 1) if done else 0.0,
+        "max_queue_wait_ms": round(stats["max_queue_wait_ms"], 1),
+        "avg_run_ms": round(stats["total_run_ms"] / done, 1) if done else 0.0,
+    }
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking callable on the bounded pool and await its result."""
+    ctx = contextvars.copy_context()  # keep request-scoped logging context in the worker
+    submitted_at = time.perf_counter()
+    _bump(submitted=1, in_flight=1)
+
+    def call() -> T:
+        started_at = time.perf_counter()
+        wait_ms = (started_at - submitted_at) * 1000
+        with _stats_lock:
+            _stats["running"] += 1
+            _stats["total_queue_wait_ms"] += wait_ms
+            _stats["max_queue_wait_ms"] = max(_stats["max_queue_wait_ms"], wait_ms)
+        if wait_ms > QUEUE_WAIT_WARN_MS:
+            logger.warning("Blocking call %s waited %.0fms for a worker", getattr(fn, "__name__", fn), wait_ms)
+
+        ok = False
+        try:
+            result = ctx.run(fn, *args, **kwargs)
+            ok = True
+            return result
+        finally:
+            _bump(
+                running=-1,
+                in_flight=-1,
+                completed=1 if ok else 0,
+                failed=0 if ok else 1,
+                total_run_ms=(time.perf_counter() - started_at) * 1000,
+            )
+
+    def on_done(future: "Future[T]") -> None:
+        # Cancelled while still queued (the awaiting request went away): call never ran to settle the counts
+        if future.cancelled():
+            _bump(in_flight=-1, cancelled=1)
+
+    future = _executor.submit(call)
+    future.add_done_callback(on_done)
+    return await asyncio.wrap_future(future)
+
+
+def blocking_endpoint(fn: Callable[..., T]) -> Callable[..., Any]:
+    """Turn a synchronous route handler into an async one that runs on the pool.
+
+    FastAPI would run a plain `def` handler on its own threadpool anyway; this
+    exists so handlers share the bounded pool above and its /health stats.
+    The wrapped signature is preserved, so FastAPI still resolves parameters
+    and dependencies from the original function.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return await run_blocking(fn, *args, **kwargs)
+
+    return wrapper
@@ -11,6 +11,7 @@ class FileResponse(BaseModel):
     document_type: Optional[str] = None
     extraction_status: str
     storage_path: str
+    content_hash: Optional[str] = None
     uploaded_by: Optional[UUID] = None
     created_at: datetime
 
@@ -0,0 +1,98 @@
+"""
+Token-budget-aware batching for Tier 3 (Gemini) classification.
+
+Items are packed greedily until either the estimated prompt (shared context,
+each item's shortlisted rules/precedents, and the items themselves) would
+exceed the model's batch_token_budget, or the estimated JSON
+response would pass OUTPUT_SAFETY_FACTOR of its max_output_tokens (the
+full limit is what is requested from the API). Batches whose response cannot
+be parsed are split in half and retried instead of being failed outright.
+"""
+
+import json
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.services.gemini_client import PRICING, estimate_tokens
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# Rough size of one response entry (target row/sheet/label, confidence, reasoning) excluding the name
+OUTPUT_TOKENS_PER_ITEM = 80
+
+# Batches are planned to this share of the output limit, leaving headroom for
+# estimation error so responses are not cut off mid-array
+OUTPUT_SAFETY_FACTOR = 0.8
+
+# Upper bound regardless of budget — very large batches degrade per-item accuracy
+MAX_BATCH_ITEMS = 60
+
+
+def batch_limits(model: str) -> Tuple[int, int]:
+    """(prompt token budget, max output tokens) for *model*."""
+    pricing = PRICING.get(model, PRICING[DEFAULT_MODEL])
+    budget = pricing.get("batch_token_budget", PRICING[DEFAULT_MODEL]["batch_token_budget"])
+    max_output = pricing.get("max_output_tokens", PRICING[DEFAULT_MODEL]["max_output_tokens"])
+    return budget, max_output
+
+
+def item_tokens(item: Dict[str, Any]) -> Tuple[int, int]:
+    """Estimated (prompt, response) tokens contributed by one item."""
+    prompt_tokens = estimate_tokens(json.dumps(item)) + 1
+    output_tokens = estimate_tokens(item.get("item_name", "")) + OUTPUT_TOKENS_PER_ITEM
+    return prompt_tokens, output_tokens
+
+
+ItemContext = Callable[[Dict[str, Any]], Dict[Hashable, int]]
+
+
+def plan_batches(
+    items: List[Dict[str, Any]],
+    model: str,
+    shared_tokens: int,
+    item_context: Optional[ItemContext] = None,
+) -> List[List[Dict[str, Any]]]:
+    """Pack *items* into batches that fit the model's prompt and response budgets.
+
+    shared_tokens is the per-batch context that does not depend on the items
+    (system prompt and template). item_context maps an item to the context
+    entries it pulls into the prompt (shortlisted rules, precedents) and their
+    token cost; entries shared by several items in a batch are counted once.
+    """
+    budget, max_output = batch_limits(model)
+    item_budget = max(budget - shared_tokens, 0)
+    output_budget = int(max_output * OUTPUT_SAFETY_FACTOR)
+
+    batches: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    context: Dict[Hashable, int] = {}
+    used_in = used_out = 0
+
+    for item in items:
+        tok_in, tok_out = item_tokens(item)
+        entries = item_context(item) if item_context else {}
+        tok_ctx = sum(tokens for key, tokens in entries.items() if key not in context)
+        over = (
+            used_in + tok_ctx + tok_in > item_budget
+            or used_out + tok_out > output_budget
+            or len(current) >= MAX_BATCH_ITEMS
+        )
+        if current and over:
+            batches.append(current)
+            current, context, used_in, used_out = [], {}, 0, 0
+            tok_ctx = sum(entries.values())
+        current.append(item)
+        context.update(entries)
+        used_in += tok_in + tok_ctx
+        used_out += tok_out
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_batch(batch: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Halve a batch for retry; a single item cannot be split further."""
+    if len(batch) <= 1:
+        return []
+    mid = len(batch) // 2
+    return [batch[:mid], batch[mid:]]
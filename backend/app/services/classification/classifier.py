@@ -1,31 +1,41 @@
-import json
 import logging
 import os
-from typing import List, Optional
-from pydantic import BaseModel
+from collections import deque
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from app.services.classification.precedent_matcher import get_best_precedent
-from app.services.classification.rule_matcher import classify_by_rules, filter_rules
-from app.services.classification.prompts import CLASSIFICATION_SYSTEM_PROMPT, CLASSIFICATION_USER_PROMPT
-from app.services.gemini_client import GeminiClient, log_llm_usage
+from app.services.classification.rule_matcher import classify_by_rules, filter_rules, normalize_indian_term
+from app.services.classification.prompts import CLASSIFICATION_SYSTEM_PROMPT
+from app.services.classification.prompt_builder import PromptBuilder
+from app.services.classification.batching import batch_limits, plan_batches, split_batch
+from app.services.classification.coalescer import classification_coalescer
+from app.services.classification.memo import lookup_memos, save_memos
+from app.services.classification.vector_matcher import get_firm_index, VECTOR_MIN_SCORE, VECTOR_MIN_MARGIN
+from app.services.gemini_client import GeminiClient, GeminiResponse, estimate_tokens, log_llm_usage
+from app.utils.json_salvage import salvage_json_array
 
 logger = logging.getLogger(__name__)
 
 
-class ClassifiedItem(BaseModel):
+# Internal records are slotted dataclasses: a 5k-line trial balance creates one
+# per occurrence, and they are only turned into JSON at the edge (items_to_dicts).
+@dataclass(slots=True)
+class ClassifiedItem:
     item_name: str
     item_amount: float
+    confidence: float
+    source: str
+    reasoning: str
+    needs_review: bool
     target_row: Optional[int] = None
     target_sheet: Optional[str] = None
     target_label: Optional[str] = None
-    confidence: float
-    source: str
     matched_rule_id: Optional[int] = None
     matched_precedent_id: Optional[str] = None
-    reasoning: str
-    needs_review: bool
 
 
-class ClassificationResult(BaseModel):
+@dataclass(slots=True)
+class ClassificationResult:
     total_items: int
     classified_by_precedent: int
     classified_by_rule: int
@@ -37,6 +47,59 @@ class ClassificationResult(BaseModel):
     items: List[ClassifiedItem]
     llm_cost_usd: float
     llm_tokens_used: int
+    classified_by_vector: int = 0
+    classified_by_memo: int = 0
+    prompt_tokens_saved: int = 0
+    unique_items: int = 0
+    dedupe_ratio: float = 1.0  # occurrences per unique (name, document) key
+    escalated_items: int = 0
+    escalation_cost_usd: float = 0.0
+
+
+_ITEM_FIELDS = tuple(f.name for f in fields(ClassifiedItem))
+
+
+def items_to_dicts(items: List[ClassifiedItem]) -> List[dict]:
+    """Plain dicts for classification_data; supabase-py does the one JSON encode."""
+    return [{name: getattr(item, name) for name in _ITEM_FIELDS} for item in items]
+
+
+def _summarize(results: List[ClassifiedItem]) -> Dict[str, Any]:
+    """Per-source counts, review counts and mean confidence in one pass."""
+    by_source: Dict[str, int] = {}
+    needs_review = 0
+    conf_total = 0.0
+    for r in results:
+        by_source[r.source] = by_source.get(r.source, 0) + 1
+        needs_review += r.needs_review
+        conf_total += r.confidence
+
+    return {
+        "total_items": len(results),
+        "classified_by_precedent": by_source.get("precedent", 0),
+        "classified_by_rule": by_source.get("rule", 0),
+        "classified_by_ai": by_source.get("ai", 0),
+        "classified_by_vector": by_source.get("vector", 0),
+        "classified_by_memo": by_source.get("memo", 0),
+        "unclassified": by_source.get("unclassified", 0),
+        "needs_review": needs_review,
+        "auto_classified": len(results) - needs_review,
+        "average_confidence": conf_total / len(results) if results else 0.0,
+    }
+
+
+def _as_float(value: Any, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
 
 
 def get_db_extracted_data(project_id: str, firm_id: str):
@@ -48,6 +111,21 @@ def get_db_extracted_data(project_id: str, firm_id: str):
     return res.data[0]["extracted_data"]
 
 
+def flatten_line_items(data: dict) -> List[dict]:
+    """Classifiable line items of merged extracted_data, in the order results are returned."""
+    items = []
+    for doc in ["profit_and_loss", "balance_sheet", "trial_balance"]:
+        if data.get(doc) and data[doc].get("line_items"):
+            for itm in data[doc]["line_items"]:
+                if not itm.get("is_total") and itm.get("name"):
+                    items.append({
+                        "item_name": itm["name"],
+                        "item_amount": itm.get("amount", 0.0),
+                        "document_type": doc,
+                    })
+    return items
+
+
 def clean_json(text: str) -> str:
     text = text.strip()
     if text.startswith("```json"):
@@ -59,26 +137,270 @@ def clean_json(text: str) -> str:
     return text.strip()
 
 
+def dedupe_key(item: dict) -> Tuple[str, str]:
+    return normalize_indian_term(item["item_name"]), item["document_type"]
+
+
+def _match_ai_key(parsed: dict, pending: List[Tuple[str, str]]) -> Optional[Tuple[str, str]]:
+    """Map one AI response entry back to an outstanding batch key by normalised name."""
+    name = normalize_indian_term(str(parsed.get("item_name", "")))
+    doc_type = parsed.get("document_type")
+    candidates = [k for k in pending if k[0] == name]
+    for k in candidates:
+        if k[1] == doc_type:
+            return k
+    return candidates[0] if candidates else None
+
+
+@dataclass(slots=True)
+class AiTierResult:
+    decisions: Dict[Tuple[str, str], ClassifiedItem] = field(default_factory=dict)
+    cost_usd: float = 0.0
+    tokens: int = 0
+    tokens_saved: int = 0
+
+
+# (response, batch items, prompt tokens saved) -> None
+UsageLogger = Callable[[GeminiResponse, List[dict], int], None]
+
+
+@dataclass(slots=True)
+class AiTierRequest:
+    items: List[dict]
+    builder: PromptBuilder
+    groups: Dict[Tuple[str, str], List[dict]]
+    firm_id: str
+    project_id: str
+
+
+def _run_ai_tier(
+    client: GeminiClient,
+    model_name: str,
+    items: List[dict],
+    builder: PromptBuilder,
+    groups: Dict[Tuple[str, str], List[dict]],
+    log_usage: UsageLogger,
+) -> AiTierResult:
+    """Classify *items* with one model, packing, splitting and re-queueing batches as needed."""
+    out = AiTierResult()
+    _, max_output = batch_limits(model_name)
+    shared_tokens = estimate_tokens(CLASSIFICATION_SYSTEM_PROMPT) + builder.shared_tokens
+    queue = deque(plan_batches(items, model_name, shared_tokens, builder.context_tokens))
+    done = 0
+
+    while queue:
+        batch_items = queue.popleft()
+        done += 1
+        total_batches = done + len(queue)
+        batch_prompt = builder.build(batch_items, f"This is batch {done} of {total_batches}.")
+        out.tokens_saved += batch_prompt.prompt_tokens_saved
+
+        try:
+            resp = client.generate(
+                model=model_name,
+                prompt=batch_prompt.prompt,
+                system_instruction=CLASSIFICATION_SYSTEM_PROMPT,
+                temperature=0.1,
+                response_format="json",
+                max_output_tokens=max_output,
+            )
+
+            out.cost_usd += resp.cost_usd
+            out.tokens += resp.input_tokens + resp.output_tokens
+
+            log_usage(resp, batch_items, batch_prompt.prompt_tokens_saved)
+
+            parsed, complete = salvage_json_array(clean_json(resp.text)) if resp.text else ([], False)
+            parsed = [p for p in parsed if isinstance(p, dict)]
+            if not parsed and not complete:
+                # Nothing recoverable (truncated or malformed): retry as two smaller batches
+                halves = split_batch(batch_items)
+                if halves:
+                    logger.warning("AI batch %d/%d returned malformed JSON, splitting %d items",
+                                   done, total_batches, len(batch_items))
+                    queue.extendleft(reversed(halves))
+                    continue
+                raise Exception("Malformed or empty generation")
+
+            pending = [dedupe_key(bi) for bi in batch_items]
+            for p in parsed:
+                key = _match_ai_key(p, pending)
+                if key is None:
+                    logger.warning("AI returned unknown item '%s'", p.get("item_name"))
+                    continue
+                pending.remove(key)
+                conf = _as_float(p.get("confidence"))
+                out.decisions[key] = ClassifiedItem(
+                    item_name=str(p.get("item_name", "Unknown")),
+                    item_amount=_as_float(p.get("item_amount")),
+                    target_row=_as_int(p.get("target_row")),
+                    target_sheet=p.get("target_sheet"),
+                    target_label=p.get("target_label"),
+                    confidence=conf,
+                    source="ai",
+                    matched_rule_id=_as_int(p.get("matched_rule_id")),
+                    reasoning=str(p.get("reasoning") or ""),
+                    needs_review=(conf < 0.70),
+                )
+
+            if pending and len(pending) < len(batch_items):
+                # Partial response: follow up with only the items still missing
+                logger.warning("AI batch %d/%d salvaged %d/%d items, re-queueing the rest",
+                               done, total_batches, len(batch_items) - len(pending), len(batch_items))
+                queue.append([groups[key][0] for key in pending])
+                continue
+
+            for key in pending:
+                out.decisions[key] = ClassifiedItem(
+                    item_name=groups[key][0]["item_name"],
+                    item_amount=groups[key][0]["item_amount"],
+                    confidence=0.0,
+                    source="unclassified",
+                    reasoning="AI returned no classification for this item",
+                    needs_review=True,
+                )
+
+        except Exception as e:
+            logger.error("AI batch %d/%d failed: %s", done, total_batches, e)
+            for bi in batch_items:
+                out.decisions[dedupe_key(bi)] = ClassifiedItem(
+                    item_name=bi["item_name"],
+                    item_amount=bi["item_amount"],
+                    confidence=0.0,
+                    source="unclassified",
+                    reasoning=f"AI failure: {e}",
+                    needs_review=True,
+                )
+
+    return out
+
+
+def _run_coalesced(client: GeminiClient, model_name: str, task_type: str, requests: List[AiTierRequest]) -> List[AiTierResult]:
+    """Classify several projects' pending items in shared batches and split the outcome per project.
+
+    Keys repeated across projects are classified once. Cost, tokens and
+    usage rows are attributed to each project by its share of every batch.
+    """
+    if len(requests) == 1:
+        req = requests[0]
+
+        def log_usage(resp: GeminiResponse, batch: List[dict], saved: int) -> None:
+            log_llm_usage(req.firm_id, req.project_id, model_name, task_type, resp, bool(resp.text), prompt_tokens_saved=saved)
+
+        return [_run_ai_tier(client, model_name, req.items, req.builder, req.groups, log_usage)]
+
+    owners: Dict[Tuple[str, str], List[int]] = {}
+    items: List[dict] = []
+    for i, req in enumerate(requests):
+        for item in req.items:
+            key = dedupe_key(item)
+            if key not in owners:
+                owners[key] = []
+                items.append(item)
+            owners[key].append(i)
+    groups = {dedupe_key(item): [item] for item in items}
+
+    # The coalescing key includes the firm, so every request shares one firm's precedents
+    builder = requests[0].builder
+
+    outs = [AiTierResult() for _ in requests]
+
+    def log_usage(resp: GeminiResponse, batch: List[dict], saved: int) -> None:
+        shares: Dict[int, int] = {}
+        for item in batch:
+            for i in owners[dedupe_key(item)]:
+                shares[i] = shares.get(i, 0) + 1
+        total = sum(shares.values())
+        for i, n in shares.items():
+            frac = n / total
+            part = replace(
+                resp,
+                input_tokens=round(resp.input_tokens * frac),
+                output_tokens=round(resp.output_tokens * frac),
+                cost_usd=resp.cost_usd * frac,
+            )
+            outs[i].cost_usd += part.cost_usd
+            outs[i].tokens += part.input_tokens + part.output_tokens
+            outs[i].tokens_saved += round(saved * frac)
+            req = requests[i]
+            log_llm_usage(req.firm_id, req.project_id, model_name, task_type, part, bool(resp.text), prompt_tokens_saved=round(saved * frac))
+
+    merged = _run_ai_tier(client, model_name, items, builder, groups, log_usage)
+
+    for key, decision in merged.decisions.items():
+        for i in owners[key]:
+            outs[i].decisions[key] = decision
+    return outs
+
+
+def _classify_with_ai(
+    client: GeminiClient, model_name: str, task_type: str, entity_type: str, request: AiTierRequest,
+) -> AiTierResult:
+    """Run one project's AI tier through the process-wide coalescer.
+
+    Batches are shared only between projects of the same firm: prompts carry
+    the firm's private precedents, and a firm's decisions must not depend on
+    which other firms happened to classify at the same moment.
+    """
+    return classification_coalescer.submit(
+        (request.firm_id, model_name, entity_type, task_type),
+        request,
+        lambda requests: _run_coalesced(client, model_name, task_type, requests),
+    )
+
+
 def classify_project(project_id: str, firm_id: str, entity_type: str) -> ClassificationResult:
-    data = get_db_extracted_data(project_id, firm_id)
+    with classification_coalescer.session():
+        return _classify_project(project_id, firm_id, entity_type)
 
-    all_raw_items = []
 
-    for doc in ["profit_and_loss", "balance_sheet", "trial_balance"]:
-        if data.get(doc) and data[doc].get("line_items"):
-            for itm in data[doc]["line_items"]:
-                if not itm.get("is_total") and itm.get("name"):
-                    all_raw_items.append({
-                        "item_name": itm["name"],
-                        "item_amount": itm.get("amount", 0.0),
-                        "document_type": doc,
-                    })
+def _classify_project(project_id: str, firm_id: str, entity_type: str) -> ClassificationResult:
+    all_raw_items = flatten_line_items(get_db_extracted_data(project_id, firm_id))
 
-    results: List[ClassifiedItem] = []
+    # Group repeated ledger names (TB + P&L, or repeats within one TB) so each
+    # unique (normalised name, document type) is classified exactly once
+    groups: Dict[Tuple[str, str], List[dict]] = {}
+    for item in all_raw_items:
+        groups.setdefault(dedupe_key(item), []).append(item)
+
+    decisions: Dict[Tuple[str, str], ClassifiedItem] = {}
     to_ai = []
 
-    # Tier 1 & 2
-    for item in all_raw_items:
+    # Tier 0: firm memo of previously accepted decisions, one query for every key
+    try:
+        memos = lookup_memos(firm_id, entity_type, groups.keys())
+    except Exception as e:
+        logger.warning("Classification memo lookup failed for firm %s: %s", firm_id, e)
+        memos = {}
+
+    for key, hit in memos.items():
+        item = groups[key][0]
+        decisions[key] = ClassifiedItem(
+            item_name=item["item_name"],
+            item_amount=item["item_amount"],
+            target_row=hit.target_row,
+            target_sheet=hit.target_sheet,
+            target_label=hit.target_label,
+            confidence=hit.confidence,
+            source="memo",
+            matched_rule_id=hit.matched_rule_id,
+            matched_precedent_id=hit.matched_precedent_id,
+            reasoning=f"Remembered {hit.provenance} decision from {hit.decided_at[:10]}",
+            needs_review=False,
+        )
+
+    vector_index = None
+    if len(memos) < len(groups):
+        try:
+            vector_index = get_firm_index(firm_id, entity_type)
+        except Exception as e:
+            logger.warning("Vector index unavailable for firm %s: %s", firm_id, e)
+
+    # Tier 1, 2 & 2.5
+    for key, occurrences in groups.items():
+        if key in decisions:
+            continue
+        item = occurrences[0]
         name = item["item_name"]
         amt = item["item_amount"]
         doc_type = item["document_type"]
@@ -91,7 +413,7 @@ def classify_project(project_id: str, firm_id: str, entity_type: str) -> Classif
             prec = None
 
         if prec and prec.confidence >= 0.80:
-            results.append(ClassifiedItem(
+            decisions[key] = ClassifiedItem(
                 item_name=name,
                 item_amount=amt,
                 target_row=prec.target_row,
@@ -102,13 +424,13 @@ def classify_project(project_id: str, firm_id: str, entity_type: str) -> Classif
                 matched_precedent_id=prec.precedent_id,
                 reasoning=f"Matched CA precedent ({prec.match_type})",
                 needs_review=False,
-            ))
+            )
             continue
 
         # Tier 2: Rule matching
         rule_match = classify_by_rules(name, entity_type, doc_type)
         if rule_match and rule_match.score >= 0.85:
-            results.append(ClassifiedItem(
+            decisions[key] = ClassifiedItem(
                 item_name=name,
                 item_amount=amt,
                 target_row=rule_match.rule.target_row,
@@ -119,7 +441,25 @@ def classify_project(project_id: str, firm_id: str, entity_type: str) -> Classif
                 matched_rule_id=rule_match.rule.id,
                 reasoning=f"Matched Rule ID {rule_match.rule.id} via {rule_match.match_type}",
                 needs_review=False,
-            ))
+            )
+            continue
+
+        # Tier 2.5: Local TF-IDF similarity over precedents + rule terms
+        vec = vector_index.best_match(name) if vector_index is not None else None
+        if vec and vec.score >= VECTOR_MIN_SCORE and vec.margin >= VECTOR_MIN_MARGIN:
+            decisions[key] = ClassifiedItem(
+                item_name=name,
+                item_amount=amt,
+                target_row=vec.target_row,
+                target_sheet=vec.target_sheet,
+                target_label=vec.target_label,
+                confidence=vec.score,
+                source="vector",
+                matched_rule_id=int(vec.ref_id.split(".")[0]) if vec.kind == "rule" else None,
+                matched_precedent_id=vec.ref_id if vec.kind == "precedent" else None,
+                reasoning=f"Similar to '{vec.matched_term}' (cosine {vec.score:.2f}, margin {vec.margin:.2f})",
+                needs_review=False,
+            )
             continue
 
         # Tier 3: Queue for AI
@@ -127,6 +467,9 @@ def classify_project(project_id: str, firm_id: str, entity_type: str) -> Classif
 
     ai_cost = 0.0
     ai_tokens = 0
+    tokens_saved = 0
+    escalation_cost = 0.0
+    escalated = 0
 
     # Tier 3: AI classification
     if to_ai:
@@ -136,93 +479,66 @@ def classify_project(project_id: str, firm_id: str, entity_type: str) -> Classif
             logger.error("GeminiClient init failed: %s", e)
             # Mark all AI items as unclassified
             for bi in to_ai:
-                results.append(ClassifiedItem(
+                decisions[dedupe_key(bi)] = ClassifiedItem(
                     item_name=bi["item_name"],
                     item_amount=bi["item_amount"],
                     confidence=0.0,
                     source="unclassified",
                     reasoning=f"AI unavailable: {e}",
                     needs_review=True,
-                ))
+                )
         else:
             model_name = os.getenv("LLM_CLASSIFICATION_MODEL", "gemini-2.0-flash")
+            builder = PromptBuilder(entity_type, filter_rules(entity_type, ""), vector_index)
+
+            tier = _classify_with_ai(
+                client, model_name, "classification", entity_type,
+                AiTierRequest(to_ai, builder, groups, firm_id, project_id),
+            )
+            decisions.update(tier.decisions)
+            ai_cost += tier.cost_usd
+            ai_tokens += tier.tokens
+            tokens_saved += tier.tokens_saved
 
-            batch_size = 20
-            total_batches = (len(to_ai) + batch_size - 1) // batch_size
-
-            filtered_rules = filter_rules(entity_type, "")
-            rules_compact = [{"id": r.id, "terms": r.source_terms, "row": r.target_row, "sheet": r.target_sheet} for r in filtered_rules]
-            rules_str = json.dumps(rules_compact)
-            precedents_str = "[]"
-
-            for b in range(total_batches):
-                batch_items = to_ai[b * batch_size:(b + 1) * batch_size]
-                prompt = CLASSIFICATION_USER_PROMPT.format(
-                    entity_type=entity_type,
-                    batch_note=f"This is batch {b + 1} of {total_batches}.",
-                    rules_json=rules_str,
-                    precedents_json=precedents_str,
-                    items_json=json.dumps(batch_items),
+            # Cascade: re-send low-confidence items to the stronger model in one consolidated pass
+            escalation_model = os.getenv("LLM_CLASSIFICATION_ESCALATION_MODEL", "gemini-2.5-pro")
+            threshold = float(os.getenv("LLM_ESCALATION_CONFIDENCE_THRESHOLD", "0.70"))
+            to_escalate = [groups[key][0] for key, d in tier.decisions.items() if d.confidence < threshold]
+
+            if escalation_model and escalation_model != model_name and to_escalate:
+                esc = _classify_with_ai(
+                    client, escalation_model, "classification_escalation", entity_type,
+                    AiTierRequest(to_escalate, builder, groups, firm_id, project_id),
                 )
+                ai_cost += esc.cost_usd
+                ai_tokens += esc.tokens
+                tokens_saved += esc.tokens_saved
+                escalation_cost += esc.cost_usd
+
+                for key, d in esc.decisions.items():
+                    if d.confidence > decisions[key].confidence:
+                        decisions[key] = d
+                        escalated += 1
+
+    try:
+        save_memos(firm_id, entity_type, {k: d for k, d in decisions.items() if k not in memos})
+    except Exception as e:
+        logger.warning("Failed to save classification memos for firm %s: %s", firm_id, e)
 
-                try:
-                    resp = client.generate(
-                        model=model_name,
-                        prompt=prompt,
-                        system_instruction=CLASSIFICATION_SYSTEM_PROMPT,
-                        temperature=0.1,
-                        response_format="json",
-                    )
-
-                    ai_cost += resp.cost_usd
-                    ai_tokens += resp.input_tokens + resp.output_tokens
-
-                    log_llm_usage(firm_id, project_id, model_name, "classification", resp, bool(resp.text))
-
-                    if resp.text:
-                        parsed = json.loads(clean_json(resp.text))
-                        for p in parsed:
-                            conf = p.get("confidence", 0.0)
-                            results.append(ClassifiedItem(
-                                item_name=p.get("item_name", "Unknown"),
-                                item_amount=p.get("item_amount", 0.0),
-                                target_row=p.get("target_row"),
-                                target_sheet=p.get("target_sheet"),
-                                target_label=p.get("target_label"),
-                                confidence=conf,
-                                source="ai",
-                                matched_rule_id=p.get("matched_rule_id"),
-                                reasoning=p.get("reasoning", ""),
-                                needs_review=(conf < 0.70),
-                            ))
-                    else:
-                        raise Exception("Empty generation")
-
-                except Exception as e:
-                    logger.error("AI batch %d/%d failed: %s", b + 1, total_batches, e)
-                    for bi in batch_items:
-                        results.append(ClassifiedItem(
-                            item_name=bi["item_name"],
-                            item_amount=bi["item_amount"],
-                            confidence=0.0,
-                            source="unclassified",
-                            reasoning=f"AI failure: {e}",
-                            needs_review=True,
-                        ))
-
-    # Summarize
-    avg_conf = sum(r.confidence for r in results) / len(results) if results else 0.0
+    # Fan each decision back out to every occurrence, keeping its own name and amount
+    results: List[ClassifiedItem] = [
+        replace(decisions[dedupe_key(item)], item_name=item["item_name"], item_amount=item["item_amount"])
+        for item in all_raw_items
+    ]
 
     return ClassificationResult(
-        total_items=len(results),
-        classified_by_precedent=sum(1 for r in results if r.source == "precedent"),
-        classified_by_rule=sum(1 for r in results if r.source == "rule"),
-        classified_by_ai=sum(1 for r in results if r.source == "ai"),
-        unclassified=sum(1 for r in results if r.source == "unclassified"),
-        needs_review=sum(1 for r in results if r.needs_review),
-        auto_classified=sum(1 for r in results if not r.needs_review),
-        average_confidence=avg_conf,
+        **_summarize(results),
         items=results,
         llm_cost_usd=ai_cost,
         llm_tokens_used=ai_tokens,
+        prompt_tokens_saved=tokens_saved,
+        unique_items=len(groups),
+        dedupe_ratio=round(len(results) / len(groups), 2) if groups else 1.0,
+        escalated_items=escalated,
+        escalation_cost_usd=escalation_cost,
     )
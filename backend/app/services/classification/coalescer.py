@@ -0,0 +1,122 @@
+"""
+Per-process request coalescing for Tier 3 (Gemini) classification.
+
+Concurrent classify_project calls (pipeline runs execute in the threadpool)
+submit their pending AI items under a key such as (firm, model, entity type,
+task). The first caller for a key becomes the leader: it waits a short window
+for other in-flight projects to submit, then runs every queued payload through
+a single runner call and hands each caller its own result. When only one
+project is classifying, the leader flushes immediately, so a lone caller never
+pays the window.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+COALESCE_WINDOW_SECONDS = int(os.getenv("LLM_COALESCE_WINDOW_MS", "50")) / 1000
+
+# A follower whose payload the leader has not picked up by then runs it itself;
+# once the leader has taken it, the follower waits for the leader's result
+FOLLOWER_TIMEOUT_SECONDS = 600
+
+
+class _Slot:
+    __slots__ = ("payload", "result", "error", "done")
+
+    def __init__(self, payload: Any) -> None:
+        self.payload = payload
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class Coalescer:
+    def __init__(self, window_seconds: float = COALESCE_WINDOW_SECONDS) -> None:
+        self.window_seconds = window_seconds
+        self._cond = threading.Condition()
+        self._queues: Dict[Hashable, List[_Slot]] = {}
+        self._active = 0
+        self._waiting = 0
+
+    @contextmanager
+    def session(self) -> Iterator[None]:
+        """Mark a caller as in flight, so leaders know whether more submissions may arrive."""
+        with self._cond:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def submit(self, key: Hashable, payload: Any, runner: Callable[[List[Any]], List[Any]]) -> Any:
+        """Queue *payload* under *key* and return its result once a runner call has processed it.
+
+        runner receives every payload gathered for the key and must return one
+        result per payload, in order.
+        """
+        slot = _Slot(payload)
+        with self._cond:
+            queue = self._queues.get(key)
+            leader = queue is None
+            if leader:
+                queue = self._queues[key] = []
+            queue.append(slot)
+            self._waiting += 1
+            self._cond.notify_all()
+
+        if not leader:
+            if not slot.done.wait(FOLLOWER_TIMEOUT_SECONDS):
+                with self._cond:
+                    queue = self._queues.get(key)
+                    unclaimed = queue is not None and any(s is slot for s in queue)
+                    if unclaimed:
+                        queue.remove(slot)
+                        self._waiting -= 1
+                if unclaimed:
+                    logger.warning("Coalesced classification was not picked up in time, running standalone")
+                    return runner([payload])[0]
+                # The leader is already running this payload; running it again would double the LLM calls
+                logger.warning("Coalesced classification is slow, still waiting for the leader")
+                slot.done.wait()
+            if slot.error is not None:
+                raise slot.error
+            return slot.result
+
+        with self._cond:
+            deadline = time.monotonic() + self.window_seconds
+            while self._waiting < self._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            slots = self._queues.pop(key)
+            self._waiting -= len(slots)
+
+        if len(slots) > 1:
+            logger.info("Coalesced %d classification requests for %s", len(slots), key)
+
+        try:
+            results = runner([s.payload for s in slots])
+            for s, result in zip(slots, results):
+                s.result = result
+        except Exception as e:
+            for s in slots:
+                s.error = e
+        finally:
+            for s in slots:
+                s.done.set()
+
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+
+classification_coalescer = Coalescer()
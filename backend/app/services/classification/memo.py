@@ -0,0 +1,200 @@
+"""
+Firm-level classification memo.
+
+Remembers the last accepted decision per (firm, normalised term, entity type,
+document type) so a returning client's recurring ledger names are answered by
+one indexed query instead of the full precedent → rule → vector → AI cascade.
+
+Memo confidence decays with age. Rule-derived memos are ignored once the rules
+file changes. When a precedent is created, edited, removed or promoted, the
+memos for its term are dropped, along with every memo derived from that
+precedent (fuzzy and vector matches are stored under the item's own term).
+CA review decisions are stored with document_type "any" and take priority
+over automatic ones.
+
+Known limitation: memos are checked before Tier 1, and a new precedent only
+invalidates memos for its exact term and memos decided from it. A memo for
+a near-matching term (e.g. "salary a/c" when a precedent for "salaries" is
+added) was decided by another tier and keeps its old answer until it decays
+below MEMO_MIN_CONFIDENCE, the rules change, or a CA reviews that item.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.db.supabase_client import get_supabase
+from app.services.classification.rule_matcher import normalize_indian_term
+from app.services.classification.rules_loader import get_all_rules
+
+if TYPE_CHECKING:
+    from app.services.classification.classifier import ClassifiedItem
+
+logger = logging.getLogger(__name__)
+
+MEMO_HALF_LIFE_DAYS = 1825
+MEMO_MIN_CONFIDENCE = 0.80
+
+# Tier outcomes worth remembering; CA reviews are written separately via record_review
+MEMO_SOURCES = ("precedent", "rule", "vector", "ai")
+ANY_DOCUMENT = "any"
+
+# Terms per IN (...) filter; the filter travels in the request URL, so a whole trial balance cannot go in one
+MEMO_LOOKUP_CHUNK = 200
+
+_rules_version: Optional[str] = None
+
+
+class MemoHit(BaseModel):
+    target_row: int
+    target_sheet: str
+    target_label: Optional[str] = None
+    confidence: float  # after decay
+    provenance: str
+    matched_rule_id: Optional[int] = None
+    matched_precedent_id: Optional[str] = None
+    decided_at: str
+
+
+def rules_version() -> str:
+    """Short hash of the loaded rules; memos made under other rules are not reused."""
+    global _rules_version
+    if _rules_version is None:
+        payload = json.dumps([r.model_dump() for r in get_all_rules()], sort_keys=True)
+        _rules_version = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+    return _rules_version
+
+
+def decayed_confidence(confidence: float, decided_at: str, now: Optional[datetime] = None) -> float:
+    now = now or datetime.now(timezone.utc)
+    try:
+        decided = datetime.fromisoformat(decided_at.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return 0.0
+    if decided.tzinfo is None:
+        decided = decided.replace(tzinfo=timezone.utc)
+    age_days = max((now - decided).total_seconds() / 86400, 0.0)
+    return float(confidence) * 0.5 ** (age_days / MEMO_HALF_LIFE_DAYS)
+
+
+def lookup_memos(firm_id: str, entity_type: str, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], MemoHit]:
+    """Usable memo per (term_norm, document_type) key, fetched MEMO_LOOKUP_CHUNK terms per query."""
+    keys = list(keys)
+    if not keys:
+        return {}
+
+    db = get_supabase()
+    terms = sorted({k[0] for k in keys})
+    rows: List[dict] = []
+    for start in range(0, len(terms), MEMO_LOOKUP_CHUNK):
+        res = (
+            db.table("classification_memo")
+            .select("term_norm, document_type, target_row, target_sheet, target_label, confidence, source, "
+                    "matched_rule_id, matched_precedent_id, rules_version, decided_at")
+            .eq("firm_id", firm_id)
+            .eq("entity_type", entity_type)
+            .in_("term_norm", terms[start:start + MEMO_LOOKUP_CHUNK])
+            .execute()
+        )
+        rows.extend(res.data or [])
+
+    current_rules = rules_version()
+    usable: Dict[Tuple[str, str], MemoHit] = {}
+    for row in rows:
+        if row["source"] != "ca_reviewed" and row.get("rules_version") != current_rules:
+            continue
+        conf = decayed_confidence(row["confidence"], row["decided_at"])
+        if conf < MEMO_MIN_CONFIDENCE:
+            continue
+        usable[(row["term_norm"], row["document_type"])] = MemoHit(
+            target_row=row["target_row"],
+            target_sheet=row["target_sheet"],
+            target_label=row.get("target_label"),
+            confidence=round(conf, 4),
+            provenance=row["source"],
+            matched_rule_id=row.get("matched_rule_id"),
+            matched_precedent_id=row.get("matched_precedent_id"),
+            decided_at=row["decided_at"],
+        )
+
+    hits: Dict[Tuple[str, str], MemoHit] = {}
+    for key in keys:
+        hit = usable.get((key[0], ANY_DOCUMENT)) or usable.get(key)
+        if hit:
+            hits[key] = hit
+    return hits
+
+
+def save_memos(firm_id: str, entity_type: str, decisions: Dict[Tuple[str, str], "ClassifiedItem"]) -> int:
+    """Upsert auto-accepted decisions; returns how many rows were written."""
+    now = datetime.now(timezone.utc).isoformat()
+    version = rules_version()
+    rows: List[dict] = []
+    for (term_norm, document_type), d in decisions.items():
+        if d.source not in MEMO_SOURCES or d.needs_review or d.target_row is None or not d.target_sheet:
+            continue
+        rows.append({
+            "firm_id": firm_id,
+            "term_norm": term_norm,
+            "entity_type": entity_type,
+            "document_type": document_type,
+            "target_row": d.target_row,
+            "target_sheet": d.target_sheet,
+            "target_label": d.target_label,
+            "confidence": d.confidence,
+            "source": d.source,
+            "matched_rule_id": d.matched_rule_id,
+            "matched_precedent_id": d.matched_precedent_id,
+            "rules_version": version,
+            "decided_at": now,
+        })
+
+    if rows:
+        db = get_supabase()
+        db.table("classification_memo").upsert(
+            rows, on_conflict="firm_id,term_norm,entity_type,document_type"
+        ).execute()
+    return len(rows)
+
+
+def record_review(firm_id: str, entity_type: str, term: str, target_row: int, target_sheet: str, target_label: Optional[str] = None) -> None:
+    """Remember a CA's approve/correct decision for every document type."""
+    db = get_supabase()
+    db.table("classification_memo").upsert({
+        "firm_id": firm_id,
+        "term_norm": normalize_indian_term(term),
+        "entity_type": entity_type,
+        "document_type": ANY_DOCUMENT,
+        "target_row": target_row,
+        "target_sheet": target_sheet,
+        "target_label": target_label,
+        "confidence": 1.0,
+        "source": "ca_reviewed",
+        "rules_version": rules_version(),
+        "decided_at": datetime.now(timezone.utc).isoformat(),
+    }, on_conflict="firm_id,term_norm,entity_type,document_type").execute()
+
+
+def invalidate_term(firm_id: Optional[str], term: str, precedent_id: Optional[str] = None) -> None:
+    """Drop memos affected by a precedent change — one firm's, or every firm's when firm_id is None.
+
+    Covers memos for the precedent's own term and, given *precedent_id*, any memo
+    that was decided from that precedent under a different term. Memos for
+    near-matching terms decided by other tiers are not touched (see the module
+    docstring).
+    """
+    db = get_supabase()
+    query = db.table("classification_memo").delete().eq("term_norm", normalize_indian_term(term))
+    if firm_id is not None:
+        query = query.eq("firm_id", firm_id)
+    query.execute()
+
+    if precedent_id:
+        query = db.table("classification_memo").delete().eq("matched_precedent_id", str(precedent_id))
+        if firm_id is not None:
+            query = query.eq("firm_id", firm_id)
+        query.execute()
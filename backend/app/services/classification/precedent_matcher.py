@@ -138,7 +138,23 @@ def create_precedent(
             .eq("firm_id", firm_id)
             .execute()
         )
-        return res.data[0] if res.data else payload
+        saved = res.data[0] if res.data else {**payload, "id": existing.data[0]["id"]}
     else:
         res = db.table("classification_precedents").insert(payload).execute()
-        return res.data[0] if res.data else payload
+        saved = res.data[0] if res.data else payload
+
+    # Memoised decisions for this term may now contradict the precedent
+    try:
+        from app.services.classification.memo import invalidate_term
+        invalidate_term(firm_id, source_term, saved.get("id"))
+    except Exception as e:
+        logger.warning("Failed to invalidate classification memo for '%s': %s", source_term, e)
+
+    # Keep the firm's Tier 2.5 index in step without a full refit
+    try:
+        from app.services.classification.vector_matcher import add_precedent
+        add_precedent(firm_id, saved)
+    except Exception as e:
+        logger.warning("Failed to update vector index for precedent '%s': %s", source_term, e)
+
+    return saved
@@ -0,0 +1,133 @@
+"""
+Per-batch prompt construction for Tier 3 (Gemini) classification.
+
+Instead of serialising every rule into every batch, each batch carries only
+the top-k candidate rules and firm precedents for its own items, picked with
+the Tier 2.5 vector index (or the fuzzy rule matcher when no index is loaded).
+"""
+
+import json
+from typing import Any, Dict, Hashable, List, Optional
+
+from pydantic import BaseModel
+
+from app.services.classification.prompts import CLASSIFICATION_USER_PROMPT
+from app.services.classification.rule_matcher import match_item_to_rules
+from app.services.classification.rules_loader import ClassificationRule
+from app.services.classification.vector_matcher import TfidfIndex
+from app.services.gemini_client import estimate_tokens
+
+RULES_TOP_K = 5
+PRECEDENTS_TOP_K = 3
+
+# Loosely similar precedents are left out — the prompt tells the model to ALWAYS follow them
+PRECEDENT_MIN_SCORE = 0.60
+
+
+class BatchPrompt(BaseModel):
+    prompt: str
+    rules_count: int
+    precedents_count: int
+    prompt_tokens_saved: int
+
+
+def _compact_rule(rule: ClassificationRule) -> Dict[str, Any]:
+    return {"id": rule.id, "terms": rule.source_terms, "row": rule.target_row, "sheet": rule.target_sheet}
+
+
+class PromptBuilder:
+    def __init__(
+        self,
+        entity_type: str,
+        rules: List[ClassificationRule],
+        index: Optional[TfidfIndex] = None,
+    ) -> None:
+        self.entity_type = entity_type
+        self.rules = rules
+        self.rules_by_id = {r.id: r for r in rules}
+        self.index = index
+        self.full_rules_json = json.dumps([_compact_rule(r) for r in rules])
+        self.full_rules_tokens = estimate_tokens(self.full_rules_json)
+        self._shortlists: Dict[str, tuple[List[int], List[Dict[str, Any]]]] = {}
+
+    @property
+    def shared_tokens(self) -> int:
+        """Per-batch prompt context that does not depend on the items (template only)."""
+        template = CLASSIFICATION_USER_PROMPT.format(
+            entity_type=self.entity_type, batch_note="", rules_json="[]", precedents_json="[]", items_json="",
+        )
+        return estimate_tokens(template)
+
+    def context_tokens(self, item: Dict[str, Any]) -> Dict[Hashable, int]:
+        """Prompt context one item pulls in, keyed so plan_batches counts shared entries once."""
+        rule_ids, precedents = self.shortlist(item["item_name"])
+        entries: Dict[Hashable, int] = {}
+        for rid in rule_ids:
+            entries[("rule", rid)] = estimate_tokens(json.dumps(_compact_rule(self.rules_by_id[rid]))) + 1
+        for p in precedents:
+            entries[("precedent", p["term"], p["row"], p["sheet"])] = estimate_tokens(json.dumps(p)) + 1
+        if not rule_ids:
+            # No candidate rules: build() falls back to the full list
+            entries[("rules", "all")] = self.full_rules_tokens
+        return entries
+
+    def shortlist(self, item_name: str) -> tuple[List[int], List[Dict[str, Any]]]:
+        """Candidate rule ids and precedents for one item (memoised per builder)."""
+        cached = self._shortlists.get(item_name)
+        if cached is None:
+            cached = self._shortlists[item_name] = self._shortlist(item_name)
+        return cached
+
+    def _shortlist(self, item_name: str) -> tuple[List[int], List[Dict[str, Any]]]:
+        rule_ids: List[int] = []
+        precedents: List[Dict[str, Any]] = []
+
+        if self.index is not None:
+            for m in self.index.candidates(item_name, RULES_TOP_K * 2, kind="rule"):
+                rule_id = int(m.ref_id.split(".")[0])
+                if rule_id in self.rules_by_id and rule_id not in rule_ids:
+                    rule_ids.append(rule_id)
+                if len(rule_ids) >= RULES_TOP_K:
+                    break
+
+            for m in self.index.candidates(item_name, PRECEDENTS_TOP_K, kind="precedent"):
+                if m.score >= PRECEDENT_MIN_SCORE:
+                    precedents.append({"term": m.matched_term, "row": m.target_row, "sheet": m.target_sheet})
+        else:
+            rule_ids = [m.rule.id for m in match_item_to_rules(item_name, self.rules)[:RULES_TOP_K]]
+
+        return rule_ids, precedents
+
+    def build(self, batch_items: List[Dict[str, Any]], batch_note: str) -> BatchPrompt:
+        rule_ids: Dict[int, None] = {}
+        precedents: Dict[tuple, Dict[str, Any]] = {}
+
+        for item in batch_items:
+            ids, precs = self.shortlist(item["item_name"])
+            for rid in ids:
+                rule_ids.setdefault(rid, None)
+            for p in precs:
+                precedents.setdefault((p["term"], p["row"], p["sheet"]), p)
+
+        if rule_ids:
+            rules_json = json.dumps([_compact_rule(self.rules_by_id[rid]) for rid in rule_ids])
+        else:
+            # Nothing resembles any rule — give the model the full list rather than none
+            rules_json = self.full_rules_json
+        precedents_json = json.dumps(list(precedents.values()))
+
+        shortlisted_tokens = estimate_tokens(rules_json) + estimate_tokens(precedents_json)
+        prompt = CLASSIFICATION_USER_PROMPT.format(
+            entity_type=self.entity_type,
+            batch_note=batch_note,
+            rules_json=rules_json,
+            precedents_json=precedents_json,
+            items_json=json.dumps(batch_items),
+        )
+
+        return BatchPrompt(
+            prompt=prompt,
+            rules_count=len(rule_ids) or len(self.rules),
+            precedents_count=len(precedents),
+            prompt_tokens_saved=max(self.full_rules_tokens + estimate_tokens("[]") - shortlisted_tokens, 0),
+        )
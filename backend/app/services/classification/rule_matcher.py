@@ -38,8 +38,8 @@ def filter_rules(entity_type: str, document_type: str) -> List[ClassificationRul
     for rule in all_rules:
         # Check entity
         if entity_type in rule.entity_types or not rule.entity_types:
-            # Check document
-            if document_type in rule.document_types or not rule.document_types:
+            # Check document (empty document_type = any document)
+            if not document_type or document_type in rule.document_types or not rule.document_types:
                 filtered.append(rule)
                 
     return filtered
@@ -0,0 +1,312 @@
+"""
+Tier 2.5: local similarity classifier between rule matching and Gemini.
+
+Character n-gram TF-IDF over normalised terms, fitted per (firm, entity type)
+from the firm's precedents, global precedents and the global rule terms.
+Queries are a cosine top-k against that index; only high-margin predictions
+(best label clearly ahead of the runner-up) are accepted by the classifier.
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from app.db.supabase_client import get_supabase
+from app.services.classification.rule_matcher import filter_rules, normalize_indian_term
+
+logger = logging.getLogger(__name__)
+
+NGRAM_MIN = 2
+NGRAM_MAX = 4
+TOP_K = 5
+
+# Acceptance thresholds used by classify_project
+VECTOR_MIN_SCORE = 0.70
+VECTOR_MIN_MARGIN = 0.20
+
+# Rebuild from the DB after this long so other workers' precedents show up
+INDEX_TTL_SECONDS = 900
+
+
+class VectorMatch(BaseModel):
+    target_row: int
+    target_sheet: str
+    target_label: str
+    score: float
+    margin: float
+    matched_term: str
+    kind: str  # "precedent" | "rule"
+    ref_id: str
+
+
+def char_ngrams(term: str) -> Dict[str, int]:
+    """Count character n-grams of the normalised, space-padded term."""
+    padded = f" {normalize_indian_term(term)} "
+    counts: Dict[str, int] = {}
+    for n in range(NGRAM_MIN, NGRAM_MAX + 1):
+        for i in range(len(padded) - n + 1):
+            gram = padded[i:i + n]
+            counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+class TfidfIndex:
+    """Incrementally built char n-gram TF-IDF index with cosine top-k search.
+
+    Documents are keyed by (kind, ref_id); adding an existing key replaces the
+    old document, so an updated precedent never competes with its old label.
+    """
+
+    def __init__(self) -> None:
+        self._vocab: Dict[str, int] = {}
+        self._df: List[int] = []
+        self._docs: List[Optional[Tuple[np.ndarray, np.ndarray]]] = []
+        self._meta: List[Tuple[str, int, str, str, str, str]] = []
+        self._by_key: Dict[Tuple[str, str], int] = {}
+        self._live = 0
+        self._lock = threading.RLock()
+
+        # Compiled CSR matrix of L2-normalised TF-IDF rows
+        self._dirty = True
+        self._idf = np.zeros(0)
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int64)
+        self._data = np.zeros(0)
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._row_kinds = np.zeros(0, dtype=object)
+
+    def __len__(self) -> int:
+        return self._live
+
+    def add(self, term: str, target_row: int, target_sheet: str, target_label: str, kind: str, ref_id: str) -> None:
+        if not term or not term.strip():
+            return
+        grams = char_ngrams(term)
+
+        with self._lock:
+            key = (kind, str(ref_id))
+            if key in self._by_key:
+                self._remove(self._by_key[key])
+            self._append(grams, (target_sheet, target_row, target_label, term, kind, str(ref_id)))
+            self._by_key[key] = len(self._docs) - 1
+
+    def _append(self, grams: Dict[str, int], meta: Tuple[str, int, str, str, str, str]) -> None:
+        ids = np.empty(len(grams), dtype=np.int64)
+        tfs = np.empty(len(grams))
+        for i, (gram, count) in enumerate(grams.items()):
+            gid = self._vocab.get(gram)
+            if gid is None:
+                gid = len(self._df)
+                self._vocab[gram] = gid
+                self._df.append(0)
+            self._df[gid] += 1
+            ids[i] = gid
+            tfs[i] = 1.0 + math.log(count)
+
+        self._docs.append((ids, tfs))
+        self._meta.append(meta)
+        self._live += 1
+        self._dirty = True
+
+    def _remove(self, doc_idx: int) -> None:
+        doc = self._docs[doc_idx]
+        if doc is None:
+            return
+        for gid in doc[0]:
+            self._df[gid] -= 1
+        self._docs[doc_idx] = None
+        self._live -= 1
+        self._dirty = True
+
+    def _compile(self) -> None:
+        n_docs = max(self._live, 1)
+        df = np.asarray(self._df, dtype=float)
+        self._idf = np.log((1.0 + n_docs) / (1.0 + df)) + 1.0
+
+        rows, indptr, indices, data = [], [0], [], []
+        for doc_idx, doc in enumerate(self._docs):
+            if doc is None:
+                continue
+            ids, tfs = doc
+            weights = tfs * self._idf[ids]
+            weights = weights / np.linalg.norm(weights)
+            rows.append(doc_idx)
+            indices.append(ids)
+            data.append(weights)
+            indptr.append(indptr[-1] + len(ids))
+
+        self._rows = np.asarray(rows, dtype=np.int64)
+        self._row_kinds = np.asarray([self._meta[r][4] for r in rows], dtype=object)
+        self._indptr = np.asarray(indptr, dtype=np.int64)
+        self._indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+        self._data = np.concatenate(data) if data else np.zeros(0)
+        self._dirty = False
+
+    def _query_vector(self, term: str) -> Optional[np.ndarray]:
+        grams = char_ngrams(term)
+        if not grams:
+            return None
+
+        n_docs = max(self._live, 1)
+        unseen_idf = math.log(1.0 + n_docs) + 1.0
+        qvec = np.zeros(len(self._idf))
+        norm_sq = 0.0
+        for gram, count in grams.items():
+            gid = self._vocab.get(gram)
+            idf = self._idf[gid] if gid is not None and gid < len(self._idf) else unseen_idf
+            w = (1.0 + math.log(count)) * idf
+            norm_sq += w * w
+            if gid is not None and gid < len(qvec):
+                qvec[gid] = w
+        if norm_sq == 0.0:
+            return None
+        return qvec / math.sqrt(norm_sq)
+
+    def search(self, term: str, k: int = TOP_K, kind: Optional[str] = None) -> List[Tuple[int, float]]:
+        """Return up to *k* (doc_index, cosine) pairs, best first, optionally for one document kind."""
+        with self._lock:
+            if self._live == 0:
+                return []
+            if self._dirty:
+                self._compile()
+
+            qvec = self._query_vector(term)
+            if qvec is None:
+                return []
+
+            contrib = self._data * qvec[self._indices]
+            scores = np.add.reduceat(contrib, self._indptr[:-1])
+            if kind is not None:
+                scores[self._row_kinds != kind] = 0.0
+            rows = self._rows
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top if scores[i] > 0.0]
+
+    def best_match(self, term: str, k: int = TOP_K) -> Optional[VectorMatch]:
+        """Best label among the top-k neighbours, with its margin over the runner-up label."""
+        hits = self.search(term, k)
+        if not hits:
+            return None
+
+        best_by_label: Dict[Tuple[str, int], Tuple[float, int]] = {}
+        for doc_idx, score in hits:
+            sheet, row = self._meta[doc_idx][:2]
+            if (sheet, row) not in best_by_label or score > best_by_label[(sheet, row)][0]:
+                best_by_label[(sheet, row)] = (score, doc_idx)
+
+        ranked = sorted(best_by_label.values(), key=lambda x: x[0], reverse=True)
+        best_score, best_doc = ranked[0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+
+        sheet, row, label, matched_term, kind, ref_id = self._meta[best_doc]
+        return VectorMatch(
+            target_row=row,
+            target_sheet=sheet,
+            target_label=label,
+            score=round(best_score, 4),
+            margin=round(best_score - runner_up, 4),
+            matched_term=matched_term,
+            kind=kind,
+            ref_id=ref_id,
+        )
+
+    def candidates(self, term: str, k: int = TOP_K, kind: Optional[str] = None) -> List[VectorMatch]:
+        """Top-k neighbouring documents (margin not computed), optionally restricted to one kind."""
+        out = []
+        for doc_idx, score in self.search(term, k, kind):
+            sheet, row, label, matched_term, doc_kind, ref_id = self._meta[doc_idx]
+            out.append(VectorMatch(
+                target_row=row,
+                target_sheet=sheet,
+                target_label=label,
+                score=round(score, 4),
+                margin=0.0,
+                matched_term=matched_term,
+                kind=doc_kind,
+                ref_id=ref_id,
+            ))
+        return out
+
+
+# ── Per-firm index cache ──────────────────────────────────────────────────
+_indexes: Dict[Tuple[str, str], Tuple[TfidfIndex, float]] = {}
+_lock = threading.Lock()
+
+
+def _load_precedent_rows(firm_id: str) -> List[dict]:
+    db = get_supabase()
+    res = (
+        db.table("classification_precedents")
+        .select("id, firm_id, source_term, target_row, target_sheet, entity_type, scope")
+        .or_(f"firm_id.eq.{firm_id},scope.eq.global")
+        .execute()
+    )
+    return res.data or []
+
+
+def build_index(firm_id: str, entity_type: str) -> TfidfIndex:
+    """Fit a fresh index from the global rules plus firm + global precedents."""
+    index = TfidfIndex()
+
+    for rule in filter_rules(entity_type, ""):
+        for i, term in enumerate(rule.source_terms):
+            index.add(term, rule.target_row, rule.target_sheet, rule.target_label, "rule", f"{rule.id}.{i}")
+
+    try:
+        precedent_rows = _load_precedent_rows(firm_id)
+    except Exception as e:
+        logger.warning("Failed to load precedents for vector index: %s", e)
+        precedent_rows = []
+
+    for p in precedent_rows:
+        if p.get("entity_type") != entity_type:
+            continue
+        index.add(p["source_term"], p["target_row"], p["target_sheet"], "Precedent matched", "precedent", p["id"])
+
+    logger.info("Fitted vector index for firm %s/%s: %d documents", firm_id, entity_type, len(index))
+    return index
+
+
+def get_firm_index(firm_id: str, entity_type: str) -> TfidfIndex:
+    key = (str(firm_id), entity_type)
+    with _lock:
+        cached = _indexes.get(key)
+        if cached and time.time() - cached[1] < INDEX_TTL_SECONDS:
+            return cached[0]
+
+    index = build_index(str(firm_id), entity_type)
+    with _lock:
+        _indexes[key] = (index, time.time())
+    return index
+
+
+def add_precedent(firm_id: str, precedent: dict) -> None:
+    """Incrementally fold a created/updated precedent into any loaded index for the firm."""
+    if not precedent or "id" not in precedent:
+        return
+    key = (str(firm_id), precedent.get("entity_type", ""))
+    with _lock:
+        cached = _indexes.get(key)
+        if cached:
+            cached[0].add(
+                precedent["source_term"], precedent["target_row"], precedent["target_sheet"],
+                "Precedent matched", "precedent", precedent["id"],
+            )
+
+
+def invalidate(firm_id: Optional[str] = None) -> None:
+    """Drop cached indexes for one firm, or for every firm when firm_id is None."""
+    with _lock:
+        if firm_id is None:
+            _indexes.clear()
+            return
+        for key in [k for k in _indexes if k[0] == str(firm_id)]:
+            del _indexes[key]
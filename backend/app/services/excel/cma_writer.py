@@ -1,34 +1,269 @@
+"""
+CMA workbook writer.
+
+The macro-enabled template is parsed once per process (re-parsed when its
+mtime changes) into its raw zip parts plus a sheet-name → worksheet-part map.
+Each generation then patches only the column E cells of the touched
+worksheets' XML and re-zips; the VBA project, styles and every other part
+are copied through untouched. calcChain.xml is dropped and fullCalcOnLoad
+set so Excel recomputes formulas that depend on the written cells.
+
+Templates whose column E holds shared-formula masters cannot be patched
+safely cell by cell, so they fall back to openpyxl (loaded from the cached
+bytes rather than from disk).
+"""
+
+import hashlib
+import io
 import logging
 import os
-from typing import Dict, Any
+import posixpath
+import re
+import threading
+import zipfile
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
 import openpyxl
 
+from app.services.excel.formulas import MAX_ROW
+
 logger = logging.getLogger(__name__)
 
+# Column E = 'Estimated Year' for V1
+VALUE_COLUMN = "E"
+VALUE_COLUMN_INDEX = 5
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_ROW_RE = re.compile(r'<row\b([^>]*?)(/>|>(.*?)</row>)', re.S)
+_CELL_RE = re.compile(r'<c\b([^>]*?)(/>|>(.*?)</c>)', re.S)
+_ATTR_R_RE = re.compile(r'\br="([A-Z]+)?(\d+)"')
+_SHARED_MASTER_RE = re.compile(r'<c\b[^>]*\br="%s\d+"[^>]*>(?:(?!</c>).)*<f\b[^>]*\bt="shared"[^>]*\bref="' % VALUE_COLUMN, re.S)
+
+OutputTarget = Union[str, BinaryIO]
+
+# Bump when a change here alters the bytes written for the same data and template
+WRITER_VERSION = 1
+
+
+def _column_index(letters: str) -> int:
+    idx = 0
+    for ch in letters:
+        idx = idx * 26 + (ord(ch) - 64)
+    return idx
+
+
+class CompiledTemplate:
+    """Raw parts of a template package, read once."""
+
+    def __init__(self, template_path: str) -> None:
+        with open(template_path, "rb") as f:
+            self.raw = f.read()
+        self.digest = hashlib.sha256(self.raw).hexdigest()
+
+        self.parts: List[Tuple[zipfile.ZipInfo, bytes]] = []
+        with zipfile.ZipFile(io.BytesIO(self.raw)) as zf:
+            for info in zf.infolist():
+                self.parts.append((info, zf.read(info)))
+
+        contents = {info.filename: data for info, data in self.parts}
+        self.sheet_parts = self._map_sheets(contents)
+        self.sheetnames = list(self.sheet_parts)
+        self.patchable = not any(
+            _SHARED_MASTER_RE.search(contents[part].decode("utf-8")) for part in self.sheet_parts.values()
+        )
+
+    @staticmethod
+    def _map_sheets(contents: Dict[str, bytes]) -> Dict[str, str]:
+        """Sheet name → worksheet part path, in workbook order."""
+        rels = ElementTree.fromstring(contents["xl/_rels/workbook.xml.rels"])
+        targets = {}
+        for rel in rels.findall(f"{{{_NS_PKG_REL}}}Relationship"):
+            target = rel.get("Target", "")
+            targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+
+        workbook = ElementTree.fromstring(contents["xl/workbook.xml"])
+        sheets = {}
+        for sheet in workbook.iter(f"{{{_NS_MAIN}}}sheet"):
+            sheets[sheet.get("name")] = targets[sheet.get(f"{{{_NS_REL}}}id")]
+        return sheets
+
+
+_template_cache: Dict[str, Tuple[float, CompiledTemplate]] = {}
+_template_lock = threading.Lock()
+
+
+def get_template(template_path: str) -> CompiledTemplate:
+    """Compiled template for *template_path*, re-read only when the file's mtime changes."""
+    key = os.path.abspath(template_path)
+    mtime = os.path.getmtime(key)
+    with _template_lock:
+        cached = _template_cache.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        template = CompiledTemplate(key)
+        _template_cache[key] = (mtime, template)
+        return template
+
+
+def _cell_xml(ref: str, attrs: str, value: Any) -> str:
+    # Keep the template's style; drop type/formula so the cell holds our value
+    attrs = re.sub(r'\s+t="[^"]*"', "", attrs)
+    attrs = re.sub(r'\s*\br="[^"]*"', "", attrs)
+    if value is None:
+        return f'<c r="{ref}"{attrs}/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}"{attrs}><v>{value!r}</v></c>'
+    return f'<c r="{ref}"{attrs} t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def _patch_row(row_num: int, attrs: str, body: str, value: Any) -> str:
+    ref = f"{VALUE_COLUMN}{row_num}"
+    new_cell = None
+    insert_at = len(body)
+
+    for m in _CELL_RE.finditer(body):
+        r = _ATTR_R_RE.search(m.group(1))
+        col = _column_index(r.group(1)) if r and r.group(1) else 0
+        if col == VALUE_COLUMN_INDEX:
+            new_cell = _cell_xml(ref, m.group(1), value)
+            body = body[:m.start()] + new_cell + body[m.end():]
+            break
+        if col > VALUE_COLUMN_INDEX:
+            insert_at = m.start()
+            break
+
+    if new_cell is None:
+        body = body[:insert_at] + _cell_xml(ref, "", value) + body[insert_at:]
+
+    # spans is only a load hint and may no longer cover column E
+    attrs = re.sub(r'\s+spans="[^"]*"', "", attrs)
+    return f"<row{attrs}>{body}</row>"
+
+
+def patch_sheet_xml(xml: str, values: Dict[int, Any]) -> str:
+    """Set column E of each row in *values*, adding rows/cells the template lacks."""
+    pending = sorted(values)
+
+    def emit_missing(below: Optional[int]) -> str:
+        out = []
+        while pending and (below is None or pending[0] < below):
+            r = pending.pop(0)
+            out.append(_patch_row(r, f' r="{r}"', "", values[r]))
+        return "".join(out)
+
+    def on_row(m: re.Match) -> str:
+        r = _ATTR_R_RE.search(m.group(1))
+        row_num = int(r.group(2)) if r else None
+        prefix = emit_missing(row_num)
+        if row_num in values and pending and pending[0] == row_num:
+            pending.pop(0)
+            return prefix + _patch_row(row_num, m.group(1), m.group(3) or "", values[row_num])
+        return prefix + m.group(0)
+
+    patched = _ROW_RE.sub(on_row, xml)
+    rest = emit_missing(None)
+    if rest:
+        if "<sheetData/>" in patched:
+            patched = patched.replace("<sheetData/>", f"<sheetData>{rest}</sheetData>", 1)
+        else:
+            patched = patched.replace("</sheetData>", rest + "</sheetData>", 1)
+    return patched
+
+
+def _force_recalc(workbook_xml: str) -> str:
+    if "<calcPr" in workbook_xml:
+        return re.sub(r"<calcPr\b([^>]*?)\s*/>",
+                      lambda m: "<calcPr%s fullCalcOnLoad=\"1\"/>" % re.sub(r'\s+fullCalcOnLoad="[^"]*"', "", m.group(1)),
+                      workbook_xml, count=1)
+    # Schema order: calcPr follows sheets / externalReferences / definedNames
+    for anchor in (r"</definedNames>|<definedNames\b[^>]*/>", r"</externalReferences>", r"</sheets>"):
+        m = re.search(anchor, workbook_xml)
+        if m:
+            return workbook_xml[:m.end()] + '<calcPr fullCalcOnLoad="1"/>' + workbook_xml[m.end():]
+    return workbook_xml
+
+
+def _drop_calc_chain(name: str, data: bytes) -> bytes:
+    text = data.decode("utf-8")
+    if name == "[Content_Types].xml":
+        text = re.sub(r'<Override\b[^>]*PartName="/xl/calcChain\.xml"[^>]*/>', "", text)
+    elif name == "xl/_rels/workbook.xml.rels":
+        text = re.sub(r'<Relationship\b[^>]*Target="/?(?:xl/)?calcChain\.xml"[^>]*/>', "", text)
+    return text.encode("utf-8")
+
 
 class CMAWriter:
     def __init__(self, template_path: str) -> None:
-        """Load the CMA template."""
+        """Load the CMA template (parsed once per process and mtime)."""
         if not os.path.exists(template_path):
             raise FileNotFoundError("CMA template not found. Set CMA_TEMPLATE_PATH env var.")
 
         self.template_path = template_path
-        self.workbook = openpyxl.load_workbook(template_path, keep_vba=True)
+        self.template = get_template(template_path)
+
+    @property
+    def template_version(self) -> str:
+        """Identifies the template contents and writer logic that together determine the output."""
+        return f"{WRITER_VERSION}:{self.template.digest}"
+
+    def write(self, data: Dict[str, Any], output: OutputTarget) -> OutputTarget:
+        """Write classified data into the CMA template and save to a path or binary stream."""
+        if not self.template.patchable:
+            return self._write_openpyxl(data, output)
 
-    def write(self, data: Dict[str, Any], output_path: str) -> str:
-        """Write classified data into CMA template and save."""
         rows_written = 0
         rows_skipped = 0
+        sheet_values: Dict[str, Dict[int, Any]] = {}
 
         for sheet_name, rows_data in data.items():
-            if sheet_name in self.workbook.sheetnames:
-                ws = self.workbook[sheet_name]
+            if sheet_name not in self.template.sheet_parts:
+                logger.warning("Sheet '%s' not found in CMA template", sheet_name)
+                continue
+            values = sheet_values.setdefault(self.template.sheet_parts[sheet_name], {})
+            for row_idx, amount in rows_data.items():
+                try:
+                    values[int(row_idx)] = amount
+                    rows_written += 1
+                except (ValueError, TypeError):
+                    rows_skipped += 1
+                    logger.warning("Skipped non-integer row key '%s' in sheet '%s'", row_idx, sheet_name)
+
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zf:
+            for info, raw in self.template.parts:
+                name = info.filename
+                if name == "xl/calcChain.xml":
+                    continue
+                if name in sheet_values:
+                    raw = patch_sheet_xml(raw.decode("utf-8"), sheet_values[name]).encode("utf-8")
+                elif name == "xl/workbook.xml":
+                    raw = _force_recalc(raw.decode("utf-8")).encode("utf-8")
+                elif name in ("[Content_Types].xml", "xl/_rels/workbook.xml.rels"):
+                    raw = _drop_calc_chain(name, raw)
+                # Fresh ZipInfo: writestr mutates it, and the cached one is shared across generations
+                out_info = zipfile.ZipInfo(name, date_time=info.date_time)
+                out_info.compress_type = info.compress_type
+                out_info.external_attr = info.external_attr
+                zf.writestr(out_info, raw)
+
+        logger.info("CMA write complete: %d rows written, %d skipped", rows_written, rows_skipped)
+        return output
+
+    def _write_openpyxl(self, data: Dict[str, Any], output: OutputTarget) -> OutputTarget:
+        workbook = openpyxl.load_workbook(io.BytesIO(self.template.raw), keep_vba=True)
+        rows_written = 0
+        rows_skipped = 0
+
+        for sheet_name, rows_data in data.items():
+            if sheet_name in workbook.sheetnames:
+                ws = workbook[sheet_name]
                 for row_idx, amount in rows_data.items():
                     try:
-                        row_idx_int = int(row_idx)
-                        # Column E (5) = 'Estimated Year' for V1
-                        cell = ws.cell(row=row_idx_int, column=5)
-                        cell.value = amount
+                        ws.cell(row=int(row_idx), column=VALUE_COLUMN_INDEX).value = amount
                         rows_written += 1
                     except (ValueError, TypeError):
                         rows_skipped += 1
@@ -36,13 +271,13 @@ class CMAWriter:
             else:
                 logger.warning("Sheet '%s' not found in CMA template", sheet_name)
 
-        logger.info("CMA write complete: %d rows written, %d skipped", rows_written, rows_skipped)
-        self.workbook.save(output_path)
-        return output_path
+        logger.info("CMA write complete (openpyxl): %d rows written, %d skipped", rows_written, rows_skipped)
+        workbook.save(output)
+        return output
 
     def get_template_info(self) -> Dict[str, Any]:
         """Return template structure info (sheets, rows)."""
         return {
-            "sheets": self.workbook.sheetnames,
-            "total_rows": 289,
+            "sheets": self.template.sheetnames,
+            "total_rows": MAX_ROW,
         }
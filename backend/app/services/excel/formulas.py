@@ -0,0 +1,164 @@
+"""
+Computed CMA rows (subtotals, gross profit, ...) as a small formula engine.
+
+Formulas are declared in computed_rows.json as signed sums of other rows on
+the same sheet; an operand may be a row number or an inclusive "13:24"
+range. They are topologically sorted once at load, so a subtotal may depend
+on other subtotals in any order, and compiled into a flat per-sheet plan of
+(target row, operand indices, coefficients) steps. Evaluation fills a dense
+array indexed by row number and runs the plan in a single pass.
+
+A formula with skip_if_zero leaves the row's own value in place when it
+evaluates to zero, for subtotals that statements sometimes report directly.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+FORMULAS_PATH = os.path.join(os.path.dirname(__file__), "computed_rows.json")
+# Last row of the CMA template's sheets; rows outside 1..MAX_ROW cannot be written
+MAX_ROW = 289
+
+RowRef = Union[int, str]
+SheetData = Dict[str, Dict[int, float]]
+
+
+class Formula(BaseModel):
+    sheet: str
+    row: int
+    label: str
+    add: List[RowRef] = []
+    subtract: List[RowRef] = []
+    skip_if_zero: bool = False
+
+
+def _expand(refs: List[RowRef]) -> List[int]:
+    rows: List[int] = []
+    for ref in refs:
+        if isinstance(ref, str) and ":" in ref:
+            start, end = (int(part) for part in ref.split(":", 1))
+            rows.extend(range(start, end + 1))
+        else:
+            rows.append(int(ref))
+    return rows
+
+
+class _Step:
+    __slots__ = ("row", "operands", "coefficients", "skip_if_zero")
+
+    def __init__(self, formula: Formula) -> None:
+        terms: Dict[int, float] = {}
+        for r in _expand(formula.add):
+            terms[r] = terms.get(r, 0.0) + 1.0
+        for r in _expand(formula.subtract):
+            terms[r] = terms.get(r, 0.0) - 1.0
+        self.row = formula.row
+        self.operands = np.fromiter(terms.keys(), dtype=np.intp, count=len(terms))
+        self.coefficients = np.fromiter(terms.values(), dtype=np.float64, count=len(terms))
+        self.skip_if_zero = formula.skip_if_zero
+
+
+def _order(formulas: List[Formula]) -> List[Formula]:
+    """Dependencies first, otherwise in declaration order; raises ValueError on a cycle."""
+    by_row = {f.row: f for f in formulas}
+    deps = {f.row: {r for r in _expand(f.add) + _expand(f.subtract) if r in by_row and r != f.row} for f in formulas}
+    for f in formulas:
+        if f.row in _expand(f.add) + _expand(f.subtract):
+            raise ValueError(f"Computed row {f.sheet}!{f.row} ({f.label}) refers to itself")
+
+    ordered: List[Formula] = []
+    done: Set[int] = set()
+    while len(ordered) < len(formulas):
+        ready = [f for f in formulas if f.row not in done and deps[f.row] <= done]
+        if not ready:
+            stuck = sorted(r for r in by_row if r not in done)
+            raise ValueError(f"Circular computed rows on sheet '{formulas[0].sheet}': {stuck}")
+        for f in ready:
+            ordered.append(f)
+            done.add(f.row)
+    return ordered
+
+
+class FormulaEngine:
+    """Compiled evaluation plan for a set of row formulas."""
+
+    def __init__(self, formulas: List[Formula]) -> None:
+        grouped: Dict[str, List[Formula]] = {}
+        for f in formulas:
+            sheet_formulas = grouped.setdefault(f.sheet, [])
+            if any(existing.row == f.row for existing in sheet_formulas):
+                raise ValueError(f"Computed row {f.sheet}!{f.row} is defined twice")
+            sheet_formulas.append(f)
+
+        self.plans: Dict[str, List[_Step]] = {}
+        for sheet, sheet_formulas in grouped.items():
+            steps = [_Step(f) for f in _order(sheet_formulas)]
+            for step in steps:
+                if not 1 <= step.row <= MAX_ROW or not np.all((step.operands >= 1) & (step.operands <= MAX_ROW)):
+                    raise ValueError(f"Computed row {sheet}!{step.row} uses rows outside 1..{MAX_ROW}")
+            self.plans[sheet] = steps
+
+    def computed_rows(self, sheet: str) -> List[int]:
+        return [step.row for step in self.plans.get(sheet, [])]
+
+    def evaluate_sheet(self, sheet: str, values: Dict[int, float]) -> Tuple[np.ndarray, Set[int]]:
+        """Dense row-indexed array of *values* with the sheet's formulas applied, and the rows they set.
+
+        Raises ValueError for a row outside 1..MAX_ROW rather than letting numpy wrap or grow the array.
+        """
+        dense = np.zeros(MAX_ROW + 1, dtype=np.float64)
+        if values:
+            rows = np.fromiter(values.keys(), dtype=np.intp, count=len(values))
+            if rows.min() < 1 or rows.max() > MAX_ROW:
+                raise ValueError(f"Sheet '{sheet}' has rows outside 1..{MAX_ROW}")
+            dense[rows] = np.fromiter(values.values(), dtype=np.float64, count=len(values))
+
+        written: Set[int] = set()
+        for step in self.plans.get(sheet, []):
+            total = float(step.coefficients @ dense[step.operands])
+            if step.skip_if_zero and total == 0.0:
+                continue
+            dense[step.row] = total
+            written.add(step.row)
+        return dense, written
+
+    def apply(self, data: SheetData) -> SheetData:
+        """Copy of {sheet: {row: amount}} with computed rows filled in for every sheet present."""
+        result: SheetData = {}
+        for sheet, values in data.items():
+            if sheet not in self.plans:
+                result[sheet] = dict(values)
+                continue
+            dense, written = self.evaluate_sheet(sheet, values)
+            result[sheet] = {row: float(dense[row]) for row in sorted(set(values) | written)}
+        return result
+
+
+def load_formulas(path: str = FORMULAS_PATH) -> List[Formula]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [Formula(**entry) for entry in data.get("formulas", [])]
+
+
+_engine: Optional[FormulaEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_formula_engine() -> FormulaEngine:
+    """Engine for computed_rows.json, compiled on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                formulas = load_formulas()
+                _engine = FormulaEngine(formulas)
+                logger.info("Compiled %d computed-row formulas", len(formulas))
+    return _engine
@@ -1,6 +1,8 @@
+import hashlib
+import io
+import json
 import logging
 import os
-import tempfile
 import time
 import uuid
 from typing import Dict, Any, List, Optional
@@ -24,6 +26,7 @@ class GenerationResult(BaseModel):
     warnings: List[str] = []
     generation_time_ms: int
     version: int
+    reused: bool = False  # nothing changed since the latest version, which was returned as-is
 
 
 def _get_template_path() -> str:
@@ -41,6 +44,17 @@ def _get_template_path() -> str:
     raise FileNotFoundError("CMA template not found. Set CMA_TEMPLATE_PATH env var or place CMA.xlsm in reference/.")
 
 
+def output_hash(transformed_data: Dict[str, Any], template_version: str, file_stem: str) -> str:
+    """Fingerprint of everything that determines a generated workbook and its name."""
+    payload = json.dumps(
+        {"data": transformed_data, "template": template_version, "name": file_stem},
+        sort_keys=True,
+        default=str,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 def generate_cma(project_id: str, firm_id: str, skip_validation: bool = False) -> GenerationResult:
     start_time = time.time()
     db = get_supabase()
@@ -94,65 +108,87 @@ def generate_cma(project_id: str, firm_id: str, skip_validation: bool = False) -
     items_list = classification_data.get("items", [])
     transformed_data = transform_for_writer(items_list, entity_type)
 
-    # 4. Resolve template and generate CMA Excel
+    # 4. Resolve template; skip rendering entirely if the output would match the latest version
     template_path = _get_template_path()
+    writer = CMAWriter(template_path)
+    fingerprint = output_hash(transformed_data, writer.template_version, f"{client_name_safe}_{financial_year}")
+
+    latest_resp = (
+        db.table("generated_files")
+        .select("id, version, file_name, storage_path, file_size_bytes, output_hash")
+        .eq("cma_project_id", project_id)
+        .order("version", desc=True)
+        .limit(1)
+        .execute()
+    )
+    latest = latest_resp.data[0] if latest_resp.data else None
 
-    fd, tmp_path = tempfile.mkstemp(suffix=".xlsm")
-    os.close(fd)
-
-    try:
-        writer = CMAWriter(template_path)
-        writer.write(transformed_data, tmp_path)
-
-        file_size = os.path.getsize(tmp_path)
-
-        # Version logic
-        gen_files = db.table("generated_files").select("version").eq("cma_project_id", project_id).execute()
-        current_version = max([gf["version"] for gf in gen_files.data], default=0) + 1
-
-        file_name = f"CMA_{client_name_safe}_{financial_year}_v{current_version}.xlsm"
-        storage_path = f"{firm_id}/{project_id}/generated/{file_name}"
-
-        with open(tmp_path, "rb") as f:
-            file_bytes = f.read()
-
-        db.storage.from_("cma-files").upload(
-            storage_path,
-            file_bytes,
-            {"content-type": "application/vnd.ms-excel.sheet.macroEnabled.12"},
-        )
-
-        gen_id = str(uuid.uuid4())
-        db.table("generated_files").insert({
-            "id": gen_id,
-            "firm_id": firm_id,
-            "cma_project_id": project_id,
-            "file_name": file_name,
-            "storage_path": storage_path,
-            "version": current_version,
-            "file_size_bytes": file_size,
-        }).execute()
-
+    if latest and latest.get("output_hash") == fingerprint:
+        logger.info("Project %s unchanged since v%s; reusing generated file", project_id, latest["version"])
         db.table("cma_projects").update({
             "status": "completed",
             "pipeline_progress": 100,
         }).eq("id", project_id).execute()
 
-        gen_time = int((time.time() - start_time) * 1000)
-
         return GenerationResult(
             success=True,
             project_id=project_id,
-            generated_file_id=gen_id,
-            file_name=file_name,
-            file_size=file_size,
-            storage_path=storage_path,
+            generated_file_id=latest["id"],
+            file_name=latest["file_name"],
+            file_size=latest.get("file_size_bytes") or 0,
+            storage_path=latest["storage_path"],
             validation=validation_res,
             warnings=warnings,
-            generation_time_ms=gen_time,
-            version=current_version,
+            generation_time_ms=int((time.time() - start_time) * 1000),
+            version=latest["version"],
+            reused=True,
         )
 
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+    # Generate straight into memory — no temp file, no read-back
+    buffer = io.BytesIO()
+    writer.write(transformed_data, buffer)
+    file_bytes = buffer.getvalue()  # shares the buffer's storage rather than copying it
+    file_size = len(file_bytes)
+
+    current_version = (latest["version"] if latest else 0) + 1
+
+    file_name = f"CMA_{client_name_safe}_{financial_year}_v{current_version}.xlsm"
+    storage_path = f"{firm_id}/{project_id}/generated/{file_name}"
+
+    db.storage.from_("cma-files").upload(
+        storage_path,
+        file_bytes,
+        {"content-type": "application/vnd.ms-excel.sheet.macroEnabled.12"},
+    )
+
+    gen_id = str(uuid.uuid4())
+    db.table("generated_files").insert({
+        "id": gen_id,
+        "firm_id": firm_id,
+        "cma_project_id": project_id,
+        "file_name": file_name,
+        "storage_path": storage_path,
+        "version": current_version,
+        "file_size_bytes": file_size,
+        "output_hash": fingerprint,
+    }).execute()
+
+    db.table("cma_projects").update({
+        "status": "completed",
+        "pipeline_progress": 100,
+    }).eq("id", project_id).execute()
+
+    gen_time = int((time.time() - start_time) * 1000)
+
+    return GenerationResult(
+        success=True,
+        project_id=project_id,
+        generated_file_id=gen_id,
+        file_name=file_name,
+        file_size=file_size,
+        storage_path=storage_path,
+        validation=validation_res,
+        warnings=warnings,
+        generation_time_ms=gen_time,
+        version=current_version,
+    )
@@ -0,0 +1,180 @@
+"""
+Firm-wide bulk export of generated CMA workbooks as one streamed ZIP.
+
+Storage objects are streamed a few at a time on a small thread pool, each
+chunk by chunk into a SpooledTemporaryFile (held in memory while small, on
+disk once it grows), while the ZIP is written to the response chunk by
+chunk. At most EXPORT_PREFETCH files are held locally at any moment, and
+none is ever held whole in memory unless it is under SPOOL_MAX_MEMORY.
+
+Archive entries are named <first 8 characters of the project id>_<file name>,
+from the row alone, so a project's entry is named the same in every export.
+"""
+
+import logging
+import os
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.db.supabase_client import get_supabase
+from app.services.storage import download_to
+
+logger = logging.getLogger(__name__)
+
+EXPORT_PREFETCH = int(os.getenv("EXPORT_PREFETCH", "4"))
+EXPORT_CHUNK_SIZE = 1024 * 1024  # 1MB
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # larger files spill to disk while they wait their turn
+
+ERRORS_ENTRY = "_export_errors.txt"
+
+
+# Rows per request; kept below PostgREST's default 1000-row response cap
+EXPORT_PAGE_SIZE = 500
+
+
+def _latest_rows(db, firm_id: str, project_ids: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """One row per project from the latest_generated_files RPC, keyset-paged by project id."""
+    rows: List[Dict[str, Any]] = []
+    after: Optional[str] = None
+    while True:
+        page = db.rpc("latest_generated_files", {
+            "p_firm_id": firm_id,
+            "p_project_ids": project_ids or None,
+            "p_after_project_id": after,
+            "p_limit": EXPORT_PAGE_SIZE,
+        }).execute().data or []
+        rows.extend(page)
+        if len(page) < EXPORT_PAGE_SIZE:
+            return rows
+        after = page[-1]["cma_project_id"]
+
+
+def _all_version_rows(db, firm_id: str, project_ids: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Every version row of the firm's generated files, paged so none are cut off."""
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        query = (
+            db.table("generated_files")
+            .select("cma_project_id, file_name, storage_path, version")
+            .eq("firm_id", firm_id)
+        )
+        if project_ids:
+            query = query.in_("cma_project_id", project_ids)
+        page = (
+            query.order("cma_project_id").order("version", desc=True)
+            .range(start, start + EXPORT_PAGE_SIZE - 1)
+            .execute().data or []
+        )
+        rows.extend(page)
+        if len(page) < EXPORT_PAGE_SIZE:
+            return rows
+        start += EXPORT_PAGE_SIZE
+
+
+def latest_generated_files(firm_id: str, project_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Latest generated file of each project in the firm, with stable, unique archive names."""
+    db = get_supabase()
+    try:
+        rows = _latest_rows(db, firm_id, project_ids)
+    except Exception as e:
+        # Migration 018 not applied yet — page through every version instead
+        logger.warning("latest_generated_files RPC unavailable, paging generated_files: %s", e)
+        rows = _all_version_rows(db, firm_id, project_ids)
+
+    latest: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        row["cma_project_id"] = str(row["cma_project_id"])
+        current = latest.get(row["cma_project_id"])
+        if current is None or row["version"] > current["version"]:
+            latest[row["cma_project_id"]] = row
+
+    files = sorted(latest.values(), key=lambda r: (r["file_name"], r["cma_project_id"]))
+    # Named from the row alone: stable across exports, and distinct when two projects share a file name
+    for row in files:
+        row["archive_name"] = f"{row['cma_project_id'][:8]}_{row['file_name']}"
+    return files
+
+
+def _fetch(storage_path: str) -> tempfile.SpooledTemporaryFile:
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    try:
+        download_to(storage_path, spool)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _prefetched(files: List[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], Any]]:
+    """Yield (file, spool or exception) in order, keeping up to EXPORT_PREFETCH downloads in flight."""
+    remaining = iter(files)
+    with ThreadPoolExecutor(max_workers=max(EXPORT_PREFETCH, 1), thread_name_prefix="export") as pool:
+        pending = deque()
+
+        def submit_next() -> None:
+            row = next(remaining, None)
+            if row is not None:
+                pending.append((row, pool.submit(_fetch, row["storage_path"])))
+
+        for _ in range(max(EXPORT_PREFETCH, 1)):
+            submit_next()
+
+        while pending:
+            row, future = pending.popleft()
+            submit_next()
+            try:
+                yield row, future.result()
+            except Exception as e:
+                yield row, e
+
+
+class _ChunkSink:
+    """Write-only, unseekable stream that hands written bytes back to the generator."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(files: List[Dict[str, Any]]) -> Iterator[bytes]:
+    """ZIP archive of *files* (rows from latest_generated_files), produced incrementally.
+
+    Workbooks are already compressed, so entries are stored rather than deflated.
+    Files that cannot be downloaded are left out and listed in ERRORS_ENTRY.
+    """
+    sink = _ChunkSink()
+    failures: List[str] = []
+
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        for row, spool in _prefetched(files):
+            if isinstance(spool, Exception):
+                logger.warning("Export skipped %s: %s", row["storage_path"], spool)
+                failures.append(f"{row['archive_name']}: {spool}")
+                continue
+            with spool, zf.open(row["archive_name"], "w", force_zip64=True) as entry:
+                while chunk := spool.read(EXPORT_CHUNK_SIZE):
+                    entry.write(chunk)
+                    if data := sink.drain():
+                        yield data
+
+        if failures:
+            zf.writestr(ERRORS_ENTRY, "Could not export:\n" + "\n".join(failures) + "\n")
+
+    if data := sink.drain():
+        yield data
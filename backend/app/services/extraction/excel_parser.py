@@ -4,7 +4,7 @@ import re
 from typing import Dict, Any
 import openpyxl
 
-from app.services.extraction.utils import clean_indian_number, detect_document_type, extract_financial_year
+from app.services.extraction.utils import FileSource, clean_indian_number, detect_document_type, extract_financial_year, open_source
 
 
 def _parse_sheet(rows: list[list[str]], sheet_name: str) -> Dict[str, Any]:
@@ -99,16 +99,19 @@ def _parse_sheet(rows: list[list[str]], sheet_name: str) -> Dict[str, Any]:
     }
 
 
-def parse_excel(file_bytes: bytes, filename: str, is_csv: bool = False) -> Dict[str, Any]:
+def parse_excel(source: FileSource, filename: str, is_csv: bool = False) -> Dict[str, Any]:
     """Parse an Excel or CSV file into the standard extraction format.
 
     For multi-sheet workbooks, parses all sheets and returns the one with
     the most line items (typically the most data-rich financial statement).
+    Any other sheet recognised as a statement is returned under "documents"
+    (the top-level sheet is not repeated there), so the merger can fill each
+    statement slot from this one upload.
     """
     if is_csv:
-        return _parse_csv(file_bytes, filename)
+        return _parse_csv(source, filename)
 
-    wb = openpyxl.load_workbook(filename=io.BytesIO(file_bytes), read_only=True, data_only=True)
+    wb = openpyxl.load_workbook(filename=open_source(source), read_only=True, data_only=True)
 
     best_result: Dict[str, Any] | None = None
     all_results: list[Dict[str, Any]] = []
@@ -147,17 +150,22 @@ def parse_excel(file_bytes: bytes, filename: str, is_csv: bool = False) -> Dict[
             for r in sheets_with_data if r is not best_result
         ]
 
+    other_statements = [
+        r for r in sheets_with_data if r["document_type"] != "other" and r is not best_result
+    ]
+    if other_statements:
+        best_result = {**best_result, "documents": other_statements}
+
     return best_result
 
 
-def _parse_csv(file_bytes: bytes, filename: str) -> Dict[str, Any]:
+def _parse_csv(source: FileSource, filename: str) -> Dict[str, Any]:
     """Parse a CSV file into the standard extraction format."""
-    text = file_bytes.decode("utf-8", errors="replace")
-    reader = csv.reader(io.StringIO(text))
-    rows: list[list[str]] = []
-    for row in reader:
-        cells = [c.strip() for c in row]
-        rows.append(cells)
+    if isinstance(source, (bytes, bytearray)):
+        rows = [[c.strip() for c in row] for row in csv.reader(io.StringIO(source.decode("utf-8", errors="replace")))]
+    else:
+        with open(source, "r", encoding="utf-8", errors="replace", newline="") as f:
+            rows = [[c.strip() for c in row] for row in csv.reader(f)]
 
     result = _parse_sheet(rows, "CSV")
     result["metadata"]["source_file"] = filename
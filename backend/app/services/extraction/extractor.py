@@ -6,7 +6,7 @@ without going through HTTP.
 """
 
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 from pydantic import BaseModel
 
@@ -15,6 +15,7 @@ from app.services.extraction.excel_parser import parse_excel
 from app.services.extraction.pdf_parser import parse_pdf, is_digital_pdf
 from app.services.extraction.vision_extractor import extract_with_vision
 from app.services.extraction.merger import merge_and_save_data
+from app.services.storage_cache import cached_download
 
 logger = logging.getLogger(__name__)
 
@@ -25,77 +26,111 @@ class ExtractionResult(BaseModel):
     files_failed: int
     total_line_items: int
     results: List[Dict[str, Any]]
+    merge_error: Optional[str] = None
+
+
+def extract_file(file_path: str, f: Dict[str, Any], project_id: str, firm_id: str) -> Dict[str, Any]:
+    """Parse one uploaded file (a local copy at *file_path*) according to its type."""
+    file_name = f.get("file_name", "unknown")
+    ext = f.get("file_type", "")
+
+    if ext in ("xlsx", "xls"):
+        return parse_excel(file_path, file_name)
+    if ext == "csv":
+        return parse_excel(file_path, file_name, is_csv=True)
+    if ext == "pdf":
+        if is_digital_pdf(file_path):
+            return parse_pdf(file_path, file_name)
+        return extract_with_vision(
+            file_path, file_name, "application/pdf",
+            firm_id, project_id,
+            f.get("document_type", "auto-detect"),
+        )
+    if ext in ("jpg", "png"):
+        mime = "image/jpeg" if ext == "jpg" else "image/png"
+        return extract_with_vision(
+            file_path, file_name, mime,
+            firm_id, project_id,
+            f.get("document_type", "auto-detect"),
+        )
+    raise ValueError(f"Unsupported file type: {ext}")
+
+
+def _reusable_extractions(db, firm_id: str, files: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Completed extractions of identical content (same firm, same content_hash) outside this run."""
+    hashes = sorted({f["content_hash"] for f in files if f.get("content_hash")})
+    if not hashes:
+        return {}
+    ids = [f["id"] for f in files]
+
+    resp = (
+        db.table("uploaded_files")
+        .select("id, content_hash, extracted_data")
+        .eq("firm_id", firm_id)
+        .eq("extraction_status", "completed")
+        .in_("content_hash", hashes)
+        .not_.in_("id", ids)
+        .execute()
+    )
 
+    reusable: Dict[str, Dict[str, Any]] = {}
+    for row in resp.data or []:
+        data = row.get("extracted_data")
+        if row.get("content_hash") not in hashes or row.get("id") in ids:
+            continue
+        if not isinstance(data, dict) or "line_items" not in data:
+            continue
+        if (data.get("metadata") or {}).get("partial"):
+            continue
+        reusable.setdefault(row["content_hash"], data)
+    return reusable
 
-def extract_project(project_id: str, firm_id: str) -> ExtractionResult:
-    """
-    Extract data from all pending uploaded files for a project.
 
-    Downloads each file from storage, parses it based on type,
-    stores extracted data on the file row, then merges all results.
+def extract_files(project_id: str, firm_id: str, files: List[Dict[str, Any]]) -> ExtractionResult:
+    """
+    Extract the given uploaded_files rows and merge the project's data.
 
-    Raises ValueError if all files fail.
+    Each file's result is stored on its row, then handed to the merger in
+    memory so only files outside this run are read back. A merge failure is
+    reported on the result rather than raised.
     """
     db = get_supabase()
 
-    # Get files pending extraction (exclude soft-deleted and already extracted)
-    files_resp = (
-        db.table("uploaded_files")
-        .select("*")
-        .eq("cma_project_id", project_id)
-        .eq("firm_id", firm_id)
-        .neq("extraction_status", "deleted")
-        .execute()
-    )
-
-    files = files_resp.data or []
-    if not files:
-        raise ValueError("No files found for extraction")
-
     files_succeeded = 0
     files_failed = 0
     total_items = 0
     results: List[Dict[str, Any]] = []
+    fresh: List[Dict[str, Any]] = []
+
+    db.table("uploaded_files").update(
+        {"extraction_status": "processing"}
+    ).in_("id", [f["id"] for f in files]).execute()
+
+    # Identical uploads (by content hash) reuse an earlier result instead of being parsed — or sent to Gemini — again
+    reusable = _reusable_extractions(db, firm_id, files)
 
     for f in files:
         file_id = f["id"]
         file_name = f.get("file_name", "unknown")
 
-        db.table("uploaded_files").update(
-            {"extraction_status": "processing"}
-        ).eq("id", file_id).execute()
-
         try:
-            storage_path = f["storage_path"]
-            file_bytes = db.storage.from_("cma-files").download(storage_path)
-
-            ext = f.get("file_type", "")
-            extracted_data = None
-
-            if ext in ("xlsx", "xls"):
-                extracted_data = parse_excel(file_bytes, file_name)
-            elif ext == "csv":
-                extracted_data = parse_excel(file_bytes, file_name, is_csv=True)
-            elif ext == "pdf":
-                if is_digital_pdf(file_bytes):
-                    extracted_data = parse_pdf(file_bytes, file_name)
-                else:
-                    extracted_data = extract_with_vision(
-                        file_bytes, file_name, "application/pdf",
-                        firm_id, project_id,
-                        f.get("document_type", "auto-detect"),
-                    )
-            elif ext in ("jpg", "png"):
-                mime = "image/jpeg" if ext == "jpg" else "image/png"
-                extracted_data = extract_with_vision(
-                    file_bytes, file_name, mime,
-                    firm_id, project_id,
-                    f.get("document_type", "auto-detect"),
-                )
+            content_hash = f.get("content_hash")
+            reused = reusable.get(content_hash) if content_hash else None
+            if reused is not None:
+                extracted_data = {
+                    **reused,
+                    "metadata": {**(reused.get("metadata") or {}), "source_file": file_name, "reused_extraction": True},
+                }
             else:
-                raise ValueError(f"Unsupported file type: {ext}")
-
-            items_count = len(extracted_data.get("line_items", []))
+                # Local cached copy: retries and re-extraction skip the storage download
+                with cached_download(f["storage_path"], content_hash) as file_path:
+                    extracted_data = extract_file(file_path, f, project_id, firm_id)
+                if content_hash and not (extracted_data.get("metadata") or {}).get("partial"):
+                    reusable[content_hash] = extracted_data
+
+            items_count = sum(
+                len(doc.get("line_items", [])) for doc in [extracted_data, *(extracted_data.get("documents") or [])]
+            )
             db.table("uploaded_files").update({
                 "extraction_status": "completed",
                 "extracted_data": extracted_data,
@@ -103,6 +138,7 @@ def extract_project(project_id: str, firm_id: str) -> ExtractionResult:
 
             total_items += items_count
             files_succeeded += 1
+            fresh.append({"id": file_id, "file_name": file_name, "extracted_data": extracted_data})
 
             results.append({
                 "file_id": file_id,
@@ -110,6 +146,7 @@ def extract_project(project_id: str, firm_id: str) -> ExtractionResult:
                 "status": "completed",
                 "line_items_count": items_count,
                 "document_type": extracted_data.get("document_type", "other"),
+                "reused": reused is not None,
             })
 
         except Exception as e:
@@ -127,15 +164,13 @@ def extract_project(project_id: str, firm_id: str) -> ExtractionResult:
                 "error": str(e),
             })
 
-    # Merge extracted data across files
+    merge_error = None
     if files_succeeded > 0:
         try:
-            merge_and_save_data(project_id, firm_id)
+            merge_and_save_data(project_id, firm_id, fresh=fresh)
         except Exception as e:
             logger.error("Merge failed for project %s: %s", project_id, e)
-            raise ValueError(f"Extraction succeeded but merge failed: {e}") from e
-    else:
-        raise ValueError("All files failed to extract")
+            merge_error = str(e)
 
     return ExtractionResult(
         files_processed=len(files),
@@ -143,4 +178,40 @@ def extract_project(project_id: str, firm_id: str) -> ExtractionResult:
         files_failed=files_failed,
         total_line_items=total_items,
         results=results,
+        merge_error=merge_error,
     )
+
+
+def extract_project(project_id: str, firm_id: str) -> ExtractionResult:
+    """
+    Extract data from all pending uploaded files for a project.
+
+    Downloads each file from storage, parses it based on type,
+    stores extracted data on the file row, then merges all results.
+
+    Raises ValueError if all files fail.
+    """
+    db = get_supabase()
+
+    # Get files pending extraction (exclude soft-deleted and already extracted)
+    files_resp = (
+        db.table("uploaded_files")
+        .select("*")
+        .eq("cma_project_id", project_id)
+        .eq("firm_id", firm_id)
+        .neq("extraction_status", "deleted")
+        .execute()
+    )
+
+    files = files_resp.data or []
+    if not files:
+        raise ValueError("No files found for extraction")
+
+    result = extract_files(project_id, firm_id, files)
+
+    if result.files_succeeded == 0:
+        raise ValueError("All files failed to extract")
+    if result.merge_error:
+        raise ValueError(f"Extraction succeeded but merge failed: {result.merge_error}")
+
+    return result
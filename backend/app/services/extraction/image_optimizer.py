@@ -0,0 +1,130 @@
+"""
+Image preprocessing ahead of vision extraction.
+
+Phone photos and scanner output of statements are routinely 5–10 MB. Before
+they are sent to Gemini they are downscaled to a target DPI (assuming an A4
+page), converted to grayscale, cropped to the printed area and re-encoded as
+JPEG. Settings are tunable per document type through ImageProfile, and can be
+overridden with the VISION_IMAGE_PROFILES env var, e.g.
+    VISION_IMAGE_PROFILES='{"trial_balance": {"target_dpi": 250}}'
+
+If optimisation fails or does not make the image smaller, the original bytes
+are used unchanged.
+"""
+
+import io
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Tuple
+
+from PIL import Image, ImageOps
+from pydantic import BaseModel
+
+from app.services.extraction.utils import FileSource, open_source, source_size
+
+logger = logging.getLogger(__name__)
+
+VISION_IMAGE_OPTIMIZE = os.getenv("VISION_IMAGE_OPTIMIZE", "true").lower() in ("1", "true", "yes")
+
+# Long edge of an A4 page in inches — photos carry no trustworthy DPI, so size is judged against the page
+A4_LONG_EDGE_INCHES = 11.69
+
+# Pixels darker than this (0-255 grayscale) count as ink when finding the crop box
+INK_THRESHOLD = 200
+
+
+class ImageProfile(BaseModel):
+    target_dpi: int = 200
+    grayscale: bool = True
+    crop_margins: bool = True
+    margin_px: int = 24  # padding kept around the detected content
+    quality: int = 80
+
+
+# Trial balances are dense multi-column tables with small print, so they keep more resolution
+PROFILES: Dict[str, ImageProfile] = {
+    "default": ImageProfile(),
+    "profit_and_loss": ImageProfile(target_dpi=200, quality=75),
+    "balance_sheet": ImageProfile(target_dpi=200, quality=75),
+    "trial_balance": ImageProfile(target_dpi=240, quality=82),
+}
+
+
+def _load_overrides() -> None:
+    raw = os.getenv("VISION_IMAGE_PROFILES")
+    if not raw:
+        return
+    try:
+        for doc_type, fields in json.loads(raw).items():
+            base = PROFILES.get(doc_type, PROFILES["default"])
+            PROFILES[doc_type] = base.model_copy(update=fields)
+    except (ValueError, AttributeError, TypeError) as e:
+        logger.warning("Ignoring invalid VISION_IMAGE_PROFILES: %s", e)
+
+
+_load_overrides()
+
+
+def get_profile(document_type: str) -> ImageProfile:
+    return PROFILES.get(document_type, PROFILES["default"])
+
+
+def _crop_to_content(img: Image.Image, margin: int) -> Image.Image:
+    gray = img if img.mode == "L" else img.convert("L")
+    ink = gray.point(lambda p: 255 if p < INK_THRESHOLD else 0)
+    bbox = ink.getbbox()
+    if not bbox:
+        return img
+    left, top, right, bottom = bbox
+    box = (
+        max(left - margin, 0),
+        max(top - margin, 0),
+        min(right + margin, img.width),
+        min(bottom + margin, img.height),
+    )
+    return img.crop(box)
+
+
+def optimize_image(source: FileSource, mime_type: str, document_type: str = "default") -> Tuple[FileSource, str, Dict[str, Any]]:
+    """Return (image, mime_type, stats) to send for extraction; the original *source* if not worth replacing."""
+    profile = get_profile(document_type)
+    original_size = source_size(source)
+    stats: Dict[str, Any] = {"original_bytes": original_size, "optimized": False}
+    t0 = time.perf_counter()
+
+    try:
+        img = Image.open(open_source(source))
+        img = ImageOps.exif_transpose(img)  # phone photos are often stored sideways
+        stats["original_size"] = [img.width, img.height]
+
+        if profile.grayscale:
+            img = img.convert("L")
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        if profile.crop_margins:
+            img = _crop_to_content(img, profile.margin_px)
+
+        max_edge = int(A4_LONG_EDGE_INCHES * profile.target_dpi)
+        if max(img.width, img.height) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=profile.quality, optimize=True)
+        optimized = out.getvalue()
+    except Exception as e:
+        logger.warning("Image optimisation failed, sending original: %s", e)
+        return source, mime_type, stats
+
+    stats["latency_ms"] = int((time.perf_counter() - t0) * 1000)
+    if len(optimized) >= original_size:
+        return source, mime_type, stats
+
+    stats.update({
+        "optimized": True,
+        "optimized_bytes": len(optimized),
+        "optimized_size": [img.width, img.height],
+    })
+    return optimized, "image/jpeg", stats
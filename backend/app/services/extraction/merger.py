@@ -1,5 +1,5 @@
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 from app.db.supabase_client import get_supabase
 
@@ -8,19 +8,28 @@ logger = logging.getLogger(__name__)
 VALID_DOC_TYPES = ("profit_and_loss", "balance_sheet", "trial_balance")
 
 
-def merge_and_save_data(project_id: str, firm_id: str) -> None:
+def merge_and_save_data(project_id: str, firm_id: str, fresh: Optional[List[Dict[str, Any]]] = None) -> None:
+    """Merge every completed file's extracted data onto the project.
+
+    *fresh* holds rows ({"id", "file_name", "extracted_data"}) the caller has
+    just extracted and written; only the project's other completed files are
+    read back from the database.
+    """
     db = get_supabase()
+    fresh = fresh or []
 
-    files_resp = (
+    query = (
         db.table("uploaded_files")
         .select("file_name, extracted_data")
         .eq("cma_project_id", project_id)
         .eq("firm_id", firm_id)
         .eq("extraction_status", "completed")
-        .execute()
     )
+    if fresh:
+        query = query.not_.in_("id", [row["id"] for row in fresh])
 
-    if not files_resp.data:
+    rows = (query.execute().data or []) + fresh
+    if not rows:
         return
 
     merged_data: Dict[str, Any] = {
@@ -37,7 +46,7 @@ def merge_and_save_data(project_id: str, firm_id: str) -> None:
     total_items = 0
     all_files: list[str] = []
 
-    for row in files_resp.data:
+    for row in rows:
         file_name = row["file_name"]
         extracted = row.get("extracted_data")
 
@@ -50,32 +59,34 @@ def merge_and_save_data(project_id: str, firm_id: str) -> None:
 
         all_files.append(file_name)
 
-        doc_type = extracted.get("document_type")
-        if doc_type not in VALID_DOC_TYPES:
-            logger.info("File %s has doc_type '%s' — skipped in merge", file_name, doc_type)
-            continue
-
-        new_items = extracted.get("line_items", [])
-        existing = merged_data[doc_type]
-
-        if existing:
-            old_count = len(existing.get("line_items", []))
-            new_count = len(new_items)
-            if new_count > old_count:
-                logger.info("Replacing %s data: %s items → %s items", doc_type, old_count, new_count)
+        # Multi-statement workbooks carry their other statement sheets under "documents"
+        for doc in [extracted, *(extracted.get("documents") or [])]:
+            doc_type = doc.get("document_type")
+            if doc_type not in VALID_DOC_TYPES:
+                logger.info("File %s has doc_type '%s' — skipped in merge", file_name, doc_type)
+                continue
+
+            new_items = doc.get("line_items", [])
+            existing = merged_data[doc_type]
+
+            if existing:
+                old_count = len(existing.get("line_items", []))
+                new_count = len(new_items)
+                if new_count > old_count:
+                    logger.info("Replacing %s data: %s items → %s items", doc_type, old_count, new_count)
+                    merged_data[doc_type] = {
+                        "line_items": new_items,
+                        "totals": doc.get("totals", {}),
+                    }
+                    total_items += new_count - old_count
+                else:
+                    logger.info("Keeping existing %s data (%s items >= %s new)", doc_type, old_count, new_count)
+            else:
                 merged_data[doc_type] = {
                     "line_items": new_items,
-                    "totals": extracted.get("totals", {}),
+                    "totals": doc.get("totals", {}),
                 }
-                total_items += new_count - old_count
-            else:
-                logger.info("Keeping existing %s data (%s items >= %s new)", doc_type, old_count, new_count)
-        else:
-            merged_data[doc_type] = {
-                "line_items": new_items,
-                "totals": extracted.get("totals", {}),
-            }
-            total_items += len(new_items)
+                total_items += len(new_items)
 
     merged_data["metadata"]["source_files"] = all_files
     merged_data["metadata"]["total_line_items"] = total_items
@@ -94,7 +105,7 @@ def merge_and_save_data(project_id: str, firm_id: str) -> None:
             "action": "run_extraction",
             "entity_type": "cma_project",
             "entity_id": project_id,
-            "metadata": {"files_processed": len(files_resp.data), "line_items_extracted": total_items},
+            "metadata": {"files_processed": len(rows), "line_items_extracted": total_items},
         }).execute()
     except Exception as e:
         logger.warning("Failed to write audit log for merge: %s", e)
@@ -1,15 +1,14 @@
-import io
 import re
 from typing import Dict, Any
 import pdfplumber
 
-from app.services.extraction.utils import clean_indian_number, detect_document_type, extract_financial_year
+from app.services.extraction.utils import FileSource, clean_indian_number, detect_document_type, extract_financial_year, open_source
 
 
-def is_digital_pdf(file_bytes: bytes) -> bool:
+def is_digital_pdf(source: FileSource) -> bool:
     """Check if a PDF has extractable text (not scanned image)."""
     try:
-        with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+        with pdfplumber.open(open_source(source)) as pdf:
             # Check first few pages — a cover page may be an image
             for page in pdf.pages[:3]:
                 text = page.extract_text()
@@ -20,14 +19,14 @@ def is_digital_pdf(file_bytes: bytes) -> bool:
     return False
 
 
-def parse_pdf(file_bytes: bytes, filename: str) -> Dict[str, Any]:
+def parse_pdf(source: FileSource, filename: str) -> Dict[str, Any]:
     line_items: list[dict] = []
 
     doc_type = "other"
     entity_name = "Unknown"
     financial_year = "Unknown"
 
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+    with pdfplumber.open(open_source(source)) as pdf:
         all_text = ""
         for page in pdf.pages:
             text = page.extract_text()
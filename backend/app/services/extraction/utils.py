@@ -1,4 +1,12 @@
+import hashlib
+import io
+import mmap
+import os
 import re
+from typing import BinaryIO, Union
+
+# A document as handed to the parsers: raw bytes, or the path of a local copy
+FileSource = Union[bytes, str, os.PathLike]
 
 
 def clean_indian_number(text: str) -> float:
@@ -52,3 +60,35 @@ def extract_financial_year(text: str) -> str:
     """Extract Indian financial year from text. Supports 2024-25 and 2024-2025 formats."""
     match = re.search(r'20\d{2}[-–]\d{2,4}', text)
     return match.group(0) if match else "Unknown"
+
+
+def open_source(source: FileSource) -> Union[str, os.PathLike, BinaryIO]:
+    """What openpyxl/pdfplumber should open: a local path as-is, raw bytes wrapped in BytesIO."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source
+
+
+def read_source(source: FileSource) -> bytes:
+    """Whole document as bytes — only for consumers that need it in memory (e.g. an API payload)."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def source_size(source: FileSource) -> int:
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    return os.path.getsize(source)
+
+
+def source_digest(source: FileSource) -> str:
+    """SHA-256 of a document; local files are hashed through an mmap rather than read into memory."""
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).hexdigest()
+    with open(source, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256(b"").hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return hashlib.sha256(m).hexdigest()
@@ -1,12 +1,36 @@
+import hashlib
+import io
 import json
 import logging
 import os
-from typing import Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+import pypdfium2 as pdfium
+
 from app.services.gemini_client import GeminiClient, log_llm_usage
+from app.services.extraction.image_optimizer import VISION_IMAGE_OPTIMIZE, optimize_image
+from app.services.extraction.utils import FileSource, read_source, source_digest
 from app.services.extraction.prompts import EXTRACTION_SYSTEM_PROMPT, EXTRACTION_USER_PROMPT, JSON_SCHEMA
+from app.utils.json_salvage import salvage_json_object
 
 logger = logging.getLogger(__name__)
 
+# Scanned PDFs are sent to Gemini in groups of this many pages, concurrently
+VISION_PAGES_PER_GROUP = int(os.getenv("VISION_PAGES_PER_GROUP", "1"))
+VISION_MAX_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", "4"))
+VISION_PAGE_RETRIES = 1
+
+# Successful page-group results, so a retried file only re-sends its failed pages
+PAGE_CACHE_MAX_ENTRIES = 256
+_page_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_page_cache_lock = threading.Lock()
+
+_pdfium_lock = threading.Lock()
+
 
 def clean_json_text(text: str) -> str:
     text = text.strip()
@@ -19,11 +43,17 @@ def clean_json_text(text: str) -> str:
     return text.strip()
 
 
-def extract_with_vision(file_bytes: bytes, filename: str, mime_type: str, firm_id: str, project_id: str, document_type: str = "auto-detect") -> Dict[str, Any]:
-    client = GeminiClient()
-
-    model_name = os.getenv("LLM_EXTRACTION_MODEL", "gemini-2.0-flash")
-
+def _extract_once(
+    client: GeminiClient,
+    model_name: str,
+    file_bytes: bytes,
+    filename: str,
+    mime_type: str,
+    firm_id: str,
+    project_id: str,
+    document_type: str,
+) -> Dict[str, Any]:
+    """One Gemini call over a whole image/PDF (or one page group of it)."""
     user_prompt = EXTRACTION_USER_PROMPT.replace("{document_type}", document_type).replace("{json_schema}", JSON_SCHEMA)
 
     response = client.generate_with_image(
@@ -49,10 +79,16 @@ def extract_with_vision(file_bytes: bytes, filename: str, mime_type: str, firm_i
 
     try:
         json_str = clean_json_text(response.text)
-        data = json.loads(json_str)
+        data, complete = salvage_json_object(json_str, "line_items")
     except (json.JSONDecodeError, ValueError) as e:
         raise ValueError(f"Failed to parse Gemini response as JSON: {e}\nRaw Response: {response.text}")
 
+    if not complete:
+        # Truncated/malformed output — keep every complete line item and flag the document
+        logger.warning("Vision response for %s was incomplete; salvaged %d line items",
+                       filename, len(data.get("line_items", [])))
+        data.setdefault("metadata", {})["partial"] = True
+
     # Validate required keys exist
     if not isinstance(data, dict):
         raise ValueError(f"Gemini returned non-object JSON: {type(data)}")
@@ -60,8 +96,176 @@ def extract_with_vision(file_bytes: bytes, filename: str, mime_type: str, firm_i
     if "line_items" not in data or not isinstance(data.get("line_items"), list):
         raise ValueError(f"Gemini response missing 'line_items' array. Keys found: {list(data.keys())}")
 
+    return data
+
+
+def pdf_page_groups(source: FileSource, pages_per_group: int = VISION_PAGES_PER_GROUP) -> List[List[int]]:
+    """1-based page numbers of each group of *pages_per_group* pages."""
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(source)
+        try:
+            n_pages = len(pdf)
+        finally:
+            pdf.close()
+    step = max(pages_per_group, 1)
+    return [list(range(start + 1, min(start + step, n_pages) + 1)) for start in range(0, n_pages, step)]
+
+
+def render_page_group(source: FileSource, page_numbers: List[int]) -> bytes:
+    """A standalone PDF holding just *page_numbers* of *source*.
+
+    Built on demand by each worker so only the groups in flight are in
+    memory; pdfium is not thread-safe, hence the lock.
+    """
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(source)
+        try:
+            part = pdfium.PdfDocument.new()
+            part.import_pages(pdf, [p - 1 for p in page_numbers])
+            buf = io.BytesIO()
+            part.save(buf)
+            part.close()
+        finally:
+            pdf.close()
+    return buf.getvalue()
+
+
+def _cache_key(file_digest: str, page_numbers: List[int], model_name: str, document_type: str) -> str:
+    # Keyed on the source file rather than the split bytes — re-saved PDFs are not byte-stable
+    raw = f"{file_digest}|{','.join(map(str, page_numbers))}|{model_name}|{document_type}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[Dict[str, Any]]:
+    with _page_cache_lock:
+        hit = _page_cache.get(key)
+        if hit is not None:
+            _page_cache.move_to_end(key)
+        return hit
+
+
+def _cache_put(key: str, data: Dict[str, Any]) -> None:
+    with _page_cache_lock:
+        _page_cache[key] = data
+        _page_cache.move_to_end(key)
+        while len(_page_cache) > PAGE_CACHE_MAX_ENTRIES:
+            _page_cache.popitem(last=False)
+
+
+def _merge_page_results(pages: List[Tuple[List[int], Dict[str, Any], Dict[str, Any]]]) -> Dict[str, Any]:
+    """Concatenate page-group results in page order; header fields come from the first page that has them."""
+    merged: Dict[str, Any] = {"line_items": [], "metadata": {"parser": "vision_extractor", "pages": []}}
+
+    for page_numbers, data, provenance in pages:
+        for field in ("document_type", "financial_year", "entity_name", "currency"):
+            value = data.get(field)
+            if value and (field not in merged or (field == "document_type" and merged[field] == "other")):
+                merged[field] = value
+        if any((data.get("totals") or {}).values()):
+            merged["totals"] = data["totals"]
+
+        merged["line_items"].extend(data.get("line_items", []))
+        merged["metadata"]["pages"].append({
+            "pages": page_numbers,
+            "line_items": len(data.get("line_items", [])),
+            "partial": bool((data.get("metadata") or {}).get("partial")),
+            **provenance,
+        })
+
+    if any(p["partial"] for p in merged["metadata"]["pages"]):
+        merged["metadata"]["partial"] = True
+    return merged
+
+
+def _extract_pdf_by_pages(
+    client: GeminiClient,
+    model_name: str,
+    source: FileSource,
+    groups: List[List[int]],
+    file_digest: str,
+    filename: str,
+    firm_id: str,
+    project_id: str,
+    document_type: str,
+) -> Dict[str, Any]:
+    results: Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+    pending: List[int] = []
+
+    for idx, page_numbers in enumerate(groups):
+        cached = _cache_get(_cache_key(file_digest, page_numbers, model_name, document_type))
+        if cached is not None:
+            results[idx] = (cached, {"cached": True, "latency_ms": 0})
+        else:
+            pending.append(idx)
+
+    def run(idx: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        page_numbers = groups[idx]
+        t0 = time.time()
+        data = _extract_once(
+            client, model_name, render_page_group(source, page_numbers), f"{filename}#p{page_numbers[0]}", "application/pdf",
+            firm_id, project_id, document_type,
+        )
+        if not (data.get("metadata") or {}).get("partial"):
+            _cache_put(_cache_key(file_digest, page_numbers, model_name, document_type), data)
+        return data, {"cached": False, "latency_ms": int((time.time() - t0) * 1000)}
+
+    errors: Dict[int, str] = {}
+    for attempt in range(VISION_PAGE_RETRIES + 1):
+        if not pending:
+            break
+        if attempt:
+            logger.warning("Retrying %d failed page group(s) of %s", len(pending), filename)
+        with ThreadPoolExecutor(max_workers=min(VISION_MAX_CONCURRENCY, len(pending))) as pool:
+            futures = {idx: pool.submit(run, idx) for idx in pending}
+        failed = []
+        for idx, fut in futures.items():
+            try:
+                results[idx] = fut.result()
+                errors.pop(idx, None)
+            except Exception as e:
+                errors[idx] = str(e)
+                failed.append(idx)
+        pending = failed
+
+    if pending:
+        pages = sorted(p for idx in pending for p in groups[idx])
+        raise ValueError(f"Vision extraction failed for pages {pages} of {filename}: {errors[pending[0]]}")
+
+    return _merge_page_results([(groups[i], *results[i]) for i in range(len(groups))])
+
+
+def extract_with_vision(source: FileSource, filename: str, mime_type: str, firm_id: str, project_id: str, document_type: str = "auto-detect") -> Dict[str, Any]:
+    """Extract a scanned PDF or statement image with Gemini.
+
+    *source* may be raw bytes or the path of a local copy; multi-page PDFs
+    are read from it page group by page group rather than loaded whole.
+    """
+    client = GeminiClient()
+
+    model_name = os.getenv("LLM_EXTRACTION_MODEL", "gemini-2.0-flash")
+
+    image_stats: Optional[Dict[str, Any]] = None
+    if VISION_IMAGE_OPTIMIZE and mime_type.startswith("image/"):
+        source, mime_type, image_stats = optimize_image(source, mime_type, document_type)
+
+    groups: List[List[int]] = []
+    if mime_type == "application/pdf":
+        try:
+            groups = pdf_page_groups(source)
+        except Exception as e:
+            logger.warning("Could not split %s into pages, sending whole file: %s", filename, e)
+
+    if len(groups) > 1:
+        data = _extract_pdf_by_pages(
+            client, model_name, source, groups, source_digest(source), filename, firm_id, project_id, document_type,
+        )
+    else:
+        data = _extract_once(client, model_name, read_source(source), filename, mime_type, firm_id, project_id, document_type)
+
     # Safely set metadata
     data.setdefault("metadata", {})["source_file"] = filename
+    if image_stats is not None:
+        data["metadata"]["image_optimization"] = image_stats
     data.setdefault("document_type", "other")
 
     return data
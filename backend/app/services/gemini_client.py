@@ -8,15 +8,25 @@ from app.db.supabase_client import get_supabase
 
 logger = logging.getLogger(__name__)
 
-# Pricing per million tokens (USD) — keep in sync with actual Gemini API model IDs
+# Pricing per million tokens (USD) — keep in sync with actual Gemini API model IDs.
+# batch_token_budget caps the estimated prompt size of one classification batch;
+# max_output_tokens is the model's response limit.
 PRICING = {
-    "gemini-2.0-flash": {"input": 0.10, "output": 0.40},
-    "gemini-2.5-flash": {"input": 0.15, "output": 0.60},
-    "gemini-2.5-pro":   {"input": 1.25, "output": 10.00},
+    "gemini-2.0-flash": {"input": 0.10, "output": 0.40, "batch_token_budget": 12_000, "max_output_tokens": 8_192},
+    "gemini-2.5-flash": {"input": 0.15, "output": 0.60, "batch_token_budget": 16_000, "max_output_tokens": 65_536},
+    "gemini-2.5-pro":   {"input": 1.25, "output": 10.00, "batch_token_budget": 16_000, "max_output_tokens": 65_536},
 }
 
 MAX_RETRIES = 3
 
+# Rough chars-per-token ratio for Gemini on English/JSON text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate used for prompt budgeting (no API call)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
 
 @dataclass
 class GeminiResponse:
@@ -41,13 +51,14 @@ class GeminiClient:
                (output_tokens * model_pricing["output"] / 1_000_000)
         return cost
 
-    def _invoke(self, model_name: str, contents, system_instruction=None, temperature: float = 0.1, response_format=None) -> GeminiResponse:
+    def _invoke(self, model_name: str, contents, system_instruction=None, temperature: float = 0.1, response_format=None, max_output_tokens: int = None) -> GeminiResponse:
         model = genai.GenerativeModel(
             model_name=model_name,
             system_instruction=system_instruction,
             generation_config=genai.GenerationConfig(
                 temperature=temperature,
-                response_mime_type="application/json" if response_format == "json" else None
+                response_mime_type="application/json" if response_format == "json" else None,
+                max_output_tokens=max_output_tokens,
             )
         )
 
@@ -95,13 +106,14 @@ class GeminiClient:
             model=model_name
         )
 
-    def generate(self, model: str, prompt: str, system_instruction=None, temperature: float = 0.1, response_format=None) -> GeminiResponse:
+    def generate(self, model: str, prompt: str, system_instruction=None, temperature: float = 0.1, response_format=None, max_output_tokens: int = None) -> GeminiResponse:
         return self._invoke(
             model_name=model,
             contents=[prompt],
             system_instruction=system_instruction,
             temperature=temperature,
-            response_format=response_format
+            response_format=response_format,
+            max_output_tokens=max_output_tokens,
         )
 
     def generate_with_image(self, model: str, prompt: str, image_bytes: bytes, mime_type: str, system_instruction=None) -> GeminiResponse:
@@ -121,11 +133,11 @@ class GeminiClient:
         return self.generate_with_image(model, prompt, file_bytes, mime_type, system_instruction)
 
 
-def log_llm_usage(firm_id: str, project_id: str, model: str, task_type: str, gemini_response: GeminiResponse, success: bool, error_message: str = None) -> None:
+def log_llm_usage(firm_id: str, project_id: str, model: str, task_type: str, gemini_response: GeminiResponse, success: bool, error_message: str = None, prompt_tokens_saved: int = 0) -> None:
     """Log LLM usage to database. Failures are logged as warnings, not propagated."""
     try:
         db = get_supabase()
-        db.table("llm_usage_log").insert({
+        row = {
             "firm_id": firm_id,
             "cma_project_id": project_id,
             "model": model,
@@ -136,6 +148,9 @@ def log_llm_usage(firm_id: str, project_id: str, model: str, task_type: str, gem
             "latency_ms": gemini_response.latency_ms if gemini_response else None,
             "success": success,
             "error_message": error_message
-        }).execute()
+        }
+        if prompt_tokens_saved:
+            row["prompt_tokens_saved"] = prompt_tokens_saved
+        db.table("llm_usage_log").insert(row).execute()
     except Exception as e:
         logger.warning("Failed to log LLM usage: %s", e)
@@ -55,7 +55,7 @@ def get_learning_metrics(firm_id: str) -> Dict[str, Any]:
     )
 
     trend_dict: Dict[str, Dict[str, int]] = defaultdict(lambda: {"total": 0, "correct": 0, "projects": 0})
-    source_breakdown = {"by_precedent": 0, "by_rule": 0, "by_ai": 0, "ca_reviewed": 0}
+    source_breakdown = {"by_precedent": 0, "by_rule": 0, "by_vector": 0, "by_memo": 0, "by_ai": 0, "ca_reviewed": 0}
     ai_overrides = 0
     total_ai_calls = 0
     cost_usd_avoided = 0.0
@@ -83,6 +83,12 @@ def get_learning_metrics(firm_id: str) -> Dict[str, Any]:
                     cost_usd_avoided += 0.001
                 elif "rule" in source:
                     source_breakdown["by_rule"] += 1
+                elif source == "vector":
+                    source_breakdown["by_vector"] += 1
+                    cost_usd_avoided += 0.001
+                elif source == "memo":
+                    source_breakdown["by_memo"] += 1
+                    cost_usd_avoided += 0.001
                 elif "ai" in source:
                     source_breakdown["by_ai"] += 1
                     total_ai_calls += 1
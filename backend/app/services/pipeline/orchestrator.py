@@ -198,7 +198,7 @@ def _run_extract(project_id: str, firm_id: str) -> StepResult:
 
 def _run_classify(project_id: str, firm_id: str, entity_type: str) -> StepResult:
     """Run classification and populate review queue."""
-    from app.services.classification.classifier import classify_project
+    from app.services.classification.classifier import classify_project, items_to_dicts
     from app.services.classification.review_service import populate_review_queue
 
     t0 = time.time()
@@ -218,12 +218,16 @@ def _run_classify(project_id: str, firm_id: str, entity_type: str) -> StepResult
         classification_data = {
             "classified_at": datetime.now(timezone.utc).isoformat(),
             "total_items": class_res.total_items,
-            "items": [item.model_dump() for item in class_res.items],
+            "items": items_to_dicts(class_res.items),
             "summary": {
                 "by_precedent": class_res.classified_by_precedent,
                 "by_rule": class_res.classified_by_rule,
                 "by_ai": class_res.classified_by_ai,
+                "by_vector": class_res.classified_by_vector,
+                "by_memo": class_res.classified_by_memo,
                 "uncertain": class_res.unclassified,
+                "unique_items": class_res.unique_items,
+                "dedupe_ratio": class_res.dedupe_ratio,
             },
         }
         db.table("cma_projects").update({"classification_data": classification_data}).eq("id", project_id).execute()
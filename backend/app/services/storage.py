@@ -1,10 +1,164 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import BinaryIO, Collection, Dict, Optional
+
+import httpx
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
 from app.core.security import sanitize_filename
 from app.db.supabase_client import get_supabase
 from datetime import datetime
 
-def upload_file(firm_id: str, project_id: str, file_name: str, file_bytes: bytes, content_type: str) -> str:
+# Multipart framing plus the small form fields (document_type) that accompany the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class UnsupportedFileType(ValueError):
+    def __init__(self, ext: str, allowed: Collection[str]) -> None:
+        super().__init__(f"File type '.{ext}' not supported. Allowed: {', '.join(allowed)}")
+        self.ext = ext
+
+
+@dataclass
+class ReceivedUpload:
+    path: str
+    size: int
+    content_hash: str
+    filename: str = ""
+    content_type: str = "application/octet-stream"
+    fields: Dict[str, str] = field(default_factory=dict)
+
+
+def file_extension(filename: str) -> str:
+    """Lower-case extension of the sanitised *filename*, or "" if it has none."""
+    safe_name = sanitize_filename(filename or "upload")
+    return safe_name.split(".")[-1].lower() if "." in safe_name else ""
+
+
+async def receive_upload(
+    request: Request,
+    max_bytes: int,
+    file_field: str = "file",
+    allowed_extensions: Optional[Collection[str]] = None,
+) -> ReceivedUpload:
+    """
+    Parse a multipart/form-data request straight off the wire.
+
+    The file part is written to a single temp file and hashed as it arrives,
+    and the upload is abandoned with UploadTooLarge as soon as it passes
+    *max_bytes* — nothing is buffered by the framework first. With
+    *allowed_extensions*, the filename in the part headers is checked before
+    any of the file is read (UnsupportedFileType). Other form fields are
+    returned in .fields. The caller deletes .path.
     """
-    Upload a file to Supabase storage.
+    mime, params = parse_options_header(request.headers.get("content-type"))
+    boundary = params.get(b"boundary")
+    if mime != b"multipart/form-data" or not boundary:
+        raise ValueError("Expected a multipart/form-data upload")
+
+    out = tempfile.NamedTemporaryFile(prefix="cma-upload-", delete=False)
+    upload = ReceivedUpload(path=out.name, size=0, content_hash="")
+    digest = hashlib.sha256()
+    part: Dict[str, object] = {}
+    header_field = bytearray()
+    header_value = bytearray()
+    field_bytes = 0
+    seen_file = False
+
+    def on_part_begin() -> None:
+        part.clear()
+        part["headers"] = {}
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        header_value.extend(data[start:end])
+
+    def on_header_end() -> None:
+        part["headers"][bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished() -> None:
+        nonlocal seen_file
+        headers = part["headers"]
+        _, disposition = parse_options_header(headers.get(b"content-disposition"))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        part["name"] = name
+        part["is_file"] = name == file_field and b"filename" in disposition and not seen_file
+        if part["is_file"]:
+            seen_file = True
+            upload.filename = disposition[b"filename"].decode("utf-8", "replace")
+            ext = file_extension(upload.filename)
+            if allowed_extensions is not None and ext not in allowed_extensions:
+                raise UnsupportedFileType(ext, allowed_extensions)
+            upload.content_type = headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+        else:
+            part["value"] = bytearray()
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        nonlocal field_bytes
+        chunk = data[start:end]
+        if part.get("is_file"):
+            upload.size += len(chunk)
+            if upload.size > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            digest.update(chunk)
+            out.write(chunk)  # one network chunk into the page cache
+        else:
+            field_bytes += len(chunk)
+            if field_bytes > MULTIPART_OVERHEAD:
+                raise UploadTooLarge("Form fields too large")
+            part["value"].extend(chunk)
+
+    def on_part_end() -> None:
+        if not part.get("is_file") and part.get("name"):
+            upload.fields[part["name"]] = part["value"].decode("utf-8", "replace")
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+        if not seen_file:
+            raise ValueError(f"No '{file_field}' file in upload")
+    except BaseException:
+        out.close()
+        os.unlink(out.name)
+        raise
+    out.close()
+    upload.content_hash = digest.hexdigest()
+    return upload
+
+
+def upload_file(
+    firm_id: str,
+    project_id: str,
+    file_name: str,
+    file_bytes: Optional[bytes] = None,
+    content_type: str = "application/octet-stream",
+    file_path: Optional[str] = None,
+) -> str:
+    """
+    Upload a file to Supabase storage, from bytes or a local file path.
+    A path is streamed from disk rather than loaded into memory.
     Returns the storage path.
     """
     db = get_supabase()
@@ -13,11 +167,16 @@ def upload_file(firm_id: str, project_id: str, file_name: str, file_bytes: bytes
     safe_filename = sanitize_filename(file_name)
     storage_path = f"{firm_id}/{project_id}/{timestamp}_{safe_filename}"
 
-    db.storage.from_("cma-files").upload(
-        file=file_bytes,
-        path=storage_path,
-        file_options={"content-type": content_type}
-    )
+    if file_path is not None:
+        # Opened here rather than passed as a path: storage3 never closes a handle it opens itself
+        with open(file_path, "rb") as fh:
+            db.storage.from_("cma-files").upload(file=fh, path=storage_path, file_options={"content-type": content_type})
+    else:
+        db.storage.from_("cma-files").upload(
+            file=file_bytes,
+            path=storage_path,
+            file_options={"content-type": content_type}
+        )
 
     return storage_path
 
@@ -40,6 +199,29 @@ def get_signed_url(storage_path: str, expires_in: int = 3600) -> str:
     # Standard format for latest versions is usually res['signedURL']
     return res.get('signedURL', '') if isinstance(res, dict) else str(res)
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+DOWNLOAD_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+
+def download_to(storage_path: str, out: BinaryIO, digest=None) -> int:
+    """
+    Stream a storage object into *out* chunk by chunk; returns the bytes written.
+
+    storage3's download() returns the whole object as bytes, so this reads a
+    short-lived signed URL instead and never holds more than one chunk.
+    *digest* (a hashlib object), if given, is updated with every chunk.
+    """
+    url = get_signed_url(storage_path, expires_in=300)
+    written = 0
+    with httpx.stream("GET", url, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+            out.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            written += len(chunk)
+    return written
+
 def delete_file(storage_path: str):
     """
     Delete a file from Supabase storage.
@@ -0,0 +1,170 @@
+"""
+Size-bounded local disk cache of Supabase storage objects.
+
+Extraction retries (with_retry re-runs the whole step) and re-extractions
+read uploads from here instead of downloading them again. Entries are keyed
+by storage path and content hash, so a changed object at the same path is
+never served stale, and the least recently used entries are evicted once the
+cache exceeds STORAGE_CACHE_MAX_MB.
+
+Readers get a pinned path: a hard link to the entry under pinned/ that lives
+for the duration of the `with` block. Eviction (by any thread or process)
+only unlinks the cache entry, so a document being parsed never vanishes
+underneath its reader. Pins and partial downloads left behind by a crashed
+worker are removed by sweep_stale() at startup.
+
+Misses are streamed from storage straight to disk, never held in memory.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from app.services.storage import download_to
+
+logger = logging.getLogger(__name__)
+
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "cma-storage-cache")
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("STORAGE_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# Pins and .part files older than this belong to a crashed worker; no extraction holds a file that long
+STALE_AFTER_SECONDS = 6 * 3600
+
+_evict_lock = threading.Lock()
+
+
+def _cache_path(storage_path: str, content_hash: Optional[str]) -> str:
+    key = hashlib.sha256(f"{storage_path}|{content_hash or ''}".encode("utf-8")).hexdigest()
+    return os.path.join(STORAGE_CACHE_DIR, key)
+
+
+def _evict(max_bytes: int, keep: str) -> None:
+    """Delete least recently used entries until the cache fits in *max_bytes*."""
+    with _evict_lock:
+        entries = []
+        for entry in os.scandir(STORAGE_CACHE_DIR):
+            if entry.is_file() and not entry.name.endswith(".part"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+
+def _pin_dir() -> str:
+    return os.path.join(STORAGE_CACHE_DIR, "pinned")  # a subdirectory, so _evict never sees pins
+
+
+def _pin(path: str) -> str:
+    """Hard link *path* under pinned/; raises FileNotFoundError if it was just evicted."""
+    pin_dir = _pin_dir()
+    os.makedirs(pin_dir, exist_ok=True)
+    pin = os.path.join(pin_dir, uuid.uuid4().hex)
+    try:
+        os.link(path, pin)
+    except FileNotFoundError:
+        raise  # evicted: the caller downloads it again
+    except OSError:
+        # Filesystem without hard links — a private copy pins just as well
+        shutil.copyfile(path, pin)
+    return pin
+
+
+def _download_pinned(storage_path: str, content_hash: Optional[str]) -> str:
+    os.makedirs(STORAGE_CACHE_DIR, exist_ok=True)
+    path = _cache_path(storage_path, content_hash)
+
+    # Streamed to a .part file then renamed, so concurrent readers never see a half-written entry
+    fd, tmp = tempfile.mkstemp(dir=STORAGE_CACHE_DIR, suffix=".part")
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            download_to(storage_path, f, digest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    if content_hash and digest.hexdigest() != content_hash:
+        # Still cached under the requested key: that is what every later lookup asks for
+        logger.warning("Content hash mismatch for %s: expected %s, downloaded %s",
+                       storage_path, content_hash, digest.hexdigest())
+
+    # Pinned before the rename, so eviction cannot take it from us first
+    pin = _pin(tmp)
+    os.replace(tmp, path)
+
+    try:
+        _evict(STORAGE_CACHE_MAX_BYTES, keep=path)
+    except OSError as e:
+        logger.warning("Storage cache eviction failed: %s", e)
+    return pin
+
+
+@contextmanager
+def cached_download(storage_path: str, content_hash: Optional[str] = None) -> Iterator[str]:
+    """Local path of a storage object, downloading it only on a cache miss.
+
+    The path is pinned until the block exits, however hard the cache is evicted meanwhile.
+    """
+    path = _cache_path(storage_path, content_hash)
+    try:
+        pin = _pin(path)
+        os.utime(path)  # mark as recently used
+    except FileNotFoundError:
+        pin = _download_pinned(storage_path, content_hash)
+
+    try:
+        yield pin
+    finally:
+        try:
+            os.unlink(pin)
+        except FileNotFoundError:
+            pass
+
+
+def adopt(storage_path: str, content_hash: Optional[str], local_path: str) -> None:
+    """Move a just-uploaded local file into the cache, so the first extraction needs no download."""
+    try:
+        os.makedirs(STORAGE_CACHE_DIR, exist_ok=True)
+        path = _cache_path(storage_path, content_hash)
+        shutil.move(local_path, path)
+        _evict(STORAGE_CACHE_MAX_BYTES, keep=path)
+    except OSError as e:
+        logger.warning("Could not add %s to the storage cache: %s", storage_path, e)
+
+
+def sweep_stale(max_age_seconds: float = STALE_AFTER_SECONDS) -> int:
+    """Remove pins and partial downloads abandoned by crashed workers; returns how many were removed."""
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    candidates = []
+    for directory, pins in ((STORAGE_CACHE_DIR, False), (_pin_dir(), True)):
+        try:
+            candidates += [e for e in os.scandir(directory) if e.is_file() and (pins or e.name.endswith(".part"))]
+        except FileNotFoundError:
+            continue
+    for entry in candidates:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        logger.info("Removed %d stale storage cache pins and partial downloads", removed)
+    return removed
@@ -2,6 +2,8 @@ import logging
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
 from app.services.validation.rules import get_validation_rules
+from app.services.excel.data_transformer import aggregate_items
+from app.services.excel.formulas import get_formula_engine
 
 logger = logging.getLogger(__name__)
 
@@ -29,13 +31,23 @@ class ValidationResult(BaseModel):
     summary: str
 
 
-def get_item_amount(classification_data: Dict[str, Any], row: int, sheet: str) -> float:
-    val = 0.0
-    items = classification_data.get("items", [])
-    for itm in items:
-        if itm.get("target_row") == row and itm.get("target_sheet") == sheet:
-            val += float(itm.get("item_amount", 0.0))
-    return val
+class RowValues:
+    """Row amounts of a project, as written to the CMA.
+
+    *reported* holds the summed item amounts per row; *computed* the same with
+    computed rows (subtotals, gross profit) applied, exactly as generation does.
+    """
+
+    def __init__(self, classification_data: Dict[str, Any]) -> None:
+        self.items: List[Dict[str, Any]] = classification_data.get("items", [])
+        self.reported = aggregate_items(self.items)
+        self.computed = get_formula_engine().apply(self.reported)
+
+    def amount(self, row: int, sheet: str) -> float:
+        return self.computed.get(sheet, {}).get(row, 0.0)
+
+    def reported_amount(self, row: int, sheet: str) -> float:
+        return self.reported.get(sheet, {}).get(row, 0.0)
 
 
 def format_inr(amount: float) -> str:
@@ -64,9 +76,9 @@ def format_inr(amount: float) -> str:
     return f"{prefix}₹{formatted}"
 
 
-def check_bs_balance(data: Dict[str, Any]) -> ValidationCheck:
-    total_assets = get_item_amount(data, 82, "balance_sheet")
-    total_liabilities = get_item_amount(data, 49, "balance_sheet")
+def check_bs_balance(values: RowValues) -> ValidationCheck:
+    total_assets = values.amount(82, "balance_sheet")
+    total_liabilities = values.amount(49, "balance_sheet")
 
     diff = abs(total_assets - total_liabilities)
     passed = diff <= 1
@@ -95,12 +107,10 @@ def check_bs_balance(data: Dict[str, Any]) -> ValidationCheck:
     )
 
 
-def check_pl_gross_profit(data: Dict[str, Any]) -> ValidationCheck:
-    sales = get_item_amount(data, 5, "operating_statement")
-    cogs = get_item_amount(data, 10, "operating_statement")
-    reported_gp = get_item_amount(data, 12, "operating_statement")
-
-    calc_gp = sales - cogs
+def check_pl_gross_profit(values: RowValues) -> ValidationCheck:
+    # Gross Profit as reported by the statements vs. the computed row (Sales - COGS)
+    reported_gp = values.reported_amount(12, "operating_statement")
+    calc_gp = values.amount(12, "operating_statement")
     diff = abs(reported_gp - calc_gp)
     passed = diff <= 1
 
@@ -128,8 +138,8 @@ def check_pl_gross_profit(data: Dict[str, Any]) -> ValidationCheck:
     )
 
 
-def check_mandatory_sales(data: Dict[str, Any]) -> ValidationCheck:
-    sales = get_item_amount(data, 5, "operating_statement")
+def check_mandatory_sales(values: RowValues) -> ValidationCheck:
+    sales = values.amount(5, "operating_statement")
     passed = sales > 0
     return ValidationCheck(
         rule_id="mandatory_sales",
@@ -141,9 +151,9 @@ def check_mandatory_sales(data: Dict[str, Any]) -> ValidationCheck:
     )
 
 
-def check_current_ratio(data: Dict[str, Any]) -> ValidationCheck:
-    current_assets = get_item_amount(data, 75, "balance_sheet")
-    current_liabs = get_item_amount(data, 30, "balance_sheet")
+def check_current_ratio(values: RowValues) -> ValidationCheck:
+    current_assets = values.amount(75, "balance_sheet")
+    current_liabs = values.amount(30, "balance_sheet")
 
     ratio = current_assets / current_liabs if current_liabs > 0 else 0
     passed = 1.0 <= ratio <= 3.0
@@ -160,9 +170,9 @@ def check_current_ratio(data: Dict[str, Any]) -> ValidationCheck:
     )
 
 
-def check_data_types(data: Dict[str, Any]) -> ValidationCheck:
+def check_data_types(values: RowValues) -> ValidationCheck:
     """Verify all mapped item amounts are numeric."""
-    items = data.get("items", [])
+    items = values.items
     non_numeric = []
     for itm in items:
         amt = itm.get("item_amount")
@@ -188,6 +198,7 @@ def check_data_types(data: Dict[str, Any]) -> ValidationCheck:
 
 def validate_project(project_id: str, classification_data: Dict[str, Any], entity_type: str) -> ValidationResult:
     rules = get_validation_rules(entity_type)
+    values = RowValues(classification_data)
 
     checks: List[ValidationCheck] = []
 
@@ -204,7 +215,7 @@ def validate_project(project_id: str, classification_data: Dict[str, Any], entit
 
     for r in rules:
         if r.check_function in func_map:
-            res = func_map[r.check_function](classification_data)
+            res = func_map[r.check_function](values)
             checks.append(res)
 
             if not res.passed:
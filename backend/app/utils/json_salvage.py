@@ -0,0 +1,118 @@
+"""
+Tolerant parsing of LLM JSON output.
+
+Gemini responses are occasionally cut off at the output limit or contain a
+single malformed element. Rather than discarding the whole payload, these
+helpers walk the text element by element and keep every complete value.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+_decoder = json.JSONDecoder()
+_WS = " \t\r\n"
+
+
+def _skip_ws(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos] in _WS:
+        pos += 1
+    return pos
+
+
+def _skip_value(text: str, pos: int) -> int:
+    """Index just past the (possibly malformed) array element starting at *pos*.
+
+    Tracks bracket depth and string literals; returns -1 if the text ends
+    before the element does.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    while pos < len(text):
+        ch = text[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            if depth == 0:
+                return pos
+            depth -= 1
+        elif ch == "," and depth == 0:
+            return pos
+        pos += 1
+    return -1
+
+
+def salvage_json_array(text: str, start: int = 0) -> Tuple[List[Any], bool]:
+    """Parse the first JSON array in *text* from *start*, keeping every complete element.
+
+    Returns (elements, complete); complete is False when the array was
+    truncated or any element had to be skipped.
+    """
+    pos = text.find("[", start)
+    if pos < 0:
+        return [], False
+    pos += 1
+
+    items: List[Any] = []
+    complete = True
+    while True:
+        pos = _skip_ws(text, pos)
+        if pos >= len(text):
+            return items, False
+        if text[pos] == "]":
+            return items, complete
+        if text[pos] == ",":
+            pos += 1
+            continue
+
+        try:
+            value, pos = _decoder.raw_decode(text, pos)
+            items.append(value)
+        except json.JSONDecodeError:
+            complete = False
+            end = _skip_value(text, pos)
+            if end < 0:
+                return items, False
+            pos = end if end > pos else pos + 1
+
+
+def salvage_json_object(text: str, array_key: str) -> Tuple[Dict[str, Any], bool]:
+    """Parse a JSON object whose bulk is the array under *array_key*.
+
+    Falls back to salvaging the complete elements of that array plus whatever
+    scalar fields precede it when the object as a whole does not parse.
+    """
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data, True
+    except json.JSONDecodeError:
+        pass
+
+    match = re.search(r'"%s"\s*:\s*\[' % re.escape(array_key), text)
+    if not match:
+        raise ValueError(f"No '{array_key}' array found in response")
+
+    items, _ = salvage_json_array(text, match.end() - 1)
+
+    data: Dict[str, Any] = {}
+    head = text[:match.start()].rstrip().rstrip(",")
+    try:
+        parsed_head = json.loads(head + "}")
+        if isinstance(parsed_head, dict):
+            data = parsed_head
+    except json.JSONDecodeError:
+        pass
+
+    data[array_key] = items
+    return data, False
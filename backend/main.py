@@ -8,9 +8,11 @@ from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
 from app.api.v1.router import api_router
+from app.core.executor import executor_stats
 from app.core.logging import setup_logging, get_logger
 from app.core.security import limiter, ALLOWED_METHODS, ALLOWED_HEADERS
 from app.db.supabase_client import get_supabase
+from app.services import storage_cache
 
 # ── Initialize structured logging ───────────────────────────────────────
 setup_logging()
@@ -19,6 +21,9 @@ logger = get_logger(__name__)
 # ── Track startup time for uptime calculation ────────────────────────────
 _startup_time = time.time()
 
+# ── Storage cache: drop pins and partial downloads left by crashed workers ─
+storage_cache.sweep_stale()
+
 app = FastAPI(title="CMA AutoFill", version="1.0.0")
 
 # ── Rate Limiter ─────────────────────────────────────────────────────────
@@ -104,6 +109,7 @@ def health_check():
         "version": "1.0.0",
         "uptime_seconds": uptime,
         "database": db_status,
+        "executor": executor_stats(),
     }
 
 
@@ -0,0 +1,21 @@
+-- Review queue: keyset pagination + server-side status counts
+-- Supports GET /review-queue without OFFSET scans or pulling every row's status.
+
+-- Keyset indexes matching the two sort orders exposed by the API
+CREATE INDEX IF NOT EXISTS idx_review_queue_firm_status_conf_id
+  ON review_queue(firm_id, status, confidence, id);
+CREATE INDEX IF NOT EXISTS idx_review_queue_firm_status_created_id
+  ON review_queue(firm_id, status, created_at DESC, id DESC);
+
+-- Grouped status counts for a firm (optionally narrowed to one project).
+-- Answered from idx_review_queue_firm_status_conf_id / idx_review_queue_project_status.
+CREATE OR REPLACE FUNCTION review_queue_status_counts(p_firm_id UUID, p_project_id UUID DEFAULT NULL)
+RETURNS TABLE(status TEXT, count BIGINT)
+LANGUAGE sql STABLE
+AS $$
+  SELECT rq.status, COUNT(*)::BIGINT
+  FROM review_queue rq
+  WHERE rq.firm_id = p_firm_id
+    AND (p_project_id IS NULL OR rq.cma_project_id = p_project_id)
+  GROUP BY rq.status;
+$$;
@@ -0,0 +1,2 @@
+-- Classification prompt shortlisting: record estimated prompt tokens saved per LLM call
+ALTER TABLE llm_usage_log ADD COLUMN IF NOT EXISTS prompt_tokens_saved INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,34 @@
+-- Firm-level classification memo
+-- Last accepted decision per (firm, normalised term, entity type, document type),
+-- read by classify_project before Tier 1. CA review decisions use document_type 'any'.
+
+CREATE TABLE IF NOT EXISTS classification_memo (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  firm_id UUID NOT NULL REFERENCES firms(id) ON DELETE CASCADE,
+  term_norm TEXT NOT NULL,
+  entity_type TEXT NOT NULL,
+  document_type TEXT NOT NULL,
+  target_row INTEGER NOT NULL,
+  target_sheet TEXT NOT NULL,
+  target_label TEXT,
+  confidence NUMERIC(5,4) NOT NULL,
+  source TEXT NOT NULL CHECK (source IN ('precedent', 'rule', 'vector', 'ai', 'ca_reviewed')),
+  matched_rule_id INTEGER,
+  matched_precedent_id UUID,
+  rules_version TEXT NOT NULL,
+  decided_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  UNIQUE (firm_id, term_norm, entity_type, document_type)
+);
+
+-- One lookup per project: firm + entity type + IN (terms)
+CREATE INDEX IF NOT EXISTS idx_classification_memo_lookup
+  ON classification_memo(firm_id, entity_type, term_norm);
+
+-- Targeted invalidation when a (possibly global) precedent for a term changes
+CREATE INDEX IF NOT EXISTS idx_classification_memo_term
+  ON classification_memo(term_norm);
+
+ALTER TABLE classification_memo ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Classification memo by firm" ON classification_memo
+    FOR ALL USING (firm_id IN (SELECT firm_id FROM users WHERE id = auth.uid()));
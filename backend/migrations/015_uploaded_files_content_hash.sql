@@ -0,0 +1,2 @@
+-- Streaming uploads: SHA-256 of each uploaded file, computed while it is streamed to storage
+ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS content_hash TEXT;
@@ -0,0 +1,4 @@
+-- Content-hash deduplication: find a firm's earlier copy of the same upload
+CREATE INDEX IF NOT EXISTS idx_uploaded_files_firm_content_hash
+    ON uploaded_files(firm_id, content_hash)
+    WHERE content_hash IS NOT NULL;
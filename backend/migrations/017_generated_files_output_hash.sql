@@ -0,0 +1,6 @@
+-- Regeneration short-circuit: fingerprint of the transformed data + template behind each generated file
+ALTER TABLE generated_files ADD COLUMN IF NOT EXISTS output_hash TEXT;
+
+-- Latest version per project is a single index probe
+CREATE INDEX IF NOT EXISTS idx_generated_files_project_version
+    ON generated_files(cma_project_id, version DESC);
@@ -0,0 +1,20 @@
+-- Bulk export: latest generated file of each project, one row per project.
+-- Keyset-paged on cma_project_id so large portfolios are never cut off at the API row limit.
+-- Answered from idx_generated_files_project_version (017).
+CREATE OR REPLACE FUNCTION latest_generated_files(
+  p_firm_id UUID,
+  p_project_ids UUID[] DEFAULT NULL,
+  p_after_project_id UUID DEFAULT NULL,
+  p_limit INT DEFAULT 500
+)
+RETURNS TABLE(cma_project_id UUID, file_name TEXT, storage_path TEXT, version INT)
+LANGUAGE sql STABLE
+AS $$
+  SELECT DISTINCT ON (gf.cma_project_id) gf.cma_project_id, gf.file_name, gf.storage_path, gf.version
+  FROM generated_files gf
+  WHERE gf.firm_id = p_firm_id
+    AND (p_project_ids IS NULL OR gf.cma_project_id = ANY(p_project_ids))
+    AND (p_after_project_id IS NULL OR gf.cma_project_id > p_after_project_id)
+  ORDER BY gf.cma_project_id, gf.version DESC
+  LIMIT p_limit;
+$$;
@@ -0,0 +1,120 @@
+"""
+Benchmark CMA generation: per-request openpyxl load/save vs the cached XML-patching writer.
+
+Reports per-generation latency (p50/p95) and peak Python memory (tracemalloc)
+for both paths over the same data. Uses the real template when available
+(CMA_TEMPLATE_PATH or reference/CMA.xlsm), otherwise a synthetic workbook of
+similar shape.
+
+Usage:
+    python backend/scripts/bench_cma_writer.py [--template PATH] [--runs 20]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import openpyxl
+
+from app.services.excel import cma_writer
+from app.services.excel.cma_writer import CMAWriter
+from app.services.excel.generator import _get_template_path
+
+SHEETS = ("operating_statement", "balance_sheet", "cash_flow", "ratios", "assumptions")
+ROWS = 289
+
+
+def synthetic_template(path: str) -> None:
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for name in SHEETS:
+        ws = wb.create_sheet(name)
+        for r in range(1, ROWS + 1):
+            ws.cell(row=r, column=1, value=f"Row {r}")
+            for c in range(2, 9):
+                ws.cell(row=r, column=c, value=f"=B{r}*{c}" if c > 5 else r * c)
+    wb.save(path)
+
+
+def sample_data() -> Dict[str, Dict[int, float]]:
+    return {name: {r: float(r * 1000) for r in range(3, ROWS, 2)} for name in SHEETS[:2]}
+
+
+def write_openpyxl(template: str, data: Dict[str, Dict[int, float]]) -> int:
+    wb = openpyxl.load_workbook(template, keep_vba=template.endswith(".xlsm"))
+    for sheet, rows in data.items():
+        if sheet in wb.sheetnames:
+            for r, v in rows.items():
+                wb[sheet].cell(row=r, column=5).value = v
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.tell()
+
+
+def write_patched(template: str, data: Dict[str, Dict[int, float]]) -> int:
+    buf = io.BytesIO()
+    CMAWriter(template).write(data, buf)
+    return buf.tell()
+
+
+def measure(fn: Callable[[str, dict], int], template: str, data: dict, runs: int) -> Dict[str, float]:
+    times = []
+    tracemalloc.start()
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        size = fn(template, data)
+        times.append((time.perf_counter() - t0) * 1000)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times.sort()
+    return {
+        "p50_ms": statistics.median(times),
+        "p95_ms": times[min(int(len(times) * 0.95), len(times) - 1)],
+        "peak_mb": peak / (1024 * 1024),
+        "output_kb": size / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare CMA generation latency and memory")
+    parser.add_argument("--template", help="template path (default: configured CMA template, else synthetic)")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    template = args.template
+    tmp_dir = None
+    if not template:
+        try:
+            template = _get_template_path()
+        except FileNotFoundError:
+            tmp_dir = tempfile.TemporaryDirectory()
+            template = os.path.join(tmp_dir.name, "synthetic.xlsx")
+            synthetic_template(template)
+            print(f"No CMA template configured; using a synthetic {len(SHEETS)}-sheet workbook")
+
+    data = sample_data()
+    baseline = measure(write_openpyxl, template, data, args.runs)
+    cma_writer._template_cache.clear()
+    patched = measure(write_patched, template, data, args.runs)
+
+    print(f"{'Writer':<22}{'p50 ms':>10}{'p95 ms':>10}{'Peak MB':>10}{'Out KB':>10}")
+    for name, r in (("openpyxl per request", baseline), ("cached XML patch", patched)):
+        print(f"{name:<22}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['peak_mb']:>10.1f}{r['output_kb']:>10.0f}")
+    print(f"\nSpeed-up (p50): {baseline['p50_ms'] / patched['p50_ms']:.1f}x")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark image preprocessing for vision extraction.
+
+For every JPEG/PNG in a directory, reports original vs optimised size and
+preprocessing time under the chosen document-type profile. With --live the
+image is also extracted twice through Gemini (original, then optimised) and
+the report adds per-call latency and fidelity: the share of line items from
+the original run found again, with the same amount, in the optimised run.
+
+Usage:
+    python backend/scripts/bench_image_optimizer.py IMAGE_DIR [--document-type trial_balance] [--live] [--json]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.services.classification.rule_matcher import normalize_indian_term
+from app.services.extraction import vision_extractor
+from app.services.extraction.image_optimizer import optimize_image
+
+MIME_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+
+
+def _line_item_keys(data: Dict[str, Any]) -> set:
+    return {
+        (normalize_indian_term(str(li.get("name", ""))), round(float(li.get("amount") or 0), 2))
+        for li in data.get("line_items", [])
+    }
+
+
+def _extract(file_bytes: bytes, name: str, mime: str, document_type: str, optimize: bool) -> Dict[str, Any]:
+    with patch.object(vision_extractor, "VISION_IMAGE_OPTIMIZE", optimize):
+        t0 = time.perf_counter()
+        data = vision_extractor.extract_with_vision(file_bytes, name, mime, "benchmark", "benchmark", document_type)
+    return {"latency_ms": (time.perf_counter() - t0) * 1000, "data": data}
+
+
+def bench_file(path: Path, document_type: str, live: bool) -> Dict[str, Any]:
+    raw = path.read_bytes()
+    mime = MIME_TYPES[path.suffix.lower()]
+
+    optimized, _, stats = optimize_image(raw, mime, document_type)
+    row: Dict[str, Any] = {
+        "file": path.name,
+        "original_kb": round(len(raw) / 1024, 1),
+        "optimized_kb": round(len(optimized) / 1024, 1),
+        "reduction": round(1 - len(optimized) / len(raw), 4) if raw else 0.0,
+        "preprocess_ms": stats.get("latency_ms", 0),
+    }
+
+    if live:
+        before = _extract(raw, path.name, mime, document_type, optimize=False)
+        after = _extract(raw, path.name, mime, document_type, optimize=True)
+        base_keys = _line_item_keys(before["data"])
+        row.update({
+            "latency_before_ms": round(before["latency_ms"], 1),
+            "latency_after_ms": round(after["latency_ms"], 1),
+            "items_before": len(before["data"].get("line_items", [])),
+            "items_after": len(after["data"].get("line_items", [])),
+            "fidelity": round(len(base_keys & _line_item_keys(after["data"])) / len(base_keys), 4) if base_keys else None,
+        })
+    return row
+
+
+def print_report(rows: List[Dict[str, Any]]) -> None:
+    live = rows and "fidelity" in rows[0]
+    header = f"{'File':<32}{'Orig KB':>10}{'Opt KB':>10}{'Saved':>8}{'Prep ms':>9}"
+    if live:
+        header += f"{'Before ms':>11}{'After ms':>10}{'Items':>9}{'Fidelity':>10}"
+    print(header)
+    for r in rows:
+        line = f"{r['file'][:31]:<32}{r['original_kb']:>10}{r['optimized_kb']:>10}{r['reduction']:>8.0%}{r['preprocess_ms']:>9}"
+        if live:
+            fid = f"{r['fidelity']:.0%}" if r["fidelity"] is not None else "-"
+            line += f"{r['latency_before_ms']:>11}{r['latency_after_ms']:>10}{r['items_before']:>4}/{r['items_after']:<4}{fid:>10}"
+        print(line)
+
+    if rows:
+        total_in = sum(r["original_kb"] for r in rows)
+        total_out = sum(r["optimized_kb"] for r in rows)
+        print(f"\nTotal: {total_in:.0f} KB -> {total_out:.0f} KB ({1 - total_out / total_in:.0%} smaller)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare vision extraction inputs before and after image optimisation")
+    parser.add_argument("images", type=Path, help="directory of .jpg/.jpeg/.png statements")
+    parser.add_argument("--document-type", default="default", help="profile to apply (profit_and_loss, balance_sheet, trial_balance)")
+    parser.add_argument("--live", action="store_true", help="also run Gemini extraction on both versions (needs GOOGLE_API_KEY)")
+    parser.add_argument("--json", action="store_true", help="print rows as JSON")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in args.images.iterdir() if p.suffix.lower() in MIME_TYPES)
+    rows = [bench_file(p, args.document_type, args.live) for p in paths]
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_report(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+Golden-dataset replay benchmark for classification.
+
+Runs every case in a directory of anonymised extracted statements through
+classify_project against an in-memory Supabase stand-in and a fake Gemini
+that replays each case's recorded answers. Reports per-tier hit rates,
+accuracy and time spent, p50/p95 project latency, LLM calls and tokens, so
+matcher, threshold or prompt changes can be judged before they ship.
+
+Tier time is measured around each tier's entry point (memo lookup, precedent
+lookup, rule match, vector index build and search, AI batches). A tier runs
+for every item that reaches it, not only the items it answers.
+
+Case file format (one JSON file per project):
+    name, entity_type, extracted_data (as stored on cma_projects),
+    expected: [{item_name, document_type, target_row, target_sheet}],
+    precedents: [{source_term, target_row, target_sheet, scope}]  (optional),
+    llm_answers: {item_name: {target_row, target_sheet, target_label, confidence}}  (optional)
+
+Usage:
+    python backend/scripts/replay_golden.py [--dataset backend/tests/golden] [--passes 2] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch
+from uuid import uuid4
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.services.classification import classifier, vector_matcher
+from app.services.classification.vector_matcher import TfidfIndex
+from app.services.classification.rule_matcher import normalize_indian_term
+from app.services.gemini_client import GeminiResponse, estimate_tokens
+
+DEFAULT_DATASET = backend_dir / "tests" / "golden"
+TIERS = ("memo", "precedent", "rule", "vector", "ai", "unclassified")
+# Tier -> (object, attribute) of the calls timed for it
+TIMED_CALLS = {
+    "memo": [(classifier, "lookup_memos")],
+    "precedent": [(classifier, "get_best_precedent")],
+    "rule": [(classifier, "classify_by_rules")],
+    "vector": [(classifier, "get_firm_index"), (TfidfIndex, "best_match")],
+    "ai": [(classifier, "_classify_with_ai")],
+}
+SUPABASE_TARGETS = (
+    "app.services.classification.precedent_matcher.get_supabase",
+    "app.services.classification.vector_matcher.get_supabase",
+    "app.services.classification.memo.get_supabase",
+    "app.services.gemini_client.get_supabase",
+)
+
+
+# ── Local Supabase stand-in ───────────────────────────────────────────────
+class ReplayQuery:
+    """Just enough of the PostgREST builder for the classification path (eq/in_ filters, upsert)."""
+
+    def __init__(self, db: "ReplaySupabase", table: str) -> None:
+        self._db = db
+        self._table = table
+        self._filters: List[tuple] = []
+        self._op = "select"
+        self._payload: Any = None
+        self._on_conflict: Optional[str] = None
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self._filters.append((column, lambda v, value=value: str(v) == str(value)))
+        return self
+
+    def in_(self, column, values):
+        allowed = {str(v) for v in values}
+        self._filters.append((column, lambda v: str(v) in allowed))
+        return self
+
+    def or_(self, *args, **kwargs):
+        return self
+
+    def insert(self, payload):
+        self._op, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: Optional[str] = None):
+        self._op, self._payload, self._on_conflict = "upsert", payload, on_conflict
+        return self
+
+    def update(self, payload):
+        self._op, self._payload = "update", payload
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    def _matches(self, row: dict) -> bool:
+        return all(column in row and test(row[column]) for column, test in self._filters)
+
+    def execute(self):
+        rows = self._db.tables.setdefault(self._table, [])
+        payload = self._payload if isinstance(self._payload, list) else [self._payload]
+        data: List[dict] = []
+
+        if self._op == "select":
+            data = [dict(r) for r in rows if self._matches(r)]
+        elif self._op == "insert":
+            data = [dict(p) for p in payload]
+            rows.extend(data)
+        elif self._op == "upsert":
+            keys = (self._on_conflict or "id").split(",")
+            for p in payload:
+                existing = next((r for r in rows if all(r.get(k) == p.get(k) for k in keys)), None)
+                if existing is not None:
+                    existing.update(p)
+                else:
+                    rows.append(dict(p))
+                data.append(dict(p))
+        elif self._op == "update":
+            for r in rows:
+                if self._matches(r):
+                    r.update(self._payload)
+                    data.append(dict(r))
+        elif self._op == "delete":
+            data = [r for r in rows if self._matches(r)]
+            self._db.tables[self._table] = [r for r in rows if not self._matches(r)]
+
+        return type("Result", (), {"data": data, "count": len(data)})()
+
+
+class ReplaySupabase:
+    def __init__(self) -> None:
+        self.tables: Dict[str, List[dict]] = defaultdict(list)
+
+    def table(self, name: str) -> ReplayQuery:
+        return ReplayQuery(self, name)
+
+
+# ── Fake Gemini ───────────────────────────────────────────────────────────
+class FakeGemini:
+    """Replays recorded per-item answers; anything unrecorded comes back as an uncertain guess."""
+
+    def __init__(self, answers: Dict[str, dict]) -> None:
+        self.answers = {normalize_indian_term(k): v for k, v in answers.items()}
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def __call__(self) -> "FakeGemini":
+        # Stands in for the GeminiClient class: classify_project instantiates it
+        return self
+
+    def generate(self, model: str, prompt: str, **kwargs) -> GeminiResponse:
+        items_block = prompt.split("## Items to Classify", 1)[1].split("## Output Format", 1)[0]
+        items = json.loads(items_block.strip())
+
+        out = []
+        for item in items:
+            recorded = self.answers.get(normalize_indian_term(item["item_name"]))
+            entry = {"target_row": None, "target_sheet": None, "target_label": None, "confidence": 0.3, "reasoning": "unrecorded"}
+            if recorded:
+                entry = {**entry, **recorded, "reasoning": "recorded"}
+            out.append({"item_name": item["item_name"], "document_type": item.get("document_type"), **entry})
+
+        text = json.dumps(out)
+        resp = GeminiResponse(
+            text=text,
+            input_tokens=estimate_tokens(prompt),
+            output_tokens=estimate_tokens(text),
+            cost_usd=0.0,
+            latency_ms=0,
+            model=model,
+        )
+        self.calls += 1
+        self.input_tokens += resp.input_tokens
+        self.output_tokens += resp.output_tokens
+        return resp
+
+
+# ── Replay ────────────────────────────────────────────────────────────────
+def load_cases(dataset: Path) -> List[dict]:
+    cases = []
+    for path in sorted(dataset.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            case = json.load(f)
+        case.setdefault("name", path.stem)
+        cases.append(case)
+    return cases
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[idx]
+
+
+def _timed(fn, durations: List[float]):
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            durations.append((time.perf_counter() - t0) * 1000)
+    return wrapper
+
+
+def replay_case(case: dict, passes: int = 1) -> List[dict]:
+    """Classify one case *passes* times (later passes see the memo written by earlier ones)."""
+    db = ReplaySupabase()
+    firm_id = str(uuid4())
+    for p in case.get("precedents", []):
+        db.tables["classification_precedents"].append({
+            "id": str(uuid4()),
+            "firm_id": firm_id if p.get("scope", "firm") == "firm" else None,
+            "entity_type": case["entity_type"],
+            "scope": p.get("scope", "firm"),
+            "created_at": "2025-01-01T00:00:00+00:00",
+            **p,
+        })
+
+    gemini = FakeGemini(case.get("llm_answers", {}))
+    expected = {
+        (e["item_name"], e["document_type"]): (e["target_row"], e["target_sheet"])
+        for e in case["expected"]
+    }
+    # Results come back one per line item in this order; the same name may appear in several documents
+    documents = [item["document_type"] for item in classifier.flatten_line_items(case["extracted_data"])]
+    tier_calls: Dict[str, List[float]] = {tier: [] for tier in TIMED_CALLS}
+
+    runs = []
+    with ExitStack() as stack:
+        for target in SUPABASE_TARGETS:
+            stack.enter_context(patch(target, return_value=db))
+        stack.enter_context(patch.object(classifier, "get_db_extracted_data", lambda *a: case["extracted_data"]))
+        stack.enter_context(patch.object(classifier, "GeminiClient", gemini))
+        stack.enter_context(patch.dict(os.environ, {"LLM_CLASSIFICATION_ESCALATION_MODEL": ""}))
+        for tier, targets in TIMED_CALLS.items():
+            for owner, attr in targets:
+                stack.enter_context(patch.object(owner, attr, _timed(getattr(owner, attr), tier_calls[tier])))
+
+        for n in range(passes):
+            vector_matcher.invalidate(firm_id)
+            calls_before, in_before, out_before = gemini.calls, gemini.input_tokens, gemini.output_tokens
+            for durations in tier_calls.values():
+                durations.clear()
+
+            t0 = time.perf_counter()
+            res = classifier.classify_project(str(uuid4()), firm_id, case["entity_type"])
+            latency_ms = (time.perf_counter() - t0) * 1000
+
+            items = []
+            for item, document in zip(res.items, documents, strict=True):
+                want = expected.get((item.item_name, document))
+                items.append({
+                    "source": item.source,
+                    "scored": want is not None,
+                    "correct": want is not None and (item.target_row, item.target_sheet) == want,
+                })
+            runs.append({
+                "case": case["name"],
+                "pass": n + 1,
+                "latency_ms": latency_ms,
+                "tier_ms": {tier: list(durations) for tier, durations in tier_calls.items()},
+                "items": items,
+                "llm_calls": gemini.calls - calls_before,
+                "input_tokens": gemini.input_tokens - in_before,
+                "output_tokens": gemini.output_tokens - out_before,
+            })
+    return runs
+
+
+def summarize(runs: List[dict]) -> Dict[str, Any]:
+    tiers = {t: {"hits": 0, "scored": 0, "correct": 0} for t in TIERS}
+    total = scored = correct = 0
+    for run in runs:
+        for item in run["items"]:
+            tier = tiers.setdefault(item["source"], {"hits": 0, "scored": 0, "correct": 0})
+            tier["hits"] += 1
+            total += 1
+            if item["scored"]:
+                tier["scored"] += 1
+                scored += 1
+                tier["correct"] += item["correct"]
+                correct += item["correct"]
+
+    latencies = [r["latency_ms"] for r in runs]
+    tier_ms: Dict[str, List[float]] = defaultdict(list)
+    for run in runs:
+        for name, durations in run["tier_ms"].items():
+            tier_ms[name].extend(durations)
+
+    def tier_latency(name: str) -> Dict[str, float]:
+        durations = tier_ms.get(name, [])
+        return {
+            "calls": len(durations),
+            "total_ms": round(sum(durations), 2),
+            "p50_ms": round(_percentile(durations, 50), 3),
+            "p95_ms": round(_percentile(durations, 95), 3),
+        }
+    return {
+        "projects": len(runs),
+        "items": total,
+        "accuracy": round(correct / scored, 4) if scored else 0.0,
+        "tiers": {
+            name: {
+                "hit_rate": round(t["hits"] / total, 4) if total else 0.0,
+                "accuracy": round(t["correct"] / t["scored"], 4) if t["scored"] else None,
+                "hits": t["hits"],
+                "latency": tier_latency(name),
+            }
+            for name, t in tiers.items()
+        },
+        "latency_ms": {"p50": round(_percentile(latencies, 50), 2), "p95": round(_percentile(latencies, 95), 2)},
+        "llm_calls": sum(r["llm_calls"] for r in runs),
+        "input_tokens": sum(r["input_tokens"] for r in runs),
+        "output_tokens": sum(r["output_tokens"] for r in runs),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Projects: {report['projects']}   Items: {report['items']}   Accuracy: {report['accuracy']:.1%}")
+    print(f"Latency p50: {report['latency_ms']['p50']:.1f} ms   p95: {report['latency_ms']['p95']:.1f} ms")
+    print(f"LLM calls: {report['llm_calls']}   Tokens in/out: {report['input_tokens']}/{report['output_tokens']}")
+    print()
+    print(f"{'Tier':<14}{'Hits':>6}{'Hit rate':>10}{'Accuracy':>10}{'Calls':>8}{'Total ms':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for name, t in report["tiers"].items():
+        acc = f"{t['accuracy']:.1%}" if t["accuracy"] is not None else "-"
+        lat = t["latency"]
+        print(f"{name:<14}{t['hits']:>6}{t['hit_rate']:>10.1%}{acc:>10}"
+              f"{lat['calls']:>8}{lat['total_ms']:>10.1f}{lat['p50_ms']:>9.2f}{lat['p95_ms']:>9.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay golden classification cases and report accuracy/latency per tier")
+    parser.add_argument("--dataset", type=Path, default=DEFAULT_DATASET, help="directory of case JSON files")
+    parser.add_argument("--passes", type=int, default=1, help="classify each case N times (N>1 exercises the memo)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    runs = []
+    for case in load_cases(args.dataset):
+        runs.extend(replay_case(case, passes=args.passes))
+
+    report = summarize(runs)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -118,6 +118,9 @@ class MockQueryBuilder:
     def update(self, *args, **kwargs):
         return self
 
+    def upsert(self, *args, **kwargs):
+        return self
+
     def delete(self, *args, **kwargs):
         return self
 
@@ -133,6 +136,10 @@ class MockQueryBuilder:
     def in_(self, *args, **kwargs):
         return self
 
+    @property
+    def not_(self):
+        return self
+
     def or_(self, *args, **kwargs):
         return self
 
@@ -166,6 +173,7 @@ class MockSupabase:
 
     def __init__(self):
         self._tables: dict[str, MockQueryBuilder] = {}
+        self._rpcs: dict[str, MockQueryBuilder] = {}
         self.storage = MagicMock()
 
     def set_table(self, name: str, data: list | None = None, count: int | None = None):
@@ -176,6 +184,14 @@ class MockSupabase:
             return self._tables[name]
         return MockQueryBuilder()
 
+    def set_rpc(self, name: str, data: list | None = None):
+        self._rpcs[name] = MockQueryBuilder(data=data)
+
+    def rpc(self, name: str, params: dict | None = None):
+        if name in self._rpcs:
+            return self._rpcs[name]
+        return MockQueryBuilder()
+
 
 # ── Fixtures ────────────────────────────────────────────────
 
@@ -196,12 +212,17 @@ def mock_db():
         # Phase 04 — extraction
         "app.api.v1.endpoints.extraction.get_supabase",
         "app.services.extraction.merger.get_supabase",
+        "app.services.extraction.extractor.get_supabase",
+        "app.services.export.get_supabase",
         "app.services.gemini_client.get_supabase",
         # Phase 05 — classification
         "app.api.v1.endpoints.classification.get_supabase",
         "app.api.v1.endpoints.review.get_supabase",
+        "app.api.v1.endpoints.precedents.get_supabase",
         "app.services.classification.precedent_matcher.get_supabase",
         "app.services.classification.review_service.get_supabase",
+        "app.services.classification.vector_matcher.get_supabase",
+        "app.services.classification.memo.get_supabase",
         # Phase 06 — generation
         "app.api.v1.endpoints.generation.get_supabase",
         "app.services.excel.generator.get_supabase",
@@ -65,3 +65,597 @@ def test_golden_mehta_classification(monkeypatch):
     sales_item = next(i for i in res.items if i.item_name == "Sales")
     assert sales_item.target_row == 5
     assert not sales_item.needs_review
+
+
+def test_vector_index_matches_variant_spelling():
+    from app.services.classification.vector_matcher import TfidfIndex
+
+    index = TfidfIndex()
+    index.add("Salary & Wages", 20, "operating_statement", "Salaries", "rule", "7.0")
+    index.add("Rent Paid", 22, "operating_statement", "Rent", "rule", "8.0")
+    index.add("Bank Charges", 23, "operating_statement", "Interest & Bank Charges", "precedent", "p1")
+
+    match = index.best_match("Salary and Wages A/c")
+    assert match is not None
+    assert match.target_row == 20
+    assert match.kind == "rule"
+    assert match.margin > 0.0
+
+    assert index.best_match("zzzz") is None
+
+
+def test_vector_index_replaces_updated_precedent():
+    from app.services.classification.vector_matcher import TfidfIndex
+
+    index = TfidfIndex()
+    index.add("Computer Repairs", 22, "operating_statement", "Repairs", "precedent", "p1")
+    index.add("Computer Repairs", 24, "operating_statement", "Misc", "precedent", "p1")
+
+    assert len(index) == 1
+    match = index.best_match("Computer Repairs")
+    assert match.target_row == 24
+    assert match.score > 0.99
+
+
+def test_prompt_builder_shortlists_rules_and_precedents():
+    from app.services.classification.prompt_builder import PromptBuilder
+    from app.services.classification.vector_matcher import TfidfIndex
+
+    rules = filter_rules("trading", "")
+    index = TfidfIndex()
+    for rule in rules:
+        for i, term in enumerate(rule.source_terms):
+            index.add(term, rule.target_row, rule.target_sheet, rule.target_label, "rule", f"{rule.id}.{i}")
+    index.add("Computer Repairs", 22, "operating_statement", "Precedent matched", "precedent", "p1")
+
+    builder = PromptBuilder("trading", rules, index)
+    prompt = builder.build([{"item_name": "Computer Repairs", "item_amount": 100}], "This is batch 1 of 1.")
+
+    assert prompt.precedents_count == 1
+    assert '"term": "Computer Repairs"' in prompt.prompt
+    assert prompt.rules_count <= len(rules)
+    assert prompt.prompt_tokens_saved >= 0
+
+
+def test_repeated_items_classified_once(monkeypatch):
+    def mock_db_data(*args, **kwargs):
+        return {
+            "trial_balance": {
+                "line_items": [
+                    {"name": "Xyz Retainer Fees", "amount": 1000},
+                    {"name": "XYZ Retainer Fees A/c", "amount": 2000},
+                ]
+            },
+            "profit_and_loss": {
+                "line_items": [
+                    {"name": "Xyz Retainer Fees", "amount": 3000},
+                    {"name": "xyz retainer fees", "amount": 4000},
+                ]
+            },
+        }
+    monkeypatch.setattr("app.services.classification.classifier.get_db_extracted_data", mock_db_data)
+
+    calls = []
+
+    class MockGeminiResponse:
+        text = json.dumps([
+            {"item_name": "Xyz Retainer Fees", "document_type": "trial_balance", "target_row": 22,
+             "target_sheet": "operating_statement", "confidence": 0.9, "reasoning": "tb"},
+            {"item_name": "Xyz Retainer Fees", "document_type": "profit_and_loss", "target_row": 23,
+             "target_sheet": "operating_statement", "confidence": 0.9, "reasoning": "pl"},
+        ])
+        input_tokens = 10
+        output_tokens = 10
+        cost_usd = 0.0
+        latency_ms = 100
+        model = "gemini"
+
+    class MockGeminiClient:
+        def generate(self, *args, **kwargs):
+            calls.append(kwargs["prompt"])
+            return MockGeminiResponse()
+
+    monkeypatch.setattr("app.services.classification.classifier.GeminiClient", MockGeminiClient)
+
+    res = classify_project(str(uuid4()), str(uuid4()), "trading")
+
+    assert len(calls) == 1
+    assert res.total_items == 4
+    assert res.unique_items == 2
+    assert res.dedupe_ratio == 2.0
+    assert [i.item_amount for i in res.items] == [3000, 4000, 1000, 2000]
+    assert [i.target_row for i in res.items] == [23, 23, 22, 22]
+    assert res.items[3].item_name == "XYZ Retainer Fees A/c"
+
+
+def test_plan_batches_respects_token_budget(monkeypatch):
+    from app.services.classification import batching
+
+    monkeypatch.setitem(batching.PRICING, "test-model", {
+        "input": 0.0, "output": 0.0, "batch_token_budget": 1_000, "max_output_tokens": 100_000,
+    })
+    items = [{"item_name": f"Ledger {i} " + "x" * 100, "item_amount": i, "document_type": "trial_balance"} for i in range(30)]
+
+    batches = batching.plan_batches(items, "test-model", shared_tokens=400)
+
+    assert sum(len(b) for b in batches) == 30
+    assert len(batches) > 1
+    for b in batches:
+        assert sum(batching.item_tokens(i)[0] for i in b) <= 600
+    assert batching.split_batch(batches[0])[0] == batches[0][:len(batches[0]) // 2]
+    assert batching.split_batch(items[:1]) == []
+
+
+def test_plan_batches_leaves_output_headroom(monkeypatch):
+    from app.services.classification import batching
+
+    monkeypatch.setitem(batching.PRICING, "test-model", {
+        "input": 0.0, "output": 0.0, "batch_token_budget": 1_000_000, "max_output_tokens": 1_000,
+    })
+    items = [{"item_name": f"Ledger {i}", "item_amount": i, "document_type": "trial_balance"} for i in range(40)]
+
+    assert batching.batch_limits("test-model")[1] == 1_000
+    batches = batching.plan_batches(items, "test-model", shared_tokens=0)
+
+    assert sum(len(b) for b in batches) == 40
+    for b in batches:
+        assert sum(batching.item_tokens(i)[1] for i in b) <= 1_000 * batching.OUTPUT_SAFETY_FACTOR
+
+
+def test_batches_are_budgeted_against_shortlisted_rules():
+    from app.services.classification.batching import batch_limits, item_tokens, plan_batches
+    from app.services.classification.prompt_builder import PromptBuilder
+    from app.services.classification.rules_loader import ClassificationRule
+    from app.services.classification.vector_matcher import TfidfIndex
+
+    # A rules file bigger than the whole batch budget
+    rules = [
+        ClassificationRule(
+            id=i, source_terms=[f"ledger head {i} expense account"], target_row=10 + i % 200,
+            target_sheet="operating_statement", target_label=f"Row {i}", entity_types=["trading"],
+            document_types=["trial_balance"], priority=1, match_type="fuzzy",
+        )
+        for i in range(500)
+    ]
+    index = TfidfIndex()
+    for rule in rules:
+        index.add(rule.source_terms[0], rule.target_row, rule.target_sheet, rule.target_label, "rule", f"{rule.id}.0")
+    builder = PromptBuilder("trading", rules, index)
+    budget, _ = batch_limits("gemini-2.0-flash")
+    assert builder.full_rules_tokens > budget
+
+    items = [{"item_name": f"Ledger head {i} expense", "item_amount": i, "document_type": "trial_balance"} for i in range(200)]
+    batches = plan_batches(items, "gemini-2.0-flash", builder.shared_tokens, builder.context_tokens)
+
+    assert sum(len(b) for b in batches) == 200
+    assert len(batches) <= 10
+    for b in batches:
+        context = {}
+        for item in b:
+            context.update(builder.context_tokens(item))
+        assert builder.shared_tokens + sum(context.values()) + sum(item_tokens(i)[0] for i in b) <= budget
+
+
+def test_malformed_ai_batch_is_split_and_retried(monkeypatch):
+    names = ["Xyz Retainer Fees", "Abc Misc Charges", "Pqr Sundry Outgo", "Lmn Special Levy"]
+
+    def mock_db_data(*args, **kwargs):
+        return {"trial_balance": {"line_items": [{"name": n, "amount": 100} for n in names]}}
+    monkeypatch.setattr("app.services.classification.classifier.get_db_extracted_data", mock_db_data)
+    monkeypatch.setattr("app.services.classification.classifier.get_firm_index", lambda *a: None)
+
+    batch_sizes = []
+    output_limits = []
+
+    class MockGeminiResponse:
+        input_tokens = 10
+        output_tokens = 10
+        cost_usd = 0.0
+        latency_ms = 100
+        model = "gemini"
+
+        def __init__(self, text):
+            self.text = text
+
+    class MockGeminiClient:
+        def generate(self, *args, **kwargs):
+            prompt = kwargs["prompt"]
+            batch = [n for n in names if n in prompt.split("## Items to Classify")[1].split("## Output Format")[0]]
+            batch_sizes.append(len(batch))
+            output_limits.append((kwargs["model"], kwargs["max_output_tokens"]))
+            if len(batch) > 2:
+                return MockGeminiResponse('[{"item_name": "Xyz Retainer Fees", "target_row": 22')
+            return MockGeminiResponse(json.dumps([
+                {"item_name": n, "target_row": 22, "target_sheet": "operating_statement", "confidence": 0.9}
+                for n in batch
+            ]))
+
+    monkeypatch.setattr("app.services.classification.classifier.GeminiClient", MockGeminiClient)
+
+    res = classify_project(str(uuid4()), str(uuid4()), "trading")
+
+    assert batch_sizes == [4, 2, 2]
+    assert res.classified_by_ai == 4
+    assert res.unclassified == 0
+    # The model's full output limit is requested; the safety factor only shapes the batches
+    from app.services.gemini_client import PRICING
+    assert all(limit == PRICING[model]["max_output_tokens"] for model, limit in output_limits)
+
+
+def test_partial_ai_response_requeues_only_missing_items(monkeypatch):
+    names = ["Xyz Retainer Fees", "Abc Misc Charges", "Pqr Sundry Outgo"]
+
+    def mock_db_data(*args, **kwargs):
+        return {"trial_balance": {"line_items": [{"name": n, "amount": 100} for n in names]}}
+    monkeypatch.setattr("app.services.classification.classifier.get_db_extracted_data", mock_db_data)
+    monkeypatch.setattr("app.services.classification.classifier.get_firm_index", lambda *a: None)
+
+    batches = []
+
+    class MockGeminiResponse:
+        input_tokens = 10
+        output_tokens = 10
+        cost_usd = 0.0
+        latency_ms = 100
+        model = "gemini"
+
+        def __init__(self, text):
+            self.text = text
+
+    class MockGeminiClient:
+        def generate(self, *args, **kwargs):
+            items = kwargs["prompt"].split("## Items to Classify")[1].split("## Output Format")[0]
+            batch = [n for n in names if n in items]
+            batches.append(batch)
+            entries = [
+                json.dumps({"item_name": n, "target_row": 22, "target_sheet": "operating_statement", "confidence": 0.9})
+                for n in batch
+            ]
+            # First response is cut off after the first complete entry
+            text = "[" + entries[0] + ', {"item_name": "Abc' if len(batch) == 3 else "[" + ",".join(entries) + "]"
+            return MockGeminiResponse(text)
+
+    monkeypatch.setattr("app.services.classification.classifier.GeminiClient", MockGeminiClient)
+
+    res = classify_project(str(uuid4()), str(uuid4()), "trading")
+
+    assert batches == [names, names[1:]]
+    assert res.classified_by_ai == 3
+    assert res.unclassified == 0
+
+
+def test_low_confidence_items_escalate_to_stronger_model(monkeypatch):
+    names = ["Xyz Retainer Fees", "Abc Misc Charges"]
+
+    def mock_db_data(*args, **kwargs):
+        return {"trial_balance": {"line_items": [{"name": n, "amount": 100} for n in names]}}
+    monkeypatch.setattr("app.services.classification.classifier.get_db_extracted_data", mock_db_data)
+    monkeypatch.setattr("app.services.classification.classifier.get_firm_index", lambda *a: None)
+    monkeypatch.setenv("LLM_CLASSIFICATION_MODEL", "gemini-2.0-flash")
+    monkeypatch.setenv("LLM_CLASSIFICATION_ESCALATION_MODEL", "gemini-2.5-pro")
+
+    calls = []
+    logged = []
+    monkeypatch.setattr(
+        "app.services.classification.classifier.log_llm_usage",
+        lambda firm_id, project_id, model, task_type, *a, **kw: logged.append((model, task_type)),
+    )
+
+    class MockGeminiResponse:
+        input_tokens = 10
+        output_tokens = 10
+        latency_ms = 100
+
+        def __init__(self, text, model, cost):
+            self.text = text
+            self.model = model
+            self.cost_usd = cost
+
+    class MockGeminiClient:
+        def generate(self, *args, **kwargs):
+            model = kwargs["model"]
+            items = kwargs["prompt"].split("## Items to Classify")[1].split("## Output Format")[0]
+            batch = [n for n in names if n in items]
+            calls.append((model, batch))
+            if model == "gemini-2.0-flash":
+                conf = {"Xyz Retainer Fees": 0.95, "Abc Misc Charges": 0.4}
+                return MockGeminiResponse(json.dumps([
+                    {"item_name": n, "target_row": 22, "target_sheet": "operating_statement", "confidence": conf[n]}
+                    for n in batch
+                ]), model, 0.001)
+            return MockGeminiResponse(json.dumps([
+                {"item_name": n, "target_row": 24, "target_sheet": "operating_statement", "confidence": 0.9}
+                for n in batch
+            ]), model, 0.01)
+
+    monkeypatch.setattr("app.services.classification.classifier.GeminiClient", MockGeminiClient)
+
+    res = classify_project(str(uuid4()), str(uuid4()), "trading")
+
+    assert calls == [("gemini-2.0-flash", names), ("gemini-2.5-pro", ["Abc Misc Charges"])]
+    assert logged == [("gemini-2.0-flash", "classification"), ("gemini-2.5-pro", "classification_escalation")]
+    assert res.escalated_items == 1
+    assert res.escalation_cost_usd == pytest.approx(0.01)
+    assert res.needs_review == 0
+    assert next(i for i in res.items if i.item_name == "Abc Misc Charges").target_row == 24
+
+
+def test_coalescer_merges_concurrent_submissions():
+    import threading
+    from app.services.classification.coalescer import Coalescer
+
+    coalescer = Coalescer(window_seconds=5.0)
+    runs = []
+
+    def runner(payloads):
+        runs.append(list(payloads))
+        return [p * 10 for p in payloads]
+
+    results = {}
+    started = threading.Barrier(2)
+
+    def caller(n):
+        with coalescer.session():
+            started.wait()
+            results[n] = coalescer.submit("key", n, runner)
+
+    threads = [threading.Thread(target=caller, args=(n,)) for n in (1, 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+
+    assert results == {1: 10, 2: 20}
+    assert len(runs) == 1 and sorted(runs[0]) == [1, 2]
+
+    # A lone caller flushes without waiting for the window
+    with coalescer.session():
+        assert coalescer.submit("key", 3, runner) == 30
+
+
+def test_coalescer_follower_timeout_never_duplicates_work(monkeypatch):
+    import threading
+    import time
+    from app.services.classification import coalescer as coalescer_module
+
+    monkeypatch.setattr(coalescer_module, "FOLLOWER_TIMEOUT_SECONDS", 0.05)
+    runs = []
+
+    def runner(payloads):
+        runs.append(sorted(payloads))
+        time.sleep(0.3)
+        return [p * 10 for p in payloads]
+
+    def run_pair(coalescer):
+        results = {}
+        started = threading.Barrier(2)
+
+        def caller(n):
+            with coalescer.session():
+                started.wait()
+                results[n] = coalescer.submit("key", n, runner)
+
+        threads = [threading.Thread(target=caller, args=(n,)) for n in (1, 2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+        return results
+
+    # The leader is already running both payloads when the follower times out: it keeps waiting
+    assert run_pair(coalescer_module.Coalescer(window_seconds=5.0)) == {1: 10, 2: 20}
+    assert runs == [[1, 2]]
+
+    # The leader is still gathering (an idle session may yet submit): the follower withdraws and runs alone
+    runs.clear()
+    coalescer = coalescer_module.Coalescer(window_seconds=0.5)
+    with coalescer.session():
+        assert run_pair(coalescer) == {1: 10, 2: 20}
+    assert sorted(runs) == [[1], [2]]
+
+
+def test_coalesced_requests_share_batches_across_projects(monkeypatch):
+    from app.services.classification import classifier
+    from app.services.classification.prompt_builder import PromptBuilder
+    from app.services.gemini_client import GeminiResponse
+
+    logged = []
+    monkeypatch.setattr(
+        classifier, "log_llm_usage",
+        lambda firm_id, project_id, model, task_type, resp, *a, **kw: logged.append((project_id, resp.cost_usd)),
+    )
+
+    calls = []
+
+    class MockGeminiClient:
+        def generate(self, *args, **kwargs):
+            calls.append(kwargs["prompt"])
+            return GeminiResponse(
+                text=json.dumps([
+                    {"item_name": n, "target_row": 22, "target_sheet": "operating_statement", "confidence": 0.9}
+                    for n in ("Xyz Retainer Fees", "Abc Misc Charges")
+                ]),
+                input_tokens=100, output_tokens=40, cost_usd=0.03, latency_ms=10, model="gemini-2.0-flash",
+            )
+
+    builder = PromptBuilder("trading", filter_rules("trading", ""))
+    item_a = {"item_name": "Xyz Retainer Fees", "item_amount": 1, "document_type": "trial_balance"}
+    item_b = {"item_name": "Abc Misc Charges", "item_amount": 2, "document_type": "trial_balance"}
+    requests = [
+        classifier.AiTierRequest([item_a, item_b], builder, {}, "firm-1", "project-1"),
+        classifier.AiTierRequest([dict(item_a, item_amount=5)], builder, {}, "firm-1", "project-2"),
+    ]
+
+    outs = classifier._run_coalesced(MockGeminiClient(), "gemini-2.0-flash", "classification", requests)
+
+    assert len(calls) == 1
+    assert len(outs[0].decisions) == 2 and len(outs[1].decisions) == 1
+    assert outs[0].cost_usd == pytest.approx(0.02)
+    assert outs[1].cost_usd == pytest.approx(0.01)
+    assert sorted(p for p, _ in logged) == ["project-1", "project-2"]
+
+
+def test_coalescing_never_mixes_firms(monkeypatch):
+    from app.services.classification import classifier
+    from app.services.classification.prompt_builder import PromptBuilder
+
+    keys = []
+    monkeypatch.setattr(
+        classifier.classification_coalescer, "submit",
+        lambda key, payload, runner: keys.append(key) or classifier.AiTierResult(),
+    )
+    builder = PromptBuilder("trading", filter_rules("trading", ""))
+    for firm_id, project_id in (("firm-1", "p1"), ("firm-1", "p2"), ("firm-2", "p3")):
+        request = classifier.AiTierRequest([], builder, {}, firm_id, project_id)
+        classifier._classify_with_ai(None, "gemini-2.0-flash", "classification", "trading", request)
+
+    assert keys[0] == keys[1]
+    assert keys[2] != keys[0]
+
+
+def test_memo_answers_repeat_items_before_tiers(monkeypatch, mock_db):
+    from datetime import datetime, timezone
+    from app.services.classification.memo import rules_version
+
+    def mock_db_data(*args, **kwargs):
+        return {"trial_balance": {"line_items": [
+            {"name": "Xyz Retainer Fees A/c", "amount": 100},
+            {"name": "Abc Misc Charges", "amount": 200},
+        ]}}
+    monkeypatch.setattr("app.services.classification.classifier.get_db_extracted_data", mock_db_data)
+
+    now = datetime.now(timezone.utc).isoformat()
+    mock_db.set_table("classification_memo", data=[
+        {"term_norm": "xyz retainer fees", "document_type": "trial_balance", "target_row": 22,
+         "target_sheet": "operating_statement", "target_label": "Misc", "confidence": 0.9, "source": "ai",
+         "rules_version": rules_version(), "decided_at": now},
+        # Made under different rules — ignored
+        {"term_norm": "abc misc charges", "document_type": "trial_balance", "target_row": 23,
+         "target_sheet": "operating_statement", "confidence": 0.95, "source": "rule",
+         "rules_version": "stale", "decided_at": now},
+        # CA review outranks the document-specific memo
+        {"term_norm": "xyz retainer fees", "document_type": "any", "target_row": 24,
+         "target_sheet": "operating_statement", "confidence": 1.0, "source": "ca_reviewed",
+         "rules_version": "stale", "decided_at": now},
+    ])
+
+    calls = []
+
+    class MockGeminiClient:
+        def generate(self, *args, **kwargs):
+            calls.append(kwargs["prompt"])
+            raise RuntimeError("offline")
+
+    monkeypatch.setattr("app.services.classification.classifier.GeminiClient", MockGeminiClient)
+
+    res = classify_project(str(uuid4()), str(uuid4()), "trading")
+
+    memo_item = res.items[0]
+    assert memo_item.source == "memo"
+    assert memo_item.target_row == 24
+    assert "ca_reviewed" in memo_item.reasoning
+    assert res.classified_by_memo == 1
+    assert "Xyz Retainer" not in "".join(calls)
+
+
+def test_precedent_update_drops_memos_derived_from_it(mock_db):
+    from app.api.v1.endpoints.precedents import PrecedentUpdate, update_precedent
+    from tests.conftest import TEST_FIRM_ID, TEST_USER
+
+    firm_id = str(TEST_FIRM_ID)
+
+    class MemoTable:
+        """Just enough of a table to apply eq-filtered deletes."""
+
+        def __init__(self, rows):
+            self.rows = rows
+            self._filters = []
+
+        def delete(self):
+            self._filters = []
+            return self
+
+        def eq(self, column, value):
+            self._filters.append((column, value))
+            return self
+
+        def execute(self):
+            self.rows[:] = [r for r in self.rows if not all(r.get(c) == v for c, v in self._filters)]
+            return self
+
+    memos = MemoTable([
+        # Fuzzy match on precedent p1, stored under the item's own spelling
+        {"firm_id": firm_id, "term_norm": "salary wages staff", "matched_precedent_id": "p1"},
+        {"firm_id": firm_id, "term_norm": "salaries", "matched_precedent_id": "p1"},
+        {"firm_id": firm_id, "term_norm": "rent paid", "matched_precedent_id": "p2"},
+        {"firm_id": "other-firm", "term_norm": "salaries", "matched_precedent_id": None},
+    ])
+    mock_db._tables["classification_memo"] = memos
+    mock_db.set_table("classification_precedents", data=[{"id": "p1", "source_term": "Salaries"}])
+
+    update_precedent("p1", PrecedentUpdate(target_row=20), TEST_USER)
+
+    assert [(m["firm_id"], m["term_norm"]) for m in memos.rows] == [
+        (firm_id, "rent paid"),
+        ("other-firm", "salaries"),
+    ]
+
+
+def test_memo_lookup_chunks_large_term_lists(mock_db, monkeypatch):
+    from datetime import datetime, timezone
+    from app.services.classification import memo
+    from tests.conftest import MockQueryBuilder
+
+    monkeypatch.setattr(memo, "MEMO_LOOKUP_CHUNK", 200)
+    now = datetime.now(timezone.utc).isoformat()
+    terms = [f"ledger {i:04d}" for i in range(450)]
+
+    class MemoTable(MockQueryBuilder):
+        in_sizes = []
+
+        def in_(self, column, values):
+            MemoTable.in_sizes.append(len(values))
+            self._data = [
+                {"term_norm": t, "document_type": "trial_balance", "target_row": 22, "target_sheet": "operating_statement",
+                 "confidence": 0.9, "source": "ai", "rules_version": memo.rules_version(), "decided_at": now}
+                for t in values
+            ]
+            return self
+
+    mock_db._tables["classification_memo"] = MemoTable()
+
+    hits = memo.lookup_memos("firm", "trading", [(t, "trial_balance") for t in terms])
+
+    assert MemoTable.in_sizes == [200, 200, 50]
+    assert len(hits) == 450
+
+
+def test_memo_confidence_decays_with_age():
+    from app.services.classification.memo import decayed_confidence, MEMO_HALF_LIFE_DAYS
+    from datetime import datetime, timedelta, timezone
+
+    now = datetime.now(timezone.utc)
+    old = (now - timedelta(days=MEMO_HALF_LIFE_DAYS)).isoformat()
+    assert decayed_confidence(0.9, now.isoformat(), now) == pytest.approx(0.9)
+    assert decayed_confidence(0.9, old, now) == pytest.approx(0.45)
+    assert decayed_confidence(0.9, "not-a-date", now) == 0.0
+
+
+def test_items_to_dicts_and_single_pass_summary():
+    from app.services.classification.classifier import items_to_dicts, _summarize
+
+    items = [
+        ClassifiedItem(item_name="Sales", item_amount=10.0, confidence=0.9, source="rule", reasoning="r", needs_review=False, target_row=5),
+        ClassifiedItem(item_name="Misc", item_amount=2.0, confidence=0.3, source="ai", reasoning="g", needs_review=True),
+    ]
+
+    dicts = items_to_dicts(items)
+    assert dicts[0]["item_name"] == "Sales" and dicts[0]["target_row"] == 5
+    assert dicts[1]["target_sheet"] is None
+
+    summary = _summarize(items)
+    assert summary["classified_by_rule"] == 1
+    assert summary["classified_by_ai"] == 1
+    assert summary["needs_review"] == 1
+    assert summary["auto_classified"] == 1
+    assert summary["average_confidence"] == pytest.approx(0.6)
@@ -0,0 +1,99 @@
+"""Tests for the XML-patching CMA writer and its template cache."""
+import io
+import os
+import zipfile
+
+import openpyxl
+import pytest
+
+from app.services.excel import cma_writer
+from app.services.excel.cma_writer import CMAWriter, get_template
+
+
+@pytest.fixture
+def template(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "operating_statement"
+    ws["A5"] = "Sales"
+    ws["E5"] = 0
+    ws["E5"].number_format = "#,##0.00"
+    ws["A12"] = "Gross Profit"
+    ws["E12"] = "=E5-E10"
+    ws["G12"] = "note"
+    bs = wb.create_sheet("balance_sheet")
+    bs["A3"] = "Land"
+    path = tmp_path / "CMA.xlsx"
+    wb.save(path)
+    return str(path)
+
+
+def test_writes_values_and_leaves_other_parts_untouched(template):
+    out = io.BytesIO()
+    CMAWriter(template).write(
+        {"operating_statement": {5: 1500000.0, 10: 900000.0, 300: 7}, "balance_sheet": {"3": 42.5}, "missing": {1: 1}},
+        out,
+    )
+
+    wb = openpyxl.load_workbook(io.BytesIO(out.getvalue()))
+    ops = wb["operating_statement"]
+    assert ops["E5"].value == 1500000.0
+    assert ops["E5"].number_format == "#,##0.00"  # template style kept
+    assert ops["E10"].value == 900000.0
+    assert ops["E12"].value == "=E5-E10"  # untouched formula
+    assert ops["G12"].value == "note"
+    assert ops["E300"].value == 7
+    assert wb["balance_sheet"]["E3"].value == 42.5
+
+    with zipfile.ZipFile(template) as src, zipfile.ZipFile(io.BytesIO(out.getvalue())) as dst:
+        assert dst.read("xl/styles.xml") == src.read("xl/styles.xml")
+        assert b'fullCalcOnLoad="1"' in dst.read("xl/workbook.xml")
+
+
+def test_overwrites_formula_cell_and_writes_to_path(template, tmp_path):
+    out_path = str(tmp_path / "out.xlsx")
+    CMAWriter(template).write({"operating_statement": {12: 600000.0}}, out_path)
+
+    ops = openpyxl.load_workbook(out_path)["operating_statement"]
+    assert ops["E12"].value == 600000.0
+    assert ops["G12"].value == "note"
+
+
+def test_template_parsed_once_per_mtime(template, monkeypatch):
+    first = get_template(template)
+    assert get_template(template) is first
+
+    st = os.stat(template)
+    os.utime(template, (st.st_atime, st.st_mtime + 10))
+    assert get_template(template) is not first
+
+
+def test_template_version_follows_template_contents(template):
+    version = CMAWriter(template).template_version
+
+    wb = openpyxl.load_workbook(template)
+    wb["operating_statement"]["A6"] = "Other income"
+    wb.save(template)
+    st = os.stat(template)
+    os.utime(template, (st.st_atime, st.st_mtime + 10))
+
+    assert CMAWriter(template).template_version != version
+
+
+def test_shared_formula_templates_fall_back_to_openpyxl(template):
+    compiled = get_template(template)
+    compiled.patchable = False
+    try:
+        out = io.BytesIO()
+        CMAWriter(template).write({"operating_statement": {5: 10.0}}, out)
+        assert openpyxl.load_workbook(io.BytesIO(out.getvalue()))["operating_statement"]["E5"].value == 10.0
+    finally:
+        cma_writer._template_cache.clear()
+
+
+def test_patch_sheet_xml_inserts_cells_in_column_order():
+    xml = ('<worksheet><sheetData><row r="2" spans="1:7"><c r="A2"/><c r="G2"><v>1</v></c></row>'
+           '<row r="9"/></sheetData></worksheet>')
+    patched = cma_writer.patch_sheet_xml(xml, {2: 5.0, 4: 1.0, 9: 2.0, 11: 3.0})
+    assert '<row r="2"><c r="A2"/><c r="E2"><v>5.0</v></c><c r="G2"><v>1</v></c></row>' in patched
+    assert patched.index('r="E4"') < patched.index('r="E9"') < patched.index('r="E11"')
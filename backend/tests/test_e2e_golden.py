@@ -1,7 +1,91 @@
 import pytest
 from unittest.mock import MagicMock
 from uuid import uuid4
-from app.services.excel.generator import generate_cma
+from app.services.excel.generator import generate_cma, output_hash
+
+
+def mock_supabase_db(project_id, client_id, generated_files=None, uploads=None):
+    class MockTable:
+        def __init__(self, data):
+            self._table_data = data
+
+        def select(self, *args, **kwargs):
+            return self
+
+        def eq(self, *args, **kwargs):
+            return self
+
+        def neq(self, *args, **kwargs):
+            return self
+
+        def order(self, *args, **kwargs):
+            return self
+
+        def limit(self, *args, **kwargs):
+            return self
+
+        def execute(self):
+            res = MagicMock()
+            res.data = self._table_data
+            return res
+
+        def insert(self, *args, **kwargs):
+            return self
+
+        def update(self, *args, **kwargs):
+            return self
+
+    class MockStorage:
+        class MockBucket:
+            def upload(self, *args, **kwargs):
+                if uploads is not None:
+                    uploads.append(args)
+
+            def create_signed_url(self, *args, **kwargs):
+                return {"signedURL": "mock_url"}
+
+        def from_(self, bucket):
+            return self.MockBucket()
+
+    class DB:
+        def table(self, name):
+            if name == "cma_projects":
+                return MockTable([{
+                    "id": project_id,
+                    "client_id": client_id,
+                    "financial_year": "2024-25",
+                    "status": "extracted",
+                    "classification_data": {
+                        "items": [{
+                            "item_name": "Sales",
+                            "target_row": 5,
+                            "target_sheet": "operating_statement",
+                            "item_amount": 1500000,
+                        }],
+                    },
+                }])
+            if name == "clients":
+                return MockTable([{"name": "Mehta Computers", "entity_type": "trading"}])
+            if name == "generated_files":
+                return MockTable(generated_files or [])
+            return MockTable([])
+
+        storage = MockStorage()
+
+    return DB()
+
+
+class MockWriter:
+    template_version = "mock-template"
+    writes = 0
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+
+    def write(self, data, output):
+        MockWriter.writes += 1
+        output.write(b"mocked bytes")
+        return output
 
 
 class TestE2EGoldenMehta:
@@ -10,81 +94,10 @@ class TestE2EGoldenMehta:
         mock_firm_id = str(uuid4())
         mock_client_id = str(uuid4())
 
-        # Mock Supabase DB
-        def mock_supabase_db():
-            class MockTable:
-                def __init__(self, data):
-                    self._table_data = data
-
-                def select(self, *args, **kwargs):
-                    return self
-
-                def eq(self, *args, **kwargs):
-                    return self
-
-                def neq(self, *args, **kwargs):
-                    return self
-
-                def execute(self):
-                    res = MagicMock()
-                    res.data = self._table_data
-                    return res
-
-                def insert(self, *args, **kwargs):
-                    return self
-
-                def update(self, *args, **kwargs):
-                    return self
-
-            class MockStorage:
-                class MockBucket:
-                    def upload(self, *args, **kwargs):
-                        pass
-
-                    def create_signed_url(self, *args, **kwargs):
-                        return {"signedURL": "mock_url"}
-
-                def from_(self, bucket):
-                    return self.MockBucket()
-
-            class DB:
-                def table(self, name):
-                    if name == "cma_projects":
-                        return MockTable([{
-                            "id": mock_proj_id,
-                            "client_id": mock_client_id,
-                            "financial_year": "2024-25",
-                            "status": "extracted",
-                            "classification_data": {
-                                "items": [{
-                                    "item_name": "Sales",
-                                    "target_row": 5,
-                                    "target_sheet": "operating_statement",
-                                    "item_amount": 1500000,
-                                }],
-                            },
-                        }])
-                    if name == "clients":
-                        return MockTable([{"name": "Mehta Computers", "entity_type": "trading"}])
-                    if name == "generated_files":
-                        return MockTable([])
-                    return MockTable([])
-
-                storage = MockStorage()
-
-            return DB()
-
-        monkeypatch.setattr("app.services.excel.generator.get_supabase", mock_supabase_db)
-
-        class MockWriter:
-            def __init__(self, template_path):
-                self.template_path = template_path
-
-            def write(self, data, output_path):
-                with open(output_path, "wb") as f:
-                    f.write(b"mocked bytes")
-                return output_path
-
+        monkeypatch.setattr(
+            "app.services.excel.generator.get_supabase",
+            lambda: mock_supabase_db(mock_proj_id, mock_client_id),
+        )
         monkeypatch.setattr("app.services.excel.generator.CMAWriter", MockWriter)
         monkeypatch.setattr("app.services.excel.generator._get_template_path", lambda: "/mock/CMA.xlsm")
 
@@ -95,3 +108,47 @@ class TestE2EGoldenMehta:
         assert "MehtaComputers" in res.file_name
         assert res.file_name.endswith(".xlsm")
         assert "2024-25" in res.file_name
+        assert res.version == 1
+        assert res.reused is False
+
+    def test_unchanged_regeneration_reuses_latest_version(self, monkeypatch):
+        from app.services.excel.data_transformer import transform_for_writer
+
+        mock_proj_id = str(uuid4())
+        mock_client_id = str(uuid4())
+        items = [{"item_name": "Sales", "target_row": 5, "target_sheet": "operating_statement", "item_amount": 1500000}]
+        fingerprint = output_hash(transform_for_writer(items, "trading"), "mock-template", "MehtaComputers_2024-25")
+        latest = {
+            "id": "gen-3",
+            "version": 3,
+            "file_name": "CMA_MehtaComputers_2024-25_v3.xlsm",
+            "storage_path": "firm/proj/generated/CMA_MehtaComputers_2024-25_v3.xlsm",
+            "file_size_bytes": 2048,
+            "output_hash": fingerprint,
+        }
+        uploads = []
+
+        monkeypatch.setattr(
+            "app.services.excel.generator.get_supabase",
+            lambda: mock_supabase_db(mock_proj_id, mock_client_id, [latest], uploads),
+        )
+        monkeypatch.setattr("app.services.excel.generator.CMAWriter", MockWriter)
+        monkeypatch.setattr("app.services.excel.generator._get_template_path", lambda: "/mock/CMA.xlsm")
+        MockWriter.writes = 0
+
+        res = generate_cma(mock_proj_id, str(uuid4()), skip_validation=True)
+        assert res.success is True
+        assert res.reused is True
+        assert res.version == 3
+        assert res.generated_file_id == "gen-3"
+        assert res.file_size == 2048
+        assert MockWriter.writes == 0
+        assert uploads == []
+
+        # Any change to the template produces a new version
+        latest["output_hash"] = "stale"
+        res = generate_cma(mock_proj_id, str(uuid4()), skip_validation=True)
+        assert res.reused is False
+        assert res.version == 4
+        assert MockWriter.writes == 1
+        assert len(uploads) == 1
@@ -139,6 +139,39 @@ def test_multi_sheet_excel():
     assert len(result["line_items"]) >= 2
     assert result["metadata"]["source_file"] == "multi.xlsx"
 
+    # The other statement is kept under "documents"; the top-level sheet is not repeated there
+    assert result["document_type"] == "balance_sheet"
+    assert len(result["line_items"]) == 3
+    assert [d["document_type"] for d in result["documents"]] == ["profit_and_loss"]
+    assert len(result["documents"][0]["line_items"]) == 2
+
+
+def test_single_statement_kept_when_notes_sheet_is_larger():
+    wb = openpyxl.Workbook()
+    pl = wb.active
+    pl.title = "P&L"
+    pl.append(["Company XYZ"])
+    pl.append(["Profit and Loss"])
+    pl.append([])
+    pl.append(["Sales", "10,00,000"])
+    pl.append(["Purchases", "5,00,000"])
+
+    notes = wb.create_sheet("Notes")
+    notes.append(["Company XYZ"])
+    notes.append(["Notes to Accounts"])
+    notes.append([])
+    for i in range(1, 6):
+        notes.append([f"Note item {i}", f"{i},000"])
+
+    f = io.BytesIO()
+    wb.save(f)
+    result = parse_excel(f.getvalue(), "notes.xlsx")
+
+    assert result["document_type"] == "other"
+    assert len(result["line_items"]) == 5
+    assert [d["document_type"] for d in result["documents"]] == ["profit_and_loss"]
+    assert len(result["documents"][0]["line_items"]) == 2
+
 
 def test_csv_parser():
     file_bytes = create_dummy_csv()
@@ -219,3 +252,178 @@ def test_merger_logic(mock_db):
 
     merge_and_save_data(project_id, firm_id)
     # If we reach here without error, merge succeeded (mock DB absorbs the writes)
+
+
+def test_vision_extracts_multipage_pdf_per_page(monkeypatch):
+    """Multi-page scans are sent page by page, merged in order and cached per page."""
+    import json
+    from app.services.extraction import vision_extractor
+    from app.services.gemini_client import GeminiResponse
+
+    f = io.BytesIO()
+    c = canvas.Canvas(f)
+    for n in range(3):
+        c.drawString(100, 800, f"Page {n + 1}")
+        c.showPage()
+    c.save()
+    pdf_bytes = f.getvalue()
+
+    calls = []
+
+    class FakeClient:
+        def generate_with_image(self, model, prompt, image_bytes, mime_type, system_instruction=None):
+            page = len(calls)
+            calls.append(image_bytes)
+            text = json.dumps({
+                "document_type": "profit_and_loss",
+                "financial_year": 2024 if page == 0 else None,
+                "line_items": [{"name": f"Item {len(image_bytes)}", "amount": 1}],
+            })
+            return GeminiResponse(text=text, input_tokens=1, output_tokens=1, cost_usd=0.0, latency_ms=1, model=model)
+
+    monkeypatch.setattr(vision_extractor, "GeminiClient", FakeClient)
+    monkeypatch.setattr(vision_extractor, "log_llm_usage", lambda **kw: None)
+    vision_extractor._page_cache.clear()
+
+    data = vision_extractor.extract_with_vision(pdf_bytes, "scan.pdf", "application/pdf", "f1", "p1")
+
+    assert len(calls) == 3
+    assert len(data["line_items"]) == 3
+    assert data["financial_year"] == 2024
+    assert [p["pages"] for p in data["metadata"]["pages"]] == [[1], [2], [3]]
+    assert data["metadata"]["source_file"] == "scan.pdf"
+
+    # Second run is served from the page cache
+    again = vision_extractor.extract_with_vision(pdf_bytes, "scan.pdf", "application/pdf", "f1", "p1")
+    assert len(calls) == 3
+    assert all(p["cached"] for p in again["metadata"]["pages"])
+
+
+def test_image_optimizer_shrinks_and_crops():
+    from PIL import Image, ImageDraw
+    from app.services.extraction.image_optimizer import optimize_image
+
+    # A 300 DPI colour "photo" of a page with the statement printed in the middle
+    img = Image.new("RGB", (2480, 3508), (250, 250, 250))
+    draw = ImageDraw.Draw(img)
+    for y in range(800, 2400, 40):
+        draw.text((600, y), "Sales  15,00,000.00", fill=(10, 10, 10))
+    draw.rectangle((600, 800, 1900, 2400), outline=(0, 0, 0), width=3)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    original = buf.getvalue()
+
+    optimized, mime, stats = optimize_image(original, "image/png", "profit_and_loss")
+
+    assert mime == "image/jpeg"
+    assert stats["optimized"] is True
+    assert len(optimized) < len(original)
+    out = Image.open(io.BytesIO(optimized))
+    assert out.mode == "L"
+    # Blank margins are cropped away
+    assert out.width < 1400 and out.height < 1700
+
+
+def test_image_optimizer_keeps_original_when_unreadable():
+    from app.services.extraction.image_optimizer import optimize_image
+
+    data, mime, stats = optimize_image(b"not an image", "image/png")
+    assert data == b"not an image" and mime == "image/png"
+    assert stats["optimized"] is False
+
+
+def test_merger_uses_fresh_results_in_memory(mock_db):
+    """Files from the current run are merged from memory; only other completed files come from the DB."""
+    from tests.conftest import MockQueryBuilder
+    from app.services.extraction.merger import merge_and_save_data
+
+    class RecordingProjects(MockQueryBuilder):
+        saved = None
+
+        def update(self, payload, *args, **kwargs):
+            RecordingProjects.saved = payload
+            return self
+
+    mock_db.set_table("uploaded_files", data=[{
+        "file_name": "bs.xlsx",
+        "extracted_data": {"document_type": "balance_sheet", "line_items": [{"name": "Cash", "amount": 500}]},
+    }])
+    mock_db._tables["cma_projects"] = RecordingProjects()
+
+    fresh = [{
+        "id": "f-1",
+        "file_name": "pl.xlsx",
+        "extracted_data": {"document_type": "profit_and_loss", "line_items": [{"name": "Sales", "amount": 1000}]},
+    }]
+    merge_and_save_data("p1", "firm1", fresh=fresh)
+
+    merged = RecordingProjects.saved["extracted_data"]
+    assert merged["metadata"]["source_files"] == ["bs.xlsx", "pl.xlsx"]
+    assert merged["profit_and_loss"]["line_items"][0]["name"] == "Sales"
+    assert merged["metadata"]["total_line_items"] == 2
+
+
+def test_extractor_reuses_result_for_identical_upload(mock_db):
+    """A file whose content hash matches an earlier completed extraction is not downloaded or parsed again."""
+    from app.services.extraction.extractor import extract_files
+
+    previous = {
+        "id": "old-file",
+        "content_hash": "abc123",
+        "extracted_data": {"document_type": "profit_and_loss", "line_items": [{"name": "Sales", "amount": 1000}]},
+    }
+    mock_db.set_table("uploaded_files", data=[previous])
+
+    new_file = {"id": "new-file", "file_name": "pl copy.pdf", "file_type": "pdf",
+                "storage_path": "firm/p2/pl.pdf", "content_hash": "abc123"}
+    result = extract_files("p2", "firm1", [new_file])
+
+    assert result.files_succeeded == 1
+    assert result.results[0]["reused"] is True
+    assert result.results[0]["line_items_count"] == 1
+    mock_db.storage.from_.return_value.download.assert_not_called()
+
+
+def test_parsers_accept_local_path(tmp_path):
+    """Parsers and the vision helpers read a shared local copy instead of needing the bytes."""
+    import hashlib
+    from app.services.extraction.utils import source_digest
+    from app.services.extraction.vision_extractor import pdf_page_groups, render_page_group
+
+    pdf_bytes = create_dummy_pdf()
+    pdf_path = tmp_path / "pl.pdf"
+    pdf_path.write_bytes(pdf_bytes)
+    xlsx_path = tmp_path / "pl.xlsx"
+    xlsx_path.write_bytes(create_dummy_excel())
+
+    assert is_digital_pdf(str(pdf_path)) == is_digital_pdf(pdf_bytes)
+    assert parse_pdf(str(pdf_path), "pl.pdf")["line_items"] == parse_pdf(pdf_bytes, "pl.pdf")["line_items"]
+    assert parse_excel(str(xlsx_path), "pl.xlsx")["line_items"]
+    assert source_digest(str(pdf_path)) == hashlib.sha256(pdf_bytes).hexdigest()
+
+    assert pdf_page_groups(str(pdf_path)) == [[1]]
+    assert render_page_group(str(pdf_path), [1]).startswith(b"%PDF")
+
+
+def test_merger_fills_every_statement_from_one_workbook(mock_db):
+    from tests.conftest import MockQueryBuilder
+    from app.services.extraction.merger import merge_and_save_data
+
+    class RecordingProjects(MockQueryBuilder):
+        saved = None
+
+        def update(self, payload, *args, **kwargs):
+            RecordingProjects.saved = payload
+            return self
+
+    mock_db.set_table("uploaded_files", data=[])
+    mock_db._tables["cma_projects"] = RecordingProjects()
+
+    workbook = parse_excel(create_multi_sheet_excel(), "multi.xlsx")
+    merge_and_save_data("p1", "firm1", fresh=[{"id": "f1", "file_name": "multi.xlsx", "extracted_data": workbook}])
+
+    merged = RecordingProjects.saved["extracted_data"]
+    assert len(merged["profit_and_loss"]["line_items"]) == 2
+    assert len(merged["balance_sheet"]["line_items"]) == 3
+    assert merged["metadata"]["total_line_items"] == 5
+    assert merged["metadata"]["source_files"] == ["multi.xlsx"]
@@ -45,13 +45,14 @@ def test_upload_file_too_large(authed_client: TestClient, mock_db):
     proj = make_project_row(project_id=proj_id, status="draft")
     mock_db.set_table("cma_projects", data=[proj])
 
-    big_content = b"x" * (11 * 1024 * 1024)  # 11MB
-    res = authed_client.post(
-        f"/api/v1/projects/{proj_id}/files",
-        files={"file": ("big.xlsx", big_content, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
-    )
+    big_content = b"x" * (3 * 1024 * 1024)  # 3MB against a 2MB limit
+    with patch("app.api.v1.endpoints.files.MAX_FILE_SIZE", 2 * 1024 * 1024):
+        res = authed_client.post(
+            f"/api/v1/projects/{proj_id}/files",
+            files={"file": ("big.xlsx", big_content, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+        )
     assert res.status_code == 413
-    assert "10MB" in res.json()["detail"]
+    assert "2MB" in res.json()["detail"]
 
 
 def test_upload_file_project_not_found(authed_client: TestClient, mock_db):
@@ -140,3 +141,171 @@ def test_download_generated_file_not_found(authed_client: TestClient, mock_db):
 
     res = authed_client.get(f"/api/v1/generated/{uuid4()}/download")
     assert res.status_code == 404
+
+
+def _fake_download_to(contents):
+    def download_to(storage_path, out, digest=None):
+        data = contents[storage_path]
+        if isinstance(data, Exception):
+            raise data
+        for i in range(0, len(data), 4096):
+            out.write(data[i:i + 4096])
+        return len(data)
+    return download_to
+
+
+def test_export_generated_files_streams_latest_versions(authed_client: TestClient, mock_db, monkeypatch):
+    import zipfile
+    from app.services import export
+
+    p1, p2, p3 = "11111111-aaaa", "22222222-bbbb", "33333333-cccc"
+    mock_db.set_rpc("latest_generated_files", data=[
+        {"cma_project_id": p1, "file_name": "CMA_Mehta_2024-25_v2.xlsm", "storage_path": "f/p1/v2", "version": 2},
+        {"cma_project_id": p2, "file_name": "CMA_Shah_2024-25_v1.xlsm", "storage_path": "f/p2/v1", "version": 1},
+        {"cma_project_id": p3, "file_name": "CMA_Shah_2024-25_v1.xlsm", "storage_path": "f/p3/v1", "version": 1},
+    ])
+    contents = {"f/p1/v2": b"mehta v2" * 100000, "f/p2/v1": b"shah p2", "f/p3/v1": b"shah p3"}
+    monkeypatch.setattr(export, "download_to", _fake_download_to(contents))
+
+    res = authed_client.get("/api/v1/generated/export")
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/zip"
+
+    with zipfile.ZipFile(io.BytesIO(res.content)) as zf:
+        assert zf.namelist() == [
+            "11111111_CMA_Mehta_2024-25_v2.xlsm",
+            "22222222_CMA_Shah_2024-25_v1.xlsm",
+            "33333333_CMA_Shah_2024-25_v1.xlsm",
+        ]
+        assert zf.read("11111111_CMA_Mehta_2024-25_v2.xlsm") == contents["f/p1/v2"]
+        assert zf.read("33333333_CMA_Shah_2024-25_v1.xlsm") == b"shah p3"
+
+
+def test_export_archive_names_do_not_depend_on_other_projects(mock_db):
+    from app.services import export
+
+    row = {"cma_project_id": "11111111-aaaa", "file_name": "CMA_Shah_2024-25_v1.xlsm", "storage_path": "f/p1", "version": 1}
+    other = {"cma_project_id": "22222222-bbbb", "file_name": "CMA_Shah_2024-25_v1.xlsm", "storage_path": "f/p2", "version": 1}
+
+    mock_db.set_rpc("latest_generated_files", data=[dict(row)])
+    alone = export.latest_generated_files("firm")
+    mock_db.set_rpc("latest_generated_files", data=[dict(row), dict(other)])
+    together = export.latest_generated_files("firm")
+
+    assert alone[0]["archive_name"] == together[0]["archive_name"] == "11111111_CMA_Shah_2024-25_v1.xlsm"
+
+
+def test_export_generated_files_lists_failed_downloads(authed_client: TestClient, mock_db, monkeypatch):
+    import zipfile
+    from app.services import export
+
+    mock_db.set_rpc("latest_generated_files", data=[
+        {"cma_project_id": "p1", "file_name": "CMA_A_v1.xlsm", "storage_path": "f/a", "version": 1},
+        {"cma_project_id": "p2", "file_name": "CMA_B_v1.xlsm", "storage_path": "f/b", "version": 1},
+    ])
+
+    monkeypatch.setattr(export, "download_to", _fake_download_to({"f/a": b"a", "f/b": RuntimeError("object not found")}))
+
+    res = authed_client.get("/api/v1/generated/export")
+    with zipfile.ZipFile(io.BytesIO(res.content)) as zf:
+        assert zf.namelist() == ["p1_CMA_A_v1.xlsm", "_export_errors.txt"]
+        assert b"p2_CMA_B_v1.xlsm: object not found" in zf.read("_export_errors.txt")
+
+
+def test_export_pages_through_large_portfolios(mock_db, monkeypatch):
+    from app.services import export
+    from tests.conftest import MockQueryBuilder
+
+    monkeypatch.setattr(export, "EXPORT_PAGE_SIZE", 2)
+    projects = [f"{i:08d}-0000" for i in range(5)]
+    calls = []
+
+    def rpc(name, params):
+        calls.append(params["p_after_project_id"])
+        after = params["p_after_project_id"] or ""
+        page = [p for p in projects if p > after][:params["p_limit"]]
+        return MockQueryBuilder(data=[
+            {"cma_project_id": p, "file_name": f"CMA_{p}_v1.xlsm", "storage_path": f"f/{p}", "version": 1} for p in page
+        ])
+
+    monkeypatch.setattr(mock_db, "rpc", rpc)
+
+    files = export.latest_generated_files("firm")
+    assert [f["cma_project_id"] for f in files] == projects
+    assert calls == [None, projects[1], projects[3]]
+
+
+def test_export_falls_back_to_paging_version_rows(mock_db, monkeypatch):
+    from app.services import export
+
+    def missing_rpc(name, params):
+        raise RuntimeError("function latest_generated_files does not exist")
+
+    monkeypatch.setattr(mock_db, "rpc", missing_rpc)
+    mock_db.set_table("generated_files", data=[
+        {"cma_project_id": "p1", "file_name": "CMA_A_v2.xlsm", "storage_path": "f/a2", "version": 2},
+        {"cma_project_id": "p1", "file_name": "CMA_A_v1.xlsm", "storage_path": "f/a1", "version": 1},
+        {"cma_project_id": "p2", "file_name": "CMA_B_v1.xlsm", "storage_path": "f/b1", "version": 1},
+    ])
+
+    files = export.latest_generated_files("firm")
+    assert [f["storage_path"] for f in files] == ["f/a2", "f/b1"]
+
+
+def test_export_generated_files_nothing_to_export(authed_client: TestClient, mock_db):
+    mock_db.set_rpc("latest_generated_files", data=[])
+
+    res = authed_client.get("/api/v1/generated/export")
+    assert res.status_code == 404
+
+
+def test_upload_duplicate_content_reuses_storage(authed_client: TestClient, mock_db):
+    import hashlib
+
+    proj_id = str(uuid4())
+    mock_db.set_table("cma_projects", data=[make_project_row(project_id=proj_id, status="draft")])
+    earlier = {**make_file_row(), "content_hash": hashlib.sha256(b"same bytes").hexdigest()}
+    mock_db.set_table("uploaded_files", data=[earlier])
+    mock_db.set_table("audit_log", data=[{}])
+
+    with patch("app.api.v1.endpoints.files.upload_file") as upload:
+        res = authed_client.post(
+            f"/api/v1/projects/{proj_id}/files",
+            files={"file": ("copy.xlsx", b"same bytes", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+        )
+    assert res.status_code == 201
+    upload.assert_not_called()
+
+
+def test_upload_duplicate_query_fetches_one_narrow_row(authed_client: TestClient, mock_db):
+    import hashlib
+    from tests.conftest import MockQueryBuilder
+
+    proj_id = str(uuid4())
+    mock_db.set_table("cma_projects", data=[make_project_row(project_id=proj_id, status="draft")])
+    mock_db.set_table("audit_log", data=[{}])
+    earlier = {**make_file_row(), "content_hash": hashlib.sha256(b"same bytes").hexdigest(), "cma_project_id": proj_id}
+
+    class UploadedFiles(MockQueryBuilder):
+        selects, limits = [], []
+
+        def select(self, *args, **kwargs):
+            UploadedFiles.selects.append(args[0])
+            return self
+
+        def limit(self, n, *args, **kwargs):
+            UploadedFiles.limits.append(n)
+            return self
+
+    mock_db._tables["uploaded_files"] = UploadedFiles(data=[earlier])
+
+    with patch("app.api.v1.endpoints.files.upload_file") as upload:
+        res = authed_client.post(
+            f"/api/v1/projects/{proj_id}/files",
+            files={"file": ("copy.xlsx", b"same bytes", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+        )
+    assert res.status_code == 201
+    assert res.json()["data"]["id"] == earlier["id"]
+    upload.assert_not_called()
+    assert UploadedFiles.limits == [1]
+    assert "*" not in UploadedFiles.selects[0] and "extracted_data" not in UploadedFiles.selects[0]
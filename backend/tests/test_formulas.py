@@ -0,0 +1,98 @@
+"""Tests for the computed-row formula engine and its use in transformation and validation."""
+import pytest
+
+from app.services.excel.data_transformer import transform_for_writer
+from app.services.excel.formulas import MAX_ROW, Formula, FormulaEngine, get_formula_engine, load_formulas
+from app.services.validation.validator import validate_project
+
+
+def test_dependent_subtotals_evaluate_in_dependency_order():
+    # Declared out of order: total (40) needs the subtotals (20, 30), which need the detail rows
+    engine = FormulaEngine([
+        Formula(sheet="bs", row=40, label="Total", add=[20, 30]),
+        Formula(sheet="bs", row=30, label="Current", add=["21:29"]),
+        Formula(sheet="bs", row=20, label="Fixed", add=["11:19"], subtract=[5]),
+    ])
+    assert engine.computed_rows("bs") == [30, 20, 40]
+
+    result = engine.apply({"bs": {5: 1.0, 11: 10.0, 12: 5.0, 25: 100.0}, "other": {1: 2.0}})
+    assert result["bs"] == {5: 1.0, 11: 10.0, 12: 5.0, 20: 14.0, 25: 100.0, 30: 100.0, 40: 114.0}
+    assert result["other"] == {1: 2.0}
+
+
+def test_skip_if_zero_keeps_reported_value():
+    engine = FormulaEngine([Formula(sheet="s", row=10, label="Subtotal", add=["1:3"], skip_if_zero=True)])
+    assert engine.apply({"s": {10: 42.0}}) == {"s": {10: 42.0}}
+    assert engine.apply({"s": {1: 2.0, 10: 42.0}}) == {"s": {1: 2.0, 10: 2.0}}
+
+
+def test_circular_and_duplicate_formulas_are_rejected():
+    with pytest.raises(ValueError, match="Circular"):
+        FormulaEngine([
+            Formula(sheet="s", row=10, label="A", add=[11]),
+            Formula(sheet="s", row=11, label="B", add=[10]),
+        ])
+    with pytest.raises(ValueError, match="refers to itself"):
+        FormulaEngine([Formula(sheet="s", row=10, label="A", add=["5:10"])])
+    with pytest.raises(ValueError, match="defined twice"):
+        FormulaEngine([Formula(sheet="s", row=10, label="A", add=[1]), Formula(sheet="s", row=10, label="B", add=[2])])
+
+
+def test_rows_outside_the_template_are_rejected():
+    engine = FormulaEngine([Formula(sheet="s", row=10, label="Subtotal", add=["1:3"])])
+    for row in (0, -1, MAX_ROW + 1, 10_000_000):
+        with pytest.raises(ValueError, match="outside"):
+            engine.evaluate_sheet("s", {row: 5.0, 1: 1.0})
+    with pytest.raises(ValueError, match="outside"):
+        FormulaEngine([Formula(sheet="s", row=MAX_ROW + 1, label="Beyond", add=[1])])
+
+
+def test_shipped_config_compiles():
+    formulas = load_formulas()
+    assert {(f.sheet, f.row) for f in formulas} >= {("operating_statement", 12), ("balance_sheet", 15)}
+    assert get_formula_engine().computed_rows("operating_statement")
+
+
+def test_transform_applies_computed_rows():
+    items = [
+        {"target_sheet": "operating_statement", "target_row": 5, "item_amount": 1500000},
+        {"target_sheet": "operating_statement", "target_row": 10, "item_amount": 900000},
+        {"target_sheet": "operating_statement", "target_row": 18, "item_amount": 50000},
+        {"target_sheet": "operating_statement", "target_row": 18, "item_amount": "25000"},
+        {"target_sheet": "operating_statement", "target_row": 20, "item_amount": "n/a"},
+    ]
+    ops = transform_for_writer(items, "trading")["operating_statement"]
+    assert ops[12] == 600000.0
+    assert ops[18] == 75000.0
+    assert ops[25] == 75000.0
+    assert 20 not in ops
+
+
+def test_transform_skips_rows_outside_the_template():
+    items = [
+        {"target_sheet": "operating_statement", "target_row": 5, "item_amount": 1000},
+        {"target_sheet": "operating_statement", "target_row": 10, "item_amount": 400},
+        # -1 would otherwise wrap to the sheet's last row; 10M would allocate an 80MB array
+        {"target_sheet": "operating_statement", "target_row": -1, "item_amount": 999},
+        {"target_sheet": "operating_statement", "target_row": 10_000_000, "item_amount": 999},
+    ]
+    ops = transform_for_writer(items, "trading")["operating_statement"]
+    assert ops == {5: 1000.0, 10: 400.0, 12: 600.0}
+
+
+def test_validator_compares_reported_gross_profit_with_computed_row():
+    data = {"items": [
+        {"item_name": "Sales", "target_sheet": "operating_statement", "target_row": 5, "item_amount": 1000},
+        {"item_name": "Purchases", "target_sheet": "operating_statement", "target_row": 10, "item_amount": 600},
+        {"item_name": "Gross Profit", "target_sheet": "operating_statement", "target_row": 12, "item_amount": 300},
+        {"item_name": "Bad", "target_sheet": "operating_statement", "target_row": 20, "item_amount": "abc"},
+    ]}
+    result = validate_project("p1", data, "trading")
+    checks = {c.rule_id: c for c in result.checks}
+
+    gp = checks["pl_gross_profit"]
+    assert not gp.passed
+    assert gp.expected_value == 400.0
+    assert gp.actual_value == 300.0
+    assert checks["mandatory_sales"].passed
+    assert not checks["data_type_check"].passed
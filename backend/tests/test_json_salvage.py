@@ -0,0 +1,34 @@
+"""Tests for tolerant parsing of truncated / malformed LLM JSON."""
+import pytest
+from app.utils.json_salvage import salvage_json_array, salvage_json_object
+
+
+def test_salvage_complete_array():
+    items, complete = salvage_json_array('[{"a": 1}, {"a": 2}]')
+    assert items == [{"a": 1}, {"a": 2}]
+    assert complete
+
+
+def test_salvage_truncated_array():
+    items, complete = salvage_json_array('[{"a": 1}, {"a": 2}, {"a": "thr')
+    assert items == [{"a": 1}, {"a": 2}]
+    assert not complete
+
+
+def test_salvage_skips_malformed_element():
+    items, complete = salvage_json_array('[{"a": 1}, {"a": oops, "b": "x,}"}, {"a": 3}]')
+    assert items == [{"a": 1}, {"a": 3}]
+    assert not complete
+
+
+def test_salvage_object_keeps_header_and_complete_line_items():
+    text = '{"document_type": "trial_balance", "currency": "INR", "line_items": [{"name": "Sales", "amount": 10}, {"name": "Pur'
+    data, complete = salvage_json_object(text, "line_items")
+    assert not complete
+    assert data["document_type"] == "trial_balance"
+    assert data["line_items"] == [{"name": "Sales", "amount": 10}]
+
+
+def test_salvage_object_without_array_raises():
+    with pytest.raises(ValueError):
+        salvage_json_object('{"document_type": "trial', "line_items")
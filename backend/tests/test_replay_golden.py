@@ -0,0 +1,52 @@
+"""Runs the golden replay harness over the bundled sample cases."""
+import importlib.util
+from pathlib import Path
+
+SCRIPT = Path(__file__).parent.parent / "scripts" / "replay_golden.py"
+
+
+def load_harness():
+    spec = importlib.util.spec_from_file_location("replay_golden", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_replay_golden_dataset():
+    harness = load_harness()
+    cases = harness.load_cases(harness.DEFAULT_DATASET)
+    assert cases
+
+    runs = []
+    for case in cases:
+        runs.extend(harness.replay_case(case, passes=2))
+    report = harness.summarize(runs)
+
+    assert report["projects"] == 2 * len(cases)
+    assert report["accuracy"] >= 0.9
+    assert report["tiers"]["memo"]["hits"] > 0  # second pass is answered from the memo
+    assert report["llm_calls"] >= 1
+    assert report["latency_ms"]["p95"] >= report["latency_ms"]["p50"]
+    for name in ("memo", "rule", "ai"):
+        assert report["tiers"][name]["latency"]["calls"] > 0
+
+
+def test_replay_scores_items_against_their_own_document():
+    harness = load_harness()
+    line = {"name": "Xyz Retainer Receipts", "amount": 100}
+    case = {
+        "name": "same_name_two_documents",
+        "entity_type": "trading",
+        "extracted_data": {
+            "profit_and_loss": {"line_items": [dict(line)]},
+            "trial_balance": {"line_items": [dict(line)]},
+        },
+        # Expected only for the P&L occurrence
+        "expected": [{"item_name": "Xyz Retainer Receipts", "document_type": "profit_and_loss",
+                      "target_row": 22, "target_sheet": "operating_statement"}],
+        "llm_answers": {"Xyz Retainer Receipts": {"target_row": 22, "target_sheet": "operating_statement", "confidence": 0.95}},
+    }
+
+    (run,) = harness.replay_case(case)
+    assert [item["scored"] for item in run["items"]] == [True, False]
+    assert run["items"][0]["correct"]
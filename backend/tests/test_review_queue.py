@@ -0,0 +1,104 @@
+"""Tests for the review queue listing (keyset pagination + status counts)."""
+from uuid import uuid4
+from fastapi.testclient import TestClient
+from tests.conftest import TEST_FIRM_ID, NOW_ISO
+from app.api.v1.endpoints.review import _encode_cursor, _decode_cursor
+
+
+def make_review_row(confidence: float = 0.5, client_name: str = "Mehta Computers") -> dict:
+    return {
+        "id": str(uuid4()),
+        "firm_id": str(TEST_FIRM_ID),
+        "cma_project_id": str(uuid4()),
+        "source_item_name": "Computer Repairs",
+        "source_item_amount": 25000,
+        "confidence": confidence,
+        "status": "pending",
+        "created_at": NOW_ISO,
+        "cma_projects": {"client_id": str(uuid4()), "clients": {"name": client_name}},
+    }
+
+
+def test_cursor_roundtrip():
+    item_id = str(uuid4())
+    assert _decode_cursor(_encode_cursor(0.45, item_id)) == (0.45, item_id)
+    assert _decode_cursor(_encode_cursor(NOW_ISO, item_id)) == (NOW_ISO, item_id)
+
+
+def test_list_review_queue_returns_next_cursor(authed_client: TestClient, mock_db):
+    rows = [make_review_row(0.3), make_review_row(0.4), make_review_row(0.5)]
+    mock_db.set_table("review_queue", data=rows)
+    mock_db.set_rpc("review_queue_status_counts", data=[
+        {"status": "pending", "count": 42},
+        {"status": "resolved", "count": 7},
+    ])
+
+    res = authed_client.get("/api/v1/review-queue?per_page=2")
+    assert res.status_code == 200
+    data = res.json()["data"]
+
+    assert len(data["items"]) == 2
+    assert data["items"][0]["client_name"] == "Mehta Computers"
+    assert data["total"] == 42
+    assert data["summary"] == {"pending": 42, "resolved": 7, "skipped": 0}
+    assert _decode_cursor(data["next_cursor"]) == (0.4, rows[1]["id"])
+
+
+def test_list_review_queue_last_page_has_no_cursor(authed_client: TestClient, mock_db):
+    mock_db.set_table("review_queue", data=[make_review_row(0.3)])
+    mock_db.set_rpc("review_queue_status_counts", data=[{"status": "pending", "count": 1}])
+
+    cursor = _encode_cursor(0.2, str(uuid4()))
+    res = authed_client.get(f"/api/v1/review-queue?per_page=2&cursor={cursor}")
+    assert res.status_code == 200
+    assert res.json()["data"]["next_cursor"] is None
+
+
+def test_list_review_queue_invalid_cursor(authed_client: TestClient, mock_db):
+    res = authed_client.get("/api/v1/review-queue?cursor=not-a-cursor")
+    assert res.status_code == 422
+
+
+def test_crafted_cursors_are_rejected(authed_client: TestClient, mock_db):
+    item_id = str(uuid4())
+    crafted = [
+        _encode_cursor(0.2, f"{item_id}),status.neq.x"),  # id smuggling extra filter terms
+        _encode_cursor('0.2",firm_id.neq."x', item_id),  # quote breakout in the sort value
+        _encode_cursor({"a": 1}, item_id),
+        _encode_cursor(True, item_id),
+        _encode_cursor(NOW_ISO, item_id),  # timestamp cursor on the confidence sort
+    ]
+    for cursor in crafted:
+        res = authed_client.get(f"/api/v1/review-queue?cursor={cursor}")
+        assert res.status_code == 422, cursor
+
+    res = authed_client.get(f"/api/v1/review-queue?sort_by=created_at&cursor={_encode_cursor(0.2, item_id)}")
+    assert res.status_code == 422
+
+
+def test_null_confidence_rows_page_after_scored_ones(authed_client: TestClient, mock_db):
+    from tests.conftest import MockQueryBuilder
+
+    filters = []
+
+    class RecordingQuery(MockQueryBuilder):
+        def or_(self, expr, *args, **kwargs):
+            filters.append(expr)
+            return self
+
+    last = make_review_row()
+    last["confidence"] = None
+    mock_db._tables["review_queue"] = RecordingQuery(data=[make_review_row(0.9), last, make_review_row()])
+    mock_db.set_rpc("review_queue_status_counts", data=[{"status": "pending", "count": 3}])
+
+    res = authed_client.get("/api/v1/review-queue?per_page=2")
+    assert res.status_code == 200
+    next_cursor = res.json()["data"]["next_cursor"]
+    assert _decode_cursor(next_cursor) == (None, last["id"])
+
+    res = authed_client.get(f"/api/v1/review-queue?per_page=2&cursor={next_cursor}")
+    assert res.status_code == 200
+    assert filters[-1] == f"and(confidence.is.null,id.gt.{last['id']})"
+
+    authed_client.get(f"/api/v1/review-queue?per_page=2&cursor={_encode_cursor(0.5, last['id'])}")
+    assert filters[-1].endswith(",confidence.is.null")
@@ -49,6 +49,39 @@ def test_get_signed_url_object_response():
     assert url == "https://example.com/signed-obj"
 
 
+def test_download_to_streams_signed_url_in_chunks(monkeypatch):
+    import hashlib
+    import io
+    import httpx
+    import pytest
+    from app.services import storage
+
+    body = b"x" * (3 * storage.DOWNLOAD_CHUNK_SIZE + 10)
+    client = httpx.Client(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, stream=httpx.ByteStream(body))
+        if request.url.path == "/signed/file.xlsm" else httpx.Response(404)
+    ))
+    monkeypatch.setattr(storage, "get_signed_url", lambda path, expires_in=3600: f"https://storage.test/signed/{path}")
+    monkeypatch.setattr(storage.httpx, "stream", lambda method, url, **kw: client.stream(method, url))
+
+    class Recorder(io.BytesIO):
+        writes = []
+
+        def write(self, data):
+            Recorder.writes.append(len(data))
+            return super().write(data)
+
+    out = Recorder()
+    digest = hashlib.sha256()
+    assert storage.download_to("file.xlsm", out, digest) == len(body)
+    assert out.getvalue() == body
+    assert digest.hexdigest() == hashlib.sha256(body).hexdigest()
+    assert max(Recorder.writes) <= storage.DOWNLOAD_CHUNK_SIZE
+
+    with pytest.raises(httpx.HTTPStatusError):
+        storage.download_to("missing.xlsm", io.BytesIO())
+
+
 def test_delete_file_calls_remove():
     mock_db = MagicMock()
     with patch("app.services.storage.get_supabase", return_value=mock_db):
@@ -57,3 +90,192 @@ def test_delete_file_calls_remove():
         delete_file("firm/proj/file.xlsx")
 
     mock_db.storage.from_("cma-files").remove.assert_called_once_with(["firm/proj/file.xlsx"])
+
+
+def _multipart_request(chunks, boundary="cmaboundary"):
+    from starlette.requests import Request
+
+    received = []
+    messages = [{"type": "http.request", "body": c, "more_body": True} for c in chunks]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        msg = messages.pop(0)
+        received.append(msg["body"])
+        return msg
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={boundary}".encode())],
+    }
+    return Request(scope, receive), received
+
+
+def _multipart_body(payload, boundary="cmaboundary", filename="tb.xlsx"):
+    return (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"document_type\"\r\n\r\nbalance_sheet\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: application/vnd.ms-excel\r\n\r\n"
+    ).encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+
+
+def test_receive_upload_streams_hashes_and_enforces_limit():
+    import asyncio
+    import hashlib
+    import os
+    import pytest
+    from app.services.storage import UploadTooLarge, receive_upload
+
+    payload = b"ledger" * 500_000  # ~3MB, spans many chunks
+    body = _multipart_body(payload)
+    chunks = [body[i:i + 64 * 1024] for i in range(0, len(body), 64 * 1024)]
+
+    request, _ = _multipart_request(chunks)
+    upload = asyncio.run(receive_upload(request, max_bytes=4 * 1024 * 1024))
+    try:
+        assert upload.size == len(payload)
+        assert upload.content_hash == hashlib.sha256(payload).hexdigest()
+        assert upload.filename == "tb.xlsx"
+        assert upload.content_type == "application/vnd.ms-excel"
+        assert upload.fields == {"document_type": "balance_sheet"}
+        with open(upload.path, "rb") as f:
+            assert f.read() == payload
+    finally:
+        os.unlink(upload.path)
+
+    # No Content-Length: the limit still cuts the upload off mid-stream
+    request, received = _multipart_request(chunks)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(receive_upload(request, max_bytes=1024 * 1024))
+    assert len(received) < len(chunks) // 2
+
+
+def test_receive_upload_rejects_file_type_before_reading_the_body():
+    import asyncio
+    import glob
+    import pytest
+    import tempfile
+    from app.services.storage import UnsupportedFileType, receive_upload
+
+    body = _multipart_body(b"MZ" * 500_000, filename="payload.exe")
+    chunks = [body[i:i + 64 * 1024] for i in range(0, len(body), 64 * 1024)]
+    leftovers = set(glob.glob(f"{tempfile.gettempdir()}/cma-upload-*"))
+
+    request, received = _multipart_request(chunks)
+    with pytest.raises(UnsupportedFileType, match="'.exe' not supported"):
+        asyncio.run(receive_upload(request, max_bytes=4 * 1024 * 1024, allowed_extensions={"xlsx", "pdf"}))
+    assert len(received) == 1
+    assert set(glob.glob(f"{tempfile.gettempdir()}/cma-upload-*")) == leftovers
+
+
+def test_upload_file_from_path_closes_its_handle(tmp_path):
+    local = tmp_path / "tb.xlsx"
+    local.write_bytes(b"ledger")
+    handles = []
+    mock_db = MagicMock()
+    mock_db.storage.from_("cma-files").upload.side_effect = lambda file, **kw: handles.append(file)
+
+    with patch("app.services.storage.get_supabase", return_value=mock_db):
+        from app.services.storage import upload_file
+
+        upload_file("firm", "proj", "tb.xlsx", file_path=str(local))
+
+    assert handles[0].name == str(local)
+    assert handles[0].closed
+
+
+def _fake_download_to(blobs, calls):
+    def download_to(storage_path, out, digest=None):
+        calls.append(storage_path)
+        data = blobs(storage_path) if callable(blobs) else blobs[storage_path]
+        for i in range(0, len(data), 256):
+            out.write(data[i:i + 256])
+            if digest is not None:
+                digest.update(data[i:i + 256])
+        return len(data)
+    return download_to
+
+
+def test_cached_download_hits_disk_and_evicts(tmp_path, monkeypatch):
+    import hashlib
+    import os
+    from app.services import storage_cache
+
+    monkeypatch.setattr(storage_cache, "STORAGE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(storage_cache, "STORAGE_CACHE_MAX_BYTES", 1500)
+
+    blobs = {"a.pdf": b"a" * 1000, "b.pdf": b"b" * 1000}
+    calls = []
+    monkeypatch.setattr(storage_cache, "download_to", _fake_download_to(blobs, calls))
+    entry_a = storage_cache._cache_path("a.pdf", hashlib.sha256(blobs["a.pdf"]).hexdigest())
+
+    with storage_cache.cached_download("a.pdf", hashlib.sha256(blobs["a.pdf"]).hexdigest()) as first:
+        with open(first, "rb") as f:
+            assert f.read() == blobs["a.pdf"]
+    with storage_cache.cached_download("a.pdf", hashlib.sha256(blobs["a.pdf"]).hexdigest()) as again:
+        assert os.path.samefile(again, entry_a)
+    assert calls == ["a.pdf"]
+    assert not os.path.exists(first)  # pins are released on exit
+
+    # Over budget: the older entry is evicted, the new one kept
+    os.utime(entry_a, (1, 1))
+    with storage_cache.cached_download("b.pdf") as second:
+        assert os.path.exists(second)
+    assert not os.path.exists(entry_a)
+
+
+def test_cached_download_survives_concurrent_eviction(tmp_path, monkeypatch):
+    import os
+    from app.services import storage_cache
+
+    monkeypatch.setattr(storage_cache, "STORAGE_CACHE_DIR", str(tmp_path))
+    calls = []
+    monkeypatch.setattr(storage_cache, "download_to", _fake_download_to(lambda path: path.encode() * 100, calls))
+
+    with storage_cache.cached_download("a.pdf") as pinned:
+        # Another extraction evicts everything while this one is still parsing
+        storage_cache._evict(0, keep="")
+        assert not os.path.exists(storage_cache._cache_path("a.pdf", None))
+        with open(pinned, "rb") as f:
+            assert f.read() == b"a.pdf" * 100
+
+    # Entry evicted between lookup and open: fetched again instead of failing
+    with storage_cache.cached_download("a.pdf") as pinned:
+        assert os.path.exists(pinned)
+    assert len(calls) == 2
+
+
+def test_cached_download_hash_mismatch_is_cached_under_requested_key(tmp_path, monkeypatch):
+    import os
+    from app.services import storage_cache
+
+    monkeypatch.setattr(storage_cache, "STORAGE_CACHE_DIR", str(tmp_path))
+    calls = []
+    monkeypatch.setattr(storage_cache, "download_to", _fake_download_to({"a.pdf": b"replaced"}, calls))
+
+    for _ in range(3):
+        with storage_cache.cached_download("a.pdf", "0" * 64) as pinned:
+            with open(pinned, "rb") as f:
+                assert f.read() == b"replaced"
+    assert calls == ["a.pdf"]
+    assert os.path.exists(storage_cache._cache_path("a.pdf", "0" * 64))
+
+
+def test_sweep_stale_removes_abandoned_pins_and_partials(tmp_path, monkeypatch):
+    import os
+    from app.services import storage_cache
+
+    monkeypatch.setattr(storage_cache, "STORAGE_CACHE_DIR", str(tmp_path))
+    pinned = tmp_path / "pinned"
+    pinned.mkdir()
+    old_pin, old_part, new_pin, entry = pinned / "old", tmp_path / "x.part", pinned / "new", tmp_path / "entry"
+    for path in (old_pin, old_part, new_pin, entry):
+        path.write_bytes(b"data")
+    for path in (old_pin, old_part, entry):
+        os.utime(path, (1, 1))
+
+    assert storage_cache.sweep_stale() == 2
+    assert not old_pin.exists() and not old_part.exists()
+    assert new_pin.exists()  # may belong to another live worker
+    assert entry.exists()  # cache entries are left to eviction
@@ -224,6 +224,7 @@ export interface BulkResolvePayload {
 export interface ReviewListParams {
     project_id?: string;
     status?: ReviewStatus;
+    cursor?: string;
     page?: number;
     per_page?: number;
 }
@@ -233,6 +234,7 @@ export interface ReviewListResponse {
     total: number;
     page: number;
     per_page: number;
+    next_cursor?: string | null;
 }
 
 // ============================================================================